@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
+    'policy_tracker.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,6 +85,9 @@ DATABASES = {
     }
 }
 
+# Builds the test database from the models; see CYBERWHIZ/test_runner.py.
+TEST_RUNNER = 'CYBERWHIZ.test_runner.ModelSchemaTestRunner'
+
 # ============================================================
 # PASSWORD VALIDATION
 # ============================================================
@@ -134,3 +138,75 @@ CORS_ALLOWED_ORIGINS = config(
     default='http://localhost:8080,http://127.0.0.1:9000,http://localhost:5173',
     cast=Csv()
 )
+
+# ============================================================
+# CACHE
+# ============================================================
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='policy-tracker'),
+        'TIMEOUT': config('CACHE_TIMEOUT', default=86400, cast=int),
+    },
+    # AI title/version answers must survive restarts, so this one defaults to disk.
+    'ai_extraction': {
+        'BACKEND': config('AI_EXTRACTION_CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('AI_EXTRACTION_CACHE_LOCATION', default=str(BASE_DIR / '.cache' / 'ai_extraction')),
+        'OPTIONS': {'MAX_ENTRIES': config('AI_EXTRACTION_CACHE_MAX_ENTRIES', default=100000, cast=int)},
+    },
+}
+
+# ============================================================
+# QUERY BUDGETS
+# ============================================================
+
+# Per-route ceilings checked by RequestMetricsMiddleware; a request over budget is logged
+# with its query count, DB time and slowest statement. EndpointQueryBudgetTests runs these
+# endpoints against a real database under assert_query_budget(), so a regression fails the suite.
+QUERY_BUDGETS = {
+    'default': {
+        'queries': config('QUERY_BUDGET_DEFAULT', default=20, cast=int),
+        'db_ms': config('QUERY_BUDGET_DEFAULT_DB_MS', default=500, cast=float),
+    },
+    'policy/initialise': {'queries': 6, 'db_ms': 200},
+    # create-initialised and update index the new head inside the request's
+    # transaction, so their budgets include the search index write.
+    'policy/create-initialised': {'queries': 11, 'db_ms': 250},
+    'policy/update': {'queries': 17, 'db_ms': 300},
+    'policy/data': {'queries': 4, 'db_ms': 250},
+    'policy/download': {'queries': 5, 'db_ms': 250},
+}
+
+# ============================================================
+# LOGGING
+# ============================================================
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sampled_debug': {
+            '()': 'policy_tracker.utils.log.SampledDebugFilter',
+            'rate': config('LOG_DEBUG_SAMPLE_RATE', default=0.01, cast=float),
+        },
+    },
+    'formatters': {
+        'structured': {'()': 'policy_tracker.utils.log.StructuredFormatter'},
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': config('LOG_FORMAT', default='structured'),
+            'filters': ['sampled_debug'],
+        },
+    },
+    'loggers': {
+        'policy_tracker': {
+            'handlers': ['console'],
+            'level': config('LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,25 @@
+"""
+Test runner for CYBERWHIZ.
+
+policy_tracker's tables belong to the main application and its migrations only patch them,
+so the test database is built straight from the models instead.
+"""
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class ModelSchemaTestRunner(DiscoverRunner):
+    """DiscoverRunner that creates policy_tracker's test tables from its models, not its migrations."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._migration_modules = override_settings(
+            MIGRATION_MODULES={**getattr(settings, 'MIGRATION_MODULES', {}), 'policy_tracker': None},
+        )
+        self._migration_modules.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._migration_modules.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,244 @@
+"""
+Benchmarks for the diff, reconstruction and PDF hot paths over synthetic policy histories.
+
+    python -m policy_tracker.benchmarks.hot_paths [--profile quick|full] [--db] [--output run.json]
+    python -m policy_tracker.benchmarks.hot_paths --compare baseline.json run.json [--threshold 0.10]
+
+Each case is a history of N versions evolved from a synthetic policy of a given size, either
+pretty-printed (one element per line) or minified (the whole document on one line, so every
+edit rewrites it). Pure benchmarks time compute_html_diff, apply_diff, a full replay from ""
+and xhtml2pdf rendering of the head. With --db the history is also written to the configured
+database inside a transaction that is rolled back, and get_policy_version_html_op and
+reconstruct_policy_html_at_version are timed against it.
+
+--log-level sets the policy_tracker logger level for the run (default INFO, as in production);
+comparing an INFO run with a DEBUG run shows what diagnostics cost on the replay path.
+
+Results are JSON. --compare exits 1 and lists every metric whose median got slower than the
+baseline by more than --threshold (and by more than --noise-floor seconds).
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from ..utils.diff_utils import compute_html_diff, apply_diff
+from .html_to_text import synthetic_policy_html
+
+PROFILES = {
+    "quick": {"versions": (10, 100), "sizes_kb": (5, 100), "repeat": 5},
+    "full": {"versions": (10, 100, 1000), "sizes_kb": (5, 100, 2048), "repeat": 5},
+}
+EDIT_WORDS = "revised updated clarified removed approved superseded".split()
+
+
+def evolve_html(rng, html, pretty):
+    """One plausible editorial change: edit, insert or delete a few lines (or words when minified)."""
+    if not pretty:
+        words = html.split(" ")
+        for _ in range(rng.randint(1, 4)):
+            words[rng.randrange(len(words))] = rng.choice(EDIT_WORDS)
+        return " ".join(words)
+    lines = html.split("\n")
+    for _ in range(rng.randint(1, 4)):
+        roll = rng.random()
+        position = rng.randrange(1, max(len(lines) - 1, 2))
+        if roll < 0.5:
+            lines[position] = f"    <p>{' '.join(rng.choice(EDIT_WORDS) for _ in range(12))}.</p>"
+        elif roll < 0.8:
+            lines.insert(position, f"    <p>{rng.choice(EDIT_WORDS)} clause {position}.</p>")
+        elif len(lines) > 3:
+            del lines[position]
+    return "\n".join(lines)
+
+
+def build_history(versions, size_kb, pretty, seed=0):
+    """Return (diffs, head_html, sample_pairs): the chain from "" plus a few (old, new) pairs to diff."""
+    rng = random.Random(seed)
+    html = synthetic_policy_html(size_kb * 1024, pretty=pretty, seed=seed)
+    diffs = [compute_html_diff("", html)]
+    sample_every = max(versions // 5, 1)
+    sample_pairs = []
+    for index in range(1, versions):
+        new_html = evolve_html(rng, html, pretty)
+        diffs.append(compute_html_diff(html, new_html))
+        if index % sample_every == 0 and len(sample_pairs) < 5:
+            sample_pairs.append((html, new_html))
+        html = new_html
+    return diffs, html, sample_pairs or [(html, evolve_html(rng, html, pretty))]
+
+
+def time_call(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return {"seconds": statistics.median(timings), "min": min(timings), "runs": repeat}
+
+
+def replay(diffs):
+    html = ""
+    for diff in diffs:
+        html = apply_diff(html, diff)
+    return html
+
+
+def pure_benchmarks(case, diffs, head_html, sample_pairs, repeat, pdf_max_kb):
+    results = []
+
+    def record(metric, timing, **extra):
+        results.append({"case": case, "metric": metric, **timing, **extra})
+
+    if replay(diffs) != head_html:
+        raise AssertionError(f"{case}: replaying the chain does not reproduce the head")
+
+    record("compute_html_diff", time_call(lambda: [compute_html_diff(old, new) for old, new in sample_pairs], repeat),
+           per_call=len(sample_pairs))
+    inputs = [""]
+    for diff in diffs[:-1]:
+        inputs.append(apply_diff(inputs[-1], diff))
+    step_pairs = list(zip(inputs, diffs))[-min(len(diffs), 20):]
+    inputs = None
+    record("apply_diff", time_call(lambda: [apply_diff(html, diff) for html, diff in step_pairs], repeat),
+           per_call=len(step_pairs))
+    record("full_replay", time_call(lambda: replay(diffs), repeat))
+
+    if len(head_html) <= pdf_max_kb * 1024:
+        from ..services.view_helpers import render_pdf_from_html
+        record("xhtml2pdf", time_call(lambda: render_pdf_from_html(head_html), max(repeat // 2, 1)))
+    return results
+
+
+def db_benchmarks(case, diffs, head_html, repeat):
+    """Seed the history into the configured database, time the readers, then roll everything back."""
+    from django.db import connection, transaction
+    from ..models import Organization, OrgPolicy, PolicyVersion
+    from ..services.policy_service import PolicyVersionService
+    from ..services.view_operations import get_policy_version_html_op
+
+    results = []
+    with transaction.atomic():
+        organization = Organization.objects.create(name=f"benchmark-{case}-{time.time_ns()}")
+        org_policy = OrgPolicy.objects.create(
+            organization=organization, title=f"Benchmark {case}", template=head_html, workforce_assignments="{}",
+        )
+        # Like create_or_update_policy_with_version, the first version carries its own HTML as a checkpoint.
+        base_html = apply_diff("", diffs[0])
+        rows = PolicyVersion.objects.bulk_create([
+            PolicyVersion(org_policy_id=org_policy.id, version=f"V{index + 1}", diff_data=diff,
+                          checkpoint_template=base_html if index == 0 else None)
+            for index, diff in enumerate(diffs)
+        ])
+        # auto_now_add stamps every row alike; readers order by created_at, so spread them out.
+        base_time = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "UPDATE policy_versions SET created_at = %s WHERE id = %s",
+                [(base_time + timedelta(seconds=index), row.id) for index, row in enumerate(rows)],
+            )
+        head_version = f"V{len(diffs)}"
+        body = json.dumps({"org_policy_id": str(org_policy.id)}).encode("utf-8")
+
+        response = get_policy_version_html_op(body)
+        if json.loads(response.content).get("html") != head_html:
+            raise AssertionError(f"{case}: get_policy_version_html_op did not return the head")
+        results.append({"case": case, "metric": "get_policy_version_html_op",
+                        **time_call(lambda: get_policy_version_html_op(body), repeat)})
+        results.append({"case": case, "metric": "reconstruct_policy_html_at_version",
+                        **time_call(lambda: PolicyVersionService.reconstruct_policy_html_at_version(org_policy.id, head_version), repeat)})
+        transaction.set_rollback(True)
+    return results
+
+
+def run(profile="quick", use_db=False, pdf_max_kb=256, max_history_mb=512, seed=0, log_level="INFO"):
+    settings = PROFILES[profile]
+    logging.getLogger("policy_tracker").setLevel(log_level)
+    results = []
+    for versions in settings["versions"]:
+        for size_kb in settings["sizes_kb"]:
+            if versions * size_kb > max_history_mb * 1024:
+                continue
+            for pretty in (True, False):
+                case = f"{'pretty' if pretty else 'minified'}_{size_kb}kb_{versions}v"
+                diffs, head_html, sample_pairs = build_history(versions, size_kb, pretty, seed)
+                results.extend(pure_benchmarks(case, diffs, head_html, sample_pairs, settings["repeat"], pdf_max_kb))
+                if use_db:
+                    results.extend(db_benchmarks(case, diffs, head_html, settings["repeat"]))
+                print(f"{case}: done", file=sys.stderr)
+    return {
+        "meta": {
+            "profile": profile,
+            "database": use_db,
+            "seed": seed,
+            "log_level": log_level,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=0.10, noise_floor=0.001):
+    """Return one row per metric present in both runs; rows with "regression": True got slower."""
+    baseline_index = {(row["case"], row["metric"]): row for row in baseline["results"]}
+    rows = []
+    for row in current["results"]:
+        previous = baseline_index.get((row["case"], row["metric"]))
+        if not previous:
+            continue
+        ratio = row["seconds"] / previous["seconds"] if previous["seconds"] else float("inf")
+        rows.append({
+            "case": row["case"],
+            "metric": row["metric"],
+            "baseline_seconds": previous["seconds"],
+            "current_seconds": row["seconds"],
+            "ratio": ratio,
+            "regression": ratio > 1 + threshold and row["seconds"] - previous["seconds"] > noise_floor,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--db", action="store_true", help="Also benchmark the database-backed readers.")
+    parser.add_argument("--pdf-max-kb", type=int, default=256, help="Skip xhtml2pdf for heads larger than this.")
+    parser.add_argument("--max-history-mb", type=int, default=512, help="Skip cases whose versions x size exceeds this.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING"])
+    parser.add_argument("--output", help="Write results JSON here instead of stdout.")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"))
+    parser.add_argument("--threshold", type=float, default=0.10)
+    parser.add_argument("--noise-floor", type=float, default=0.001)
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as baseline_file, open(args.compare[1]) as current_file:
+            rows = compare(json.load(baseline_file), json.load(current_file), args.threshold, args.noise_floor)
+        for row in rows:
+            flag = "REGRESSION" if row["regression"] else ""
+            print(f"{row['case']:<24} {row['metric']:<36} {row['baseline_seconds']:10.4f}s {row['current_seconds']:10.4f}s "
+                  f"{row['ratio']:6.2f}x {flag}")
+        sys.exit(1 if any(row["regression"] for row in rows) else 0)
+
+    if args.db:
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "CYBERWHIZ.settings")
+        import django
+        django.setup()
+    report = run(args.profile, args.db, args.pdf_max_kb, args.max_history_mb, args.seed, args.log_level)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
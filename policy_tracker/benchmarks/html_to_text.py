@@ -0,0 +1,97 @@
+"""
+Throughput benchmark for PDFProcessor.html_to_text.
+
+    python -m policy_tracker.benchmarks.html_to_text [--size-kb 512] [--repeat 7]
+
+Compares the original thirteen-pass implementation (kept here as the reference) with the
+precompiled html_to_text and the chunked iter_html_to_text, and checks that all three agree.
+"""
+import argparse
+import random
+import re
+import timeit
+from ..utils.pdf_processor import PDFProcessor
+
+
+def reference_html_to_text(html_content):
+    if not html_content:
+        return ""
+    html_content = re.sub(r'<script[^>]*>.*?</script>', '', html_content, flags=re.DOTALL)
+    html_content = re.sub(r'<style[^>]*>.*?</style>', '', html_content, flags=re.DOTALL)
+    html_content = re.sub(r'<br\s*/?>', '\n', html_content, flags=re.IGNORECASE)
+    html_content = re.sub(r'<p[^>]*>', '\n\n', html_content, flags=re.IGNORECASE)
+    html_content = re.sub(r'</p>', '\n\n', html_content, flags=re.IGNORECASE)
+    html_content = re.sub(r'<h[1-6][^>]*>', '\n\n', html_content, flags=re.IGNORECASE)
+    html_content = re.sub(r'</h[1-6]>', '\n\n', html_content, flags=re.IGNORECASE)
+    html_content = re.sub(r'<li[^>]*>', '\n• ', html_content, flags=re.IGNORECASE)
+    html_content = re.sub(r'</li>', '', html_content, flags=re.IGNORECASE)
+    html_content = re.sub(r'<[^>]+>', '', html_content)
+    html_content = re.sub(r'\n\s*\n', '\n\n', html_content)
+    html_content = re.sub(r'[ \t]+', ' ', html_content)
+    return html_content.strip()
+
+
+def synthetic_policy_html(size_bytes, pretty=True, seed=0):
+    rng = random.Random(seed)
+    indent = "    " if pretty else ""
+    newline = "\n" if pretty else ""
+    words = ("policy access control employee data retention review audit incident "
+             "security vendor approval classification training owner exception").split()
+    parts = [f"<!DOCTYPE html><html><head><style>body {{ font-family: Arial; }}</style></head><body>{newline}"]
+    size = len(parts[0])
+    section = 0
+    while size < size_bytes:
+        section += 1
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(12, 30)))
+        block = rng.choice([
+            f"{indent}<h2>Section {section}</h2>{newline}{indent}<p class=\"body\">{sentence}.</p>{newline}",
+            f"{indent}<ul>{newline}{indent}{indent}<li>{sentence}</li>{newline}{indent}{indent}<li><strong>{section}</strong> {sentence}</li>{newline}{indent}</ul>{newline}",
+            f"{indent}<table>{newline}{indent}{indent}<tr><td>{section}</td><td>{sentence}</td></tr>{newline}{indent}</table>{newline}",
+            f"{indent}<p>{sentence}<br/>{sentence}</p>{newline}",
+        ])
+        parts.append(block)
+        size += len(block)
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def chunked(text, chunk_size):
+    for start in range(0, len(text), chunk_size):
+        yield text[start:start + chunk_size]
+
+
+def run(size_kb=512, repeat=7, chunk_kb=64):
+    results = []
+    for pretty in (True, False):
+        html = synthetic_policy_html(size_kb * 1024, pretty=pretty)
+        expected = reference_html_to_text(html)
+        candidates = {
+            "reference_multipass": lambda: reference_html_to_text(html),
+            "html_to_text": lambda: PDFProcessor.html_to_text(html),
+            "iter_html_to_text": lambda: "".join(PDFProcessor.iter_html_to_text(chunked(html, chunk_kb * 1024))),
+        }
+        for name, func in candidates.items():
+            if func() != expected:
+                raise AssertionError(f"{name} output differs from the reference implementation")
+            best = min(timeit.repeat(func, number=1, repeat=repeat))
+            results.append({
+                "case": f"{'pretty' if pretty else 'minified'}_{size_kb}kb",
+                "implementation": name,
+                "seconds": best,
+                "mb_per_s": len(html.encode('utf-8')) / best / 1_000_000,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-kb", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--chunk-kb", type=int, default=64)
+    args = parser.parse_args()
+    for result in run(args.size_kb, args.repeat, args.chunk_kb):
+        print(f"{result['case']:<20} {result['implementation']:<22} {result['mb_per_s']:8.2f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Local stand-in for the AI_CHAT_URL service.
+
+    python -m policy_tracker.benchmarks.llm_stub [--port 8765] [--latency 2.0] [--error-rate 0.05]
+
+Answers {"query": ...} POSTs the way the real service does: {"response": "<json>"} for
+title/version extraction prompts and {"response": "<html>"} for generation prompts. With
+"stream": true in the payload the HTML is sent as newline-delimited {"response", "done"}
+objects, one every --chunk-delay seconds. --latency is the delay before the first byte and
+--error-rate the fraction of requests answered with HTTP 500.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_POLICY_HTML = (
+    "<!DOCTYPE html><html><head><title>Policy</title></head><body>"
+    "<h1>Information Security Policy</h1>"
+    "<h2>Purpose</h2><p>This policy sets out how the organization protects information assets "
+    "and the responsibilities every employee and contractor has in doing so.</p>"
+    "<h2>Scope</h2><p>It applies to all systems, data and people that store, process or transmit "
+    "organizational information, wherever that work takes place.</p>"
+    "<table><tr><th>Owner</th><th>Review</th></tr><tr><td>CISO</td><td>Annual</td></tr></table>"
+    "</body></html>"
+)
+
+
+class StubLLMServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, chunk_delay=0.0, chunk_size=24,
+                 response_html=STUB_POLICY_HTML, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.response_html = response_html
+        self.requests_served = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/chat"
+
+    def _should_fail(self):
+        with self._lock:
+            self.requests_served += 1
+            return self._random.random() < self.error_rate
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                time.sleep(stub.latency)
+                if stub._should_fail():
+                    self._send_json(500, {"error": "stub failure"})
+                    return
+                query = payload.get("query", "")
+                if "extract the policy title" in query:
+                    answer = json.dumps({"title": "Information Security Policy", "version": "V1"})
+                else:
+                    answer = stub.response_html
+                if payload.get("stream"):
+                    self._send_stream(answer)
+                else:
+                    self._send_json(200, {"response": answer})
+
+            def _send_json(self, status, body):
+                encoded = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def _send_stream(self, answer):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                pieces = [answer[i:i + stub.chunk_size] for i in range(0, len(answer), stub.chunk_size)]
+                for piece in pieces:
+                    self._write_chunk(json.dumps({"response": piece, "done": False}) + "\n")
+                    time.sleep(stub.chunk_delay)
+                self._write_chunk(json.dumps({"response": "", "done": True}) + "\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, text):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--chunk-delay", type=float, default=0.05)
+    args = parser.parse_args()
+    server = StubLLMServer(args.host, args.port, args.latency, args.error_rate, args.chunk_delay)
+    print(f"AI_CHAT_URL={server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+HTTP load test for the five original policy endpoints against a local AI_CHAT_URL stand-in.
+
+    python -m policy_tracker.benchmarks.load_test [--concurrency 16] [--duration 60]
+        [--mix initialise=1,create-initialised=1,update=3,data=10,download=2]
+        [--llm-latency 2.0] [--llm-error-rate 0.02] [--base-url http://127.0.0.1:8000]
+
+Seeds the configured database (point DB_NAME at a scratch database) with organizations,
+templates, approvers and version histories, starts llm_stub.StubLLMServer, launches
+`manage.py runserver` with AI_CHAT_URL pointing at the stub (unless --base-url names a server
+that is already running, in which case its AI_CHAT_URL must be set to the printed stub URL),
+then drives weighted random traffic from --concurrency threads. The report gives throughput,
+error counts and p50/p95/p99 latency per endpoint. Seeded rows are deleted afterwards unless
+--keep-data is given.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from .hot_paths import evolve_html
+from .html_to_text import synthetic_policy_html
+from .llm_stub import StubLLMServer
+
+DEFAULT_MIX = "initialise=1,create-initialised=1,update=3,data=10,download=2"
+SEED_PREFIX = "loadtest"
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - set(REQUEST_BUILDERS)
+    if unknown:
+        raise SystemExit(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def seed_database(organizations, policies_per_org, versions, size_kb, seed):
+    """Create the fixture graph through the normal services; returns ids the traffic generator needs."""
+    from django.utils import timezone
+    from ..models import Employee, Organization, PolicyTemplate
+    from ..services.policy_service import PolicyVersionService
+
+    rng = random.Random(seed)
+    run_id = uuid.uuid4().hex[:8]
+    fixture = {"run_id": run_id, "organizations": []}
+    for org_index in range(organizations):
+        organization = Organization.objects.create(name=f"{SEED_PREFIX}-{run_id}-{org_index}", status="active")
+        approvers = [
+            Employee.objects.create(organization_id=organization.id, sync_user_id=uuid.uuid4(), name=f"Approver {index}").id
+            for index in range(3)
+        ]
+        templates, policies = [], []
+        for policy_index in range(policies_per_org):
+            title = f"{SEED_PREFIX}-{run_id} Policy {org_index}-{policy_index}"
+            html = synthetic_policy_html(size_kb * 1024, pretty=True, seed=rng.randrange(1 << 30))
+            templates.append(PolicyTemplate.objects.create(title=title, template=html).id)
+            version_labels = []
+            for version_index in range(versions):
+                label = f"V{version_index + 1}"
+                created = PolicyVersionService.create_or_update_policy_with_version(
+                    title, html, label, organization, timezone.now(), SEED_PREFIX,
+                )
+                version_labels.append(label)
+                html = evolve_html(rng, html, pretty=True)
+            # update requests evolve this HTML further; the lock keeps concurrent edits of one policy ordered.
+            policies.append({"id": str(created["org_policy_id"]), "versions": version_labels, "html": html,
+                             "lock": threading.Lock()})
+        fixture["organizations"].append({
+            "id": str(organization.id),
+            "approvers": [str(approver) for approver in approvers],
+            "templates": [str(template) for template in templates],
+            "policies": policies,
+        })
+    return fixture
+
+
+def cleanup_database(fixture):
+    from ..models import Employee, Organization, OrgPolicy, PolicyApprover, PolicyTemplate, PolicyVersion
+
+    organization_ids = [org["id"] for org in fixture["organizations"]]
+    policy_ids = list(OrgPolicy.objects.filter(organization_id__in=organization_ids).values_list("id", flat=True))
+    version_ids = list(PolicyVersion.objects.filter(org_policy_id__in=policy_ids).values_list("id", flat=True))
+    PolicyApprover.objects.filter(policy_version_id__in=version_ids).delete()
+    PolicyVersion.objects.filter(id__in=version_ids).delete()
+    OrgPolicy.objects.filter(id__in=policy_ids).delete()
+    Employee.objects.filter(organization_id__in=organization_ids).delete()
+    PolicyTemplate.objects.filter(title__startswith=f"{SEED_PREFIX}-{fixture['run_id']}").delete()
+    Organization.objects.filter(id__in=organization_ids).delete()
+
+
+def _pick(rng, fixture):
+    organization = rng.choice(fixture["organizations"])
+    return organization, rng.choice(organization["policies"])
+
+
+def build_initialise(rng, fixture):
+    organization = rng.choice(fixture["organizations"])
+    return "policy/initialise", {
+        "organization_id": organization["id"],
+        "policy_template_id": rng.choice(organization["templates"]),
+        "department": "IT",
+        "category": "Security",
+    }
+
+
+def build_create_initialised(rng, fixture):
+    organization, policy = _pick(rng, fixture)
+    return "policy/create-initialised", {"org_policy_id": policy["id"], "approver": rng.choice(organization["approvers"])}
+
+
+def build_update(rng, fixture):
+    organization, policy = _pick(rng, fixture)
+    with policy["lock"]:
+        policy["html"] = evolve_html(rng, policy["html"], pretty=True)
+        html = policy["html"]
+    return "policy/update", {
+        "org_policy_id": policy["id"],
+        "organization_id": organization["id"],
+        "html_content": html,
+        "workforce_assignment": [{"department": "IT"}],
+        "approver": rng.choice(organization["approvers"]),
+    }
+
+
+def build_data(rng, fixture):
+    organization, policy = _pick(rng, fixture)
+    payload = {"org_policy_id": policy["id"], "organization_id": organization["id"]}
+    if rng.random() < 0.5:
+        payload["version"] = rng.choice(policy["versions"])
+    return "policy/data", payload
+
+
+def build_download(rng, fixture):
+    organization, policy = _pick(rng, fixture)
+    return "policy/download", {
+        "org_policy_id": policy["id"],
+        "organization_id": organization["id"],
+        "version": rng.choice(policy["versions"]),
+    }
+
+
+REQUEST_BUILDERS = {
+    "initialise": build_initialise,
+    "create-initialised": build_create_initialised,
+    "update": build_update,
+    "data": build_data,
+    "download": build_download,
+}
+
+
+def drive_traffic(base_url, fixture, mix, concurrency, duration, max_requests, seed, timeout):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    issued = [0]
+
+    def worker(worker_index):
+        rng = random.Random(seed * 1000 + worker_index)
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            with lock:
+                if max_requests and issued[0] >= max_requests:
+                    return
+                issued[0] += 1
+            name = rng.choices(names, weights)[0]
+            path, payload = REQUEST_BUILDERS[name](rng, fixture)
+            started = time.perf_counter()
+            try:
+                response = session.post(f"{base_url}/{path}", json=payload, timeout=timeout)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples[name].append(elapsed)
+                if not ok:
+                    errors[name] += 1
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    wall_seconds = time.monotonic() - started
+
+    endpoints = {}
+    for name in names:
+        latencies = sorted(samples[name])
+        endpoints[name] = {
+            "requests": len(latencies),
+            "errors": errors[name],
+            "throughput_rps": round(len(latencies) / wall_seconds, 2),
+            "mean_ms": round(statistics.mean(latencies) * 1000, 1) if latencies else None,
+            **{f"p{int(q * 100)}_ms": round(percentile(latencies, q) * 1000, 1) if latencies else None
+               for q in (0.50, 0.95, 0.99)},
+        }
+    total = sum(len(values) for values in samples.values())
+    return {
+        "wall_seconds": round(wall_seconds, 2),
+        "requests": total,
+        "errors": sum(errors.values()),
+        "throughput_rps": round(total / wall_seconds, 2),
+        "endpoints": endpoints,
+    }
+
+
+def wait_for_server(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{base_url}/metrics", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.25)
+    raise SystemExit(f"Server at {base_url} did not come up within {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--base-url", help="Target an already running server instead of starting runserver.")
+    parser.add_argument("--port", type=int, default=8800, help="Port for the runserver this harness starts.")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds of traffic.")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests (0 = duration only).")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--organizations", type=int, default=3)
+    parser.add_argument("--policies-per-org", type=int, default=5)
+    parser.add_argument("--versions", type=int, default=20)
+    parser.add_argument("--size-kb", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=2.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.02)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep-data", action="store_true")
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout.")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "CYBERWHIZ.settings")
+    import django
+    django.setup()
+    from django.conf import settings
+
+    stub = StubLLMServer(latency=args.llm_latency, error_rate=args.llm_error_rate,
+                         chunk_delay=args.llm_chunk_delay, seed=args.seed).start()
+    print(f"LLM stand-in listening at {stub.url}", file=sys.stderr)
+    server = None
+    fixture = None
+    try:
+        print("Seeding database...", file=sys.stderr)
+        fixture = seed_database(args.organizations, args.policies_per_org, args.versions, args.size_kb, args.seed)
+        base_url = args.base_url
+        if not base_url:
+            base_url = f"http://127.0.0.1:{args.port}"
+            server = subprocess.Popen(
+                [sys.executable, str(settings.BASE_DIR / "manage.py"), "runserver", f"127.0.0.1:{args.port}", "--noreload"],
+                env={**os.environ, "AI_CHAT_URL": stub.url},
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        wait_for_server(base_url)
+        print(f"Driving traffic against {base_url}...", file=sys.stderr)
+        report = drive_traffic(base_url.rstrip("/"), fixture, mix, args.concurrency, args.duration,
+                               args.requests, args.seed, args.timeout)
+        report["config"] = {key: value for key, value in vars(args).items() if key != "output"}
+        report["llm_requests_served"] = stub.requests_served
+        print(json.dumps(report, indent=2))
+        if args.output:
+            with open(args.output, "w") as output_file:
+                json.dump(report, output_file, indent=2)
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=10)
+        stub.stop()
+        if fixture and not args.keep_data:
+            cleanup_database(fixture)
+
+
+if __name__ == "__main__":
+    main()
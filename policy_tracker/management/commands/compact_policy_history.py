@@ -0,0 +1,65 @@
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from ...models import OrgPolicy
+from ...services.compaction_service import PolicyCompactionService, COMPACTION_SLEEP_SECONDS
+from ...services.storage_service import PolicyStorageService
+from ...utils.checkpoint_policy import CHECKPOINT_REPLAY_BYTES
+
+
+class Command(BaseCommand):
+    help = "Recompute deltas and checkpoint positions of policy histories, one policy per transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--organization", help="Only compact policies of this organization id.")
+        parser.add_argument("--policy", action="append", default=[], help="Compact this org_policy id (repeatable).")
+        parser.add_argument("--flagged-only", action="store_true",
+                            help="Only compact policies that policy_storage_report flags.")
+        parser.add_argument("--squash-drafts", action="store_true",
+                            help="Fold never-published, unapproved draft versions into the next kept version.")
+        parser.add_argument("--checkpoint-bytes", type=int, default=CHECKPOINT_REPLAY_BYTES,
+                            help="Replay cost (bytes processed) allowed between checkpoints.")
+        parser.add_argument("--sleep", type=float, default=COMPACTION_SLEEP_SECONDS, help="Pause between policies, in seconds.")
+        parser.add_argument("--limit", type=int, default=0, help="Stop after this many policies (0 = all).")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing.")
+
+    def handle(self, *args, **options):
+        organization_id = None
+        try:
+            if options["organization"]:
+                organization_id = uuid.UUID(options["organization"])
+            policy_ids = [uuid.UUID(value) for value in options["policy"]]
+        except ValueError:
+            raise CommandError("Invalid organization or policy id")
+
+        if not policy_ids:
+            if options["flagged_only"]:
+                policy_ids = [stats["org_policy_id"] for stats in PolicyStorageService.iter_policy_stats(organization_id)
+                              if stats["flags"]]
+            else:
+                policies = OrgPolicy.objects.order_by("id")
+                if organization_id:
+                    policies = policies.filter(organization_id=organization_id)
+                policy_ids = list(policies.values_list("id", flat=True))
+        if options["limit"]:
+            policy_ids = policy_ids[:options["limit"]]
+
+        totals = {"compacted": 0, "unchanged": 0, "busy": 0, "inconsistent": 0}
+        bytes_before = bytes_after = squashed = 0
+        for stats in PolicyCompactionService.compact_policies(
+            policy_ids, options["squash_drafts"], options["checkpoint_bytes"], options["dry_run"], options["sleep"],
+        ):
+            totals[stats["result"]] += 1
+            bytes_before += stats["bytes_before"]
+            bytes_after += stats["bytes_after"] if stats["result"] == "compacted" else stats["bytes_before"]
+            squashed += stats["squashed"] if stats["result"] == "compacted" else 0
+            if options["verbosity"] > 1 or stats["result"] == "inconsistent":
+                self.stdout.write(
+                    f"{stats['org_policy_id']}: {stats['result']}, {stats['versions']} versions, {stats['squashed']} squashed, "
+                    f"{stats['rewritten']} rewritten, checkpoints {stats['checkpoints_before']} -> {stats['checkpoints_after']}"
+                )
+        prefix = "Would compact" if options["dry_run"] else "Compacted"
+        self.stdout.write(
+            f"{prefix} {totals['compacted']} of {len(policy_ids)} policies ({totals['unchanged']} unchanged, "
+            f"{totals['busy']} busy, {totals['inconsistent']} inconsistent); {squashed} drafts squashed; "
+            f"{bytes_before:,} -> {bytes_after:,} bytes"
+        )
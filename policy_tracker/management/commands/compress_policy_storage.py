@@ -0,0 +1,41 @@
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from ...services.chunk_store import CHUNK_CODEC
+from ...services.storage_service import PolicyBlobStore, STORAGE_COMPRESSION, STORAGE_SCAN_BATCH_SIZE
+from ...utils.blob_codec import BlobCodec
+
+
+class Command(BaseCommand):
+    help = "Train per-template compression dictionaries and compress stored checkpoints and oversized diffs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--codec", choices=BlobCodec.available_codecs() + (CHUNK_CODEC,), default=STORAGE_COMPRESSION or "zlib",
+                            help=f"{CHUNK_CODEC!r} moves text into the shared chunk store instead of compressing it.")
+        parser.add_argument("--train", action="store_true", help="Train a new dictionary per policy template first.")
+        parser.add_argument("--template", action="append", default=[], help="Only train for this policy template id (repeatable).")
+        parser.add_argument("--skip-backfill", action="store_true", help="Only train dictionaries.")
+        parser.add_argument("--organization", help="Only compress versions of this organization id.")
+        parser.add_argument("--batch-size", type=int, default=STORAGE_SCAN_BATCH_SIZE)
+        parser.add_argument("--sleep", type=float, default=0.0, help="Pause between batches, in seconds.")
+
+    def handle(self, *args, **options):
+        try:
+            template_ids = [uuid.UUID(value) for value in options["template"]]
+            organization_id = uuid.UUID(options["organization"]) if options["organization"] else None
+        except ValueError:
+            raise CommandError("Invalid template or organization id")
+        if options["train"] and options["codec"] == CHUNK_CODEC:
+            raise CommandError("Dictionaries are trained for zlib or zstd, not for the chunk store")
+
+        if options["train"]:
+            trained = PolicyBlobStore.train_dictionaries(options["codec"], template_ids or None)
+            for template_id, dictionary_id, samples in trained:
+                self.stdout.write(f"Template {template_id}: dictionary {dictionary_id} from {samples} samples")
+            self.stdout.write(f"Trained {len(trained)} {options['codec']} dictionaries")
+        if options["skip_backfill"]:
+            return
+
+        rows, bytes_before, bytes_after = PolicyBlobStore.compress_existing(
+            organization_id, options["codec"], options["batch_size"], options["sleep"],
+        )
+        self.stdout.write(f"Compressed {rows} policy versions: {bytes_before:,} -> {bytes_after:,} bytes")
@@ -0,0 +1,41 @@
+import sys
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from ...models import OrgPolicy
+from ...services.export_service import PolicyExportService
+
+
+class Command(BaseCommand):
+    help = "Export every version of a policy in one pass over its diff chain."
+
+    def add_arguments(self, parser):
+        parser.add_argument("org_policy_id")
+        parser.add_argument("--format", choices=["ndjson", "zip"], default="ndjson")
+        parser.add_argument("--include-pdf", action="store_true", help="Also render each version to PDF (zip only).")
+        parser.add_argument("--output", help="Destination file. NDJSON is written to stdout when omitted.")
+
+    def handle(self, *args, **options):
+        try:
+            org_policy_id = uuid.UUID(options["org_policy_id"])
+        except ValueError:
+            raise CommandError("Invalid org_policy_id format")
+        if not OrgPolicy.objects.filter(id=org_policy_id).exists():
+            raise CommandError("OrgPolicy not found")
+        if options["format"] == "zip":
+            if not options["output"]:
+                raise CommandError("--output is required for zip exports")
+            chunks = PolicyExportService.iter_zip(org_policy_id, include_pdf=options["include_pdf"])
+        else:
+            chunks = PolicyExportService.iter_ndjson(org_policy_id)
+
+        written = 0
+        if options["output"]:
+            with open(options["output"], "wb") as handle:
+                for chunk in chunks:
+                    handle.write(chunk)
+                    written += len(chunk)
+            self.stderr.write(f"Wrote {written} bytes to {options['output']}")
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
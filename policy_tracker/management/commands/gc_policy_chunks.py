@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from ...services.chunk_store import PolicyChunkStore
+
+
+class Command(BaseCommand):
+    help = "Delete content-addressed policy chunks that no policy version references any more."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recount", action="store_true",
+                            help="Rebuild every refcount from policy_versions first (after deletes made outside the services).")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["recount"]:
+            live = PolicyChunkStore.recount()
+            self.stdout.write(f"Recounted references: {live} chunks in use")
+        removed = PolicyChunkStore.gc(options["batch_size"])
+        self.stdout.write(f"Removed {removed} unreferenced chunks")
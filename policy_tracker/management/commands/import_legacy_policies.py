@@ -0,0 +1,38 @@
+import json
+import os
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from ...models import Organization
+from ...services.import_service import LegacyPolicyImporter
+
+
+class Command(BaseCommand):
+    help = "Import a directory or zip archive of legacy policy PDFs as versioned org policies."
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="Directory of PDFs or a .zip archive.")
+        parser.add_argument("--organization", required=True, help="Organization id the policies belong to.")
+        parser.add_argument("--state", help="Checkpoint file (default: <source>.import-state.json).")
+        parser.add_argument("--batch-size", type=int, default=25)
+        parser.add_argument("--extract-workers", type=int, default=os.cpu_count() or 2)
+        parser.add_argument("--ai-concurrency", type=int, default=4)
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options["source"]):
+            raise CommandError(f"Source not found: {options['source']}")
+        try:
+            organization = Organization.objects.get(id=uuid.UUID(options["organization"]))
+        except (ValueError, Organization.DoesNotExist):
+            raise CommandError("Organization not found")
+
+        importer = LegacyPolicyImporter(
+            organization,
+            options["source"],
+            state_path=options["state"],
+            batch_size=options["batch_size"],
+            extract_workers=options["extract_workers"],
+            ai_concurrency=options["ai_concurrency"],
+            log=self.stderr.write,
+        )
+        report = importer.run()
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,49 @@
+import json
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from ...services.storage_service import PolicyStorageService, STORAGE_SCAN_BATCH_SIZE
+
+
+def _kb(value):
+    return f"{value / 1024:,.1f} KB"
+
+
+class Command(BaseCommand):
+    help = "Report policy_versions storage footprint and diff-chain health, flagging compaction candidates."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--organization", help="Only scan policies of this organization id.")
+        parser.add_argument("--batch-size", type=int, default=STORAGE_SCAN_BATCH_SIZE, help="Rows fetched per round trip.")
+        parser.add_argument("--top", type=int, default=20, help="How many of the worst policies to list.")
+        parser.add_argument("--json", action="store_true", help="Print the full report as JSON.")
+
+    def handle(self, *args, **options):
+        organization_id = None
+        if options["organization"]:
+            try:
+                organization_id = uuid.UUID(options["organization"])
+            except ValueError:
+                raise CommandError("Invalid organization id")
+
+        report = PolicyStorageService.build_report(organization_id, options["batch_size"], options["top"])
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"Scanned {report['policies']} policies")
+        self.stdout.write("\nPer organization:")
+        for org in report["organizations"]:
+            self.stdout.write(
+                f"  {org['organization_id']}: {org['policies']} policies, {org['versions']} versions, "
+                f"diffs {_kb(org['diff_bytes'])}, checkpoints {_kb(org['checkpoint_bytes'])}, "
+                f"{org['flagged_policies']} flagged"
+            )
+        self.stdout.write("\nCompaction / rebase candidates (by estimated full replay cost):")
+        if not report["compaction_candidates"]:
+            self.stdout.write("  none")
+        for row in report["compaction_candidates"]:
+            self.stdout.write(
+                f"  {row['org_policy_id']} (org {row['organization_id']}): {row['versions']} versions, "
+                f"{row['chain_since_checkpoint']} since last checkpoint, replay ~{_kb(row['full_replay_cost'])} "
+                f"(from checkpoint ~{_kb(row['checkpoint_replay_cost'])}) [{', '.join(row['flags'])}]"
+            )
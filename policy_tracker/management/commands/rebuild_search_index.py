@@ -0,0 +1,37 @@
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from ...models import OrgPolicy
+from ...services.export_service import PolicyExportService
+from ...services.search_service import PolicySearchService
+
+
+class Command(BaseCommand):
+    help = "Backfill policy_search_index by replaying each policy's chain once."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--organization", help="Only index policies of this organization id.")
+        parser.add_argument("--history", action="store_true", help="Index historical versions as well as the head.")
+
+    def handle(self, *args, **options):
+        policies = OrgPolicy.objects.only("id", "organization_id", "department", "title").order_by("id")
+        if options["organization"]:
+            try:
+                policies = policies.filter(organization_id=uuid.UUID(options["organization"]))
+            except ValueError:
+                raise CommandError("Invalid organization id")
+
+        indexed_policies = 0
+        indexed_versions = 0
+        for org_policy in policies.iterator(chunk_size=100):
+            head = None
+            for row, html in PolicyExportService.iter_replayed_versions(org_policy.id):
+                if head is not None and options["history"]:
+                    PolicySearchService.index_version(head[0][0], org_policy, head[0][1], head[1], is_head=False, keep_history=True)
+                    indexed_versions += 1
+                head = (row, html)
+            if head is None:
+                continue
+            PolicySearchService.index_version(head[0][0], org_policy, head[0][1], head[1], is_head=True, keep_history=options["history"])
+            indexed_versions += 1
+            indexed_policies += 1
+        self.stdout.write(f"Indexed {indexed_versions} versions across {indexed_policies} policies")
@@ -0,0 +1,43 @@
+import time
+from decouple import config
+from django.db import connection
+from django.urls import Resolver404, resolve
+from .utils.metrics import PhaseTimer, REQUEST_SECONDS
+from .utils.query_profiler import QueryBudget, QueryProfile
+
+METRICS_SERVER_TIMING = config('METRICS_SERVER_TIMING', default=False, cast=bool)
+
+
+class RequestMetricsMiddleware:
+    """
+    Times every request and its phases (db, replay, diff, pdf, llm, ...) for /metrics.
+
+    Queries are profiled through an execute_wrapper on the default connection (count, DB time,
+    slowest statement) and checked against settings.QUERY_BUDGETS; the other phases come from
+    metrics.span() blocks in the ops and services. With METRICS_SERVER_TIMING
+    the per-request totals are also sent back as a Server-Timing header. Work done while a
+    StreamingHttpResponse is iterated happens after this returns and is not attributed.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            endpoint = resolve(request.path_info).route or request.path_info
+        except Resolver404:
+            endpoint = "unmatched"
+
+        started = time.perf_counter()
+        query_profile = QueryProfile()
+        with PhaseTimer.request(endpoint) as phases, connection.execute_wrapper(query_profile):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+        QueryBudget.check(endpoint, query_profile)
+        if METRICS_SERVER_TIMING:
+            entries = [f"{phase};dur={seconds * 1000:.1f}" for phase, (seconds, _) in phases.items()]
+            entries.append(f"total;dur={elapsed * 1000:.1f}")
+            response["Server-Timing"] = ", ".join(entries)
+        return response
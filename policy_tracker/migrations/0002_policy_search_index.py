@@ -0,0 +1,60 @@
+from django.db import migrations
+
+POSTGRES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS policy_search_index (
+        policy_version_id uuid PRIMARY KEY,
+        org_policy_id uuid NOT NULL,
+        organization_id uuid NULL,
+        department varchar(255) NULL,
+        title varchar(255) NULL,
+        version varchar(255) NULL,
+        is_head boolean NOT NULL DEFAULT true,
+        content text NOT NULL,
+        search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', content), 'B')
+        ) STORED,
+        indexed_at timestamptz NOT NULL DEFAULT NOW()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS policy_search_index_vector_gin ON policy_search_index USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS policy_search_index_org_idx ON policy_search_index (organization_id, department, is_head)",
+    "CREATE INDEX IF NOT EXISTS policy_search_index_policy_idx ON policy_search_index (org_policy_id)",
+]
+
+SQLITE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS policy_search_index USING fts5(
+        policy_version_id UNINDEXED,
+        org_policy_id UNINDEXED,
+        organization_id UNINDEXED,
+        department UNINDEXED,
+        title,
+        version UNINDEXED,
+        is_head UNINDEXED,
+        content
+    )
+    """,
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = POSTGRES_SQL if schema_editor.connection.vendor == 'postgresql' else SQLITE_SQL
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    schema_editor.execute("DROP TABLE IF EXISTS policy_search_index")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policy_tracker', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,75 @@
+from django.db import migrations
+
+POSTGRES_SQL = [
+    "ALTER TABLE policy_versions ADD COLUMN IF NOT EXISTS diff_blob bytea NULL",
+    "ALTER TABLE policy_versions ADD COLUMN IF NOT EXISTS checkpoint_blob bytea NULL",
+    "ALTER TABLE policy_versions ADD COLUMN IF NOT EXISTS storage_codec varchar(32) NULL",
+    # The blobs are already compressed; stop TOAST from trying again on every write.
+    "ALTER TABLE policy_versions ALTER COLUMN diff_blob SET STORAGE EXTERNAL",
+    "ALTER TABLE policy_versions ALTER COLUMN checkpoint_blob SET STORAGE EXTERNAL",
+    """
+    CREATE TABLE IF NOT EXISTS policy_compression_dicts (
+        id bigserial PRIMARY KEY,
+        policy_template_id uuid NULL,
+        codec varchar(16) NOT NULL,
+        dictionary bytea NOT NULL,
+        sample_count integer NOT NULL DEFAULT 0,
+        created_at timestamptz NOT NULL DEFAULT NOW()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS policy_compression_dicts_template_idx ON policy_compression_dicts (policy_template_id, id)",
+]
+
+SQLITE_COLUMNS = [
+    ("diff_blob", "blob NULL"),
+    ("checkpoint_blob", "blob NULL"),
+    ("storage_codec", "varchar(32) NULL"),
+]
+
+SQLITE_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS policy_compression_dicts (
+        id integer PRIMARY KEY AUTOINCREMENT,
+        policy_template_id char(32) NULL,
+        codec varchar(16) NOT NULL,
+        dictionary blob NOT NULL,
+        sample_count integer NOT NULL DEFAULT 0,
+        created_at datetime NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS policy_compression_dicts_template_idx ON policy_compression_dicts (policy_template_id, id)",
+]
+
+
+def add_compressed_storage(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_SQL:
+            schema_editor.execute(statement)
+        return
+    # SQLite has no ADD COLUMN IF NOT EXISTS.
+    with schema_editor.connection.cursor() as cursor:
+        existing = {column.name for column in schema_editor.connection.introspection.get_table_description(cursor, 'policy_versions')}
+    for name, definition in SQLITE_COLUMNS:
+        if name not in existing:
+            schema_editor.execute(f"ALTER TABLE policy_versions ADD COLUMN {name} {definition}")
+    for statement in SQLITE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_compressed_storage(apps, schema_editor):
+    schema_editor.execute("DROP TABLE IF EXISTS policy_compression_dicts")
+    for name, _ in SQLITE_COLUMNS:
+        schema_editor.execute(f"ALTER TABLE policy_versions DROP COLUMN IF EXISTS {name}"
+                              if schema_editor.connection.vendor == 'postgresql'
+                              else f"ALTER TABLE policy_versions DROP COLUMN {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policy_tracker', '0002_policy_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_compressed_storage, drop_compressed_storage),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+POSTGRES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS policy_chunks (
+        hash char(64) PRIMARY KEY,
+        content text NOT NULL,
+        refcount bigint NOT NULL DEFAULT 0,
+        created_at timestamptz NOT NULL DEFAULT NOW()
+    )
+    """,
+    # gc() only ever looks for unreferenced chunks.
+    "CREATE INDEX IF NOT EXISTS policy_chunks_unreferenced_idx ON policy_chunks (hash) WHERE refcount <= 0",
+]
+
+SQLITE_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS policy_chunks (
+        hash char(64) PRIMARY KEY,
+        content text NOT NULL,
+        refcount bigint NOT NULL DEFAULT 0,
+        created_at datetime NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS policy_chunks_unreferenced_idx ON policy_chunks (hash) WHERE refcount <= 0",
+]
+
+
+def add_chunk_store(apps, schema_editor):
+    statements = POSTGRES_SQL if schema_editor.connection.vendor == 'postgresql' else SQLITE_SQL
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_chunk_store(apps, schema_editor):
+    schema_editor.execute("DROP TABLE IF EXISTS policy_chunks")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policy_tracker', '0003_compressed_version_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_chunk_store, drop_chunk_store),
+    ]
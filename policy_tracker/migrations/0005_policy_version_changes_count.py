@@ -0,0 +1,42 @@
+from django.db import migrations
+
+POSTGRES_SQL = [
+    # A constant default makes this a catalog-only change; no rewrite of policy_versions.
+    "ALTER TABLE policy_versions ADD COLUMN IF NOT EXISTS changes_count integer NOT NULL DEFAULT 0",
+    """
+    UPDATE policy_versions SET changes_count = CASE
+        WHEN jsonb_typeof(diff_data->'changes') = 'array' THEN jsonb_array_length(diff_data->'changes')
+        ELSE COALESCE((diff_data->>'change_count')::int, 0) END
+    WHERE diff_data IS NOT NULL
+    """,
+]
+
+SQLITE_SQL = [
+    "ALTER TABLE policy_versions ADD COLUMN changes_count integer NOT NULL DEFAULT 0",
+    """
+    UPDATE policy_versions SET changes_count = COALESCE(
+        json_array_length(diff_data, '$.changes'), json_extract(diff_data, '$.change_count'), 0)
+    WHERE diff_data IS NOT NULL
+    """,
+]
+
+
+def add_changes_count(apps, schema_editor):
+    statements = POSTGRES_SQL if schema_editor.connection.vendor == 'postgresql' else SQLITE_SQL
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_changes_count(apps, schema_editor):
+    schema_editor.execute("ALTER TABLE policy_versions DROP COLUMN changes_count")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policy_tracker', '0004_policy_chunk_store'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_changes_count, drop_changes_count),
+    ]
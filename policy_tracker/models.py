@@ -99,12 +99,19 @@ class PolicyVersion(models.Model):
         ],
         default='draft'
     )
-    is_current = models.BooleanField(default=False)
+    is_current = models.BooleanField(default=False, db_default=False)
     expired_at = models.DateField(null=True, blank=True)
     approved_by = models.CharField(max_length=255, null=True, blank=True)
     published_at = models.DateTimeField(null=True, blank=True)
     diff_data = models.JSONField(null=True, blank=True)
     checkpoint_template = models.TextField(null=True, blank=True)
+    # Compressed copies (migration 0003); when set, the plain column above holds NULL or a stub.
+    # storage_codec "chunks" instead means checkpoint_blob and diff_data reference policy_chunks.
+    diff_blob = models.BinaryField(null=True, blank=True)
+    checkpoint_blob = models.BinaryField(null=True, blank=True)
+    storage_codec = models.CharField(max_length=32, null=True, blank=True)
+    # len(diff["changes"]), kept beside the diff so history listings never read diff_data (migration 0005).
+    changes_count = models.IntegerField(default=0, db_default=0)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -118,6 +125,34 @@ class PolicyVersion(models.Model):
         return f"PolicyVersion {self.version or 'N/A'} ({self.status})"
 
 
+class PolicyCompressionDictionary(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    policy_template_id = models.UUIDField(null=True, blank=True)
+    codec = models.CharField(max_length=16)
+    dictionary = models.BinaryField()
+    sample_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'policy_compression_dicts'
+
+    def __str__(self):
+        return f"{self.codec} dictionary {self.id} ({self.policy_template_id or 'global'})"
+
+
+class PolicyChunk(models.Model):
+    hash = models.CharField(max_length=64, primary_key=True)
+    content = models.TextField()
+    refcount = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'policy_chunks'
+
+    def __str__(self):
+        return f"chunk {self.hash[:12]} ({self.refcount} refs)"
+
+
 class User(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255, null=True, blank=True)
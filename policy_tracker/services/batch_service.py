@@ -0,0 +1,202 @@
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from decouple import config
+from django.db import connection
+from .view_helpers import PolicyService
+
+BATCH_MAX_ITEMS = config('POLICY_BATCH_MAX_ITEMS', default=200, cast=int)
+BATCH_WORKERS = config('POLICY_BATCH_WORKERS', default=4, cast=int)
+BATCH_POOL_ATTEMPTS = 2
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=BATCH_WORKERS)
+    return _executor
+
+
+def _discard_executor(executor):
+    """Drop a pool that lost a worker; a broken ProcessPoolExecutor refuses every later submit."""
+    global _executor
+    if _executor is executor:
+        _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def rebuild_policy_versions(chain, target_versions):
+    """
+    Replay one stretch of a policy's chain once and return {version: html} for every requested version.
+    chain holds (version, diff_text, checkpoint_html) from the nearest checkpoint before the first
+    target on. Runs in a worker process, so it only receives plain strings.
+    """
+    remaining = set(target_versions)
+    rebuilt = {}
+    current_html = ""
+    for version_num, diff_data_str, checkpoint_html in chain:
+        current_html, _ = PolicyService.replay_step(current_html, diff_data_str, checkpoint_html)
+        if version_num in remaining:
+            rebuilt[version_num] = current_html
+            remaining.discard(version_num)
+            if not remaining:
+                break
+    return rebuilt
+
+
+class PolicyBatchService:
+    """Fetches many policy chains with a handful of ANY() queries and rebuilds them in parallel."""
+
+    @staticmethod
+    def load_indexes(org_policy_ids):
+        """Titles and checkpoint indexes (as PolicyService.get_policy_checkpoint_index) for many policies."""
+        ids = [str(org_policy_id) for org_policy_id in org_policy_ids]
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT id, title FROM org_policies WHERE id = ANY(%s::uuid[])", [ids])
+            titles = {str(row[0]): row[1] for row in cursor.fetchall()}
+            cursor.execute(
+                """
+                SELECT org_policy_id, id, version, status, created_at,
+                       checkpoint_blob IS NOT NULL OR COALESCE(octet_length(checkpoint_template), 0) > 0
+                FROM policy_versions
+                WHERE org_policy_id = ANY(%s::uuid[])
+                ORDER BY org_policy_id, created_at ASC
+                """,
+                [ids],
+            )
+            rows = cursor.fetchall()
+        indexes = defaultdict(list)
+        for row in rows:
+            indexes[str(row[0])].append(row[1:])
+        return titles, indexes
+
+    @staticmethod
+    def load_chains(indexes, targets_by_policy):
+        """
+        {org_policy_id: [(version, diff_text, checkpoint_html)]} covering, for each policy, the
+        stretch from the nearest checkpoint at or before its first target to its last target.
+        Workers only receive plain strings, so every row is decoded here, in one query.
+        """
+        stretches = {}
+        for org_policy_id, targets in targets_by_policy.items():
+            version_index = indexes[org_policy_id]
+            positions = [PolicyService.find_version_position(version_index, version) for version in targets]
+            positions = [position for position in positions if position is not None]
+            if not positions:
+                stretches[org_policy_id] = []
+                continue
+            start = next((position for position in range(min(positions), -1, -1) if version_index[position][4]), 0)
+            stretches[org_policy_id] = version_index[start:max(positions) + 1]
+        rows = PolicyService.load_replay_rows(
+            [str(row[0]) for stretch in stretches.values() for row in stretch],
+            [str(row[0]) for stretch in stretches.values() for row in stretch if row[4]],
+        )
+        return {
+            org_policy_id: [(row[1], *rows.get(str(row[0]), (None, None))) for row in stretch]
+            for org_policy_id, stretch in stretches.items()
+        }
+
+    @staticmethod
+    def iter_results(items):
+        """
+        Yield one result dict per requested (org_policy_id, version) pair, in completion order.
+        """
+        requested = defaultdict(list)
+        for org_policy_id, version in items:
+            requested[str(org_policy_id)].append(version)
+        titles, indexes = PolicyBatchService.load_indexes(requested.keys())
+
+        jobs = {}
+        for org_policy_id, versions in requested.items():
+            if org_policy_id not in titles:
+                for version in versions:
+                    yield {"org_policy_id": org_policy_id, "version": version, "error": "OrgPolicy not found"}
+                continue
+            version_index = indexes.get(org_policy_id)
+            if not version_index:
+                for version in versions:
+                    yield {"org_policy_id": org_policy_id, "version": version, "error": "No versions found for this policy"}
+                continue
+            latest_version = version_index[-1][1]
+            targets = [version or latest_version for version in versions]
+            jobs[org_policy_id] = targets
+
+        if not jobs:
+            return
+        chains = PolicyBatchService.load_chains(indexes, jobs)
+        # Policies whose workers died with the pool are retried once on a fresh one.
+        pending = set(jobs)
+        for _ in range(BATCH_POOL_ATTEMPTS):
+            executor = _get_executor()
+            try:
+                futures = {
+                    executor.submit(rebuild_policy_versions, chains[org_policy_id], jobs[org_policy_id]): org_policy_id
+                    for org_policy_id in pending
+                }
+            except BrokenProcessPool:
+                _discard_executor(executor)
+                continue
+            broken = False
+            for future in as_completed(futures):
+                org_policy_id = futures[future]
+                try:
+                    rebuilt = future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    continue
+                except Exception as e:
+                    rebuilt = e
+                pending.discard(org_policy_id)
+                yield from PolicyBatchService._job_results(org_policy_id, jobs[org_policy_id], rebuilt, titles, indexes)
+            if not broken:
+                break
+            _discard_executor(executor)
+        for org_policy_id in pending:
+            for version in jobs[org_policy_id]:
+                yield {"org_policy_id": org_policy_id, "version": version,
+                       "error": "Reconstruction failed: the worker pool stopped"}
+
+    @staticmethod
+    def _job_results(org_policy_id, versions, rebuilt, titles, indexes):
+        if isinstance(rebuilt, Exception):
+            for version in versions:
+                yield {"org_policy_id": org_policy_id, "version": version, "error": f"Reconstruction failed: {str(rebuilt)}"}
+            return
+        metadata = {}
+        for _, version_num, status, created_at, _ in indexes[org_policy_id]:
+            metadata.setdefault(version_num, (status, created_at))
+        for version in versions:
+            if version not in rebuilt:
+                yield {"org_policy_id": org_policy_id, "version": version, "error": f"Version {version} not found for this policy"}
+                continue
+            status, created_at = metadata.get(version, ("unknown", None))
+            html = rebuilt[version]
+            yield {
+                "org_policy_id": org_policy_id,
+                "policy_title": titles[org_policy_id],
+                "version": version,
+                "status": status,
+                "created_at": created_at.isoformat() if created_at else None,
+                "html": html,
+                "html_length": len(html),
+            }
+
+    @staticmethod
+    def parse_items(raw_items):
+        if not isinstance(raw_items, list) or not raw_items:
+            raise ValueError("items must be a non-empty list")
+        if len(raw_items) > BATCH_MAX_ITEMS:
+            raise ValueError(f"At most {BATCH_MAX_ITEMS} items can be requested at once")
+        items = []
+        for raw in raw_items:
+            if not isinstance(raw, dict) or not raw.get("org_policy_id"):
+                raise ValueError("Each item requires an org_policy_id")
+            try:
+                org_policy_id = uuid.UUID(str(raw["org_policy_id"]))
+            except ValueError:
+                raise ValueError(f"Invalid org_policy_id format: {raw['org_policy_id']}")
+            items.append((org_policy_id, raw.get("version")))
+        return items
@@ -0,0 +1,104 @@
+import hashlib
+from array import array
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from ..utils.diff_utils import compute_html_diff, DiffProcessor
+from ..utils.metrics import span, observe_replay_length, record_cache
+from .view_helpers import PolicyService
+
+BLAME_CACHE_PREFIX = "policy_blame"
+
+
+class PolicyBlameService:
+    """
+    Line-level blame: which version introduced each line of a policy version.
+
+    The chain is walked once with apply_diff_annotated, carrying one origin index per line.
+    A version with a checkpoint is its checkpoint, as in PolicyService.replay_step: the walk
+    diffs the running document against it, so lines the checkpoint changed are blamed on it.
+    Results are cached per (policy, version); a request for a newer version starts from the
+    newest cached ancestor and only replays the diffs after it.
+
+    A version's entry is keyed by a digest of the version ids up to and including it, taken
+    from the index each request reads anyway. Once compaction squashes a draft, every entry
+    after it stops matching in every process, with no invalidation to deliver; rewriting
+    diffs in place keeps each version's HTML, so its entries stay valid.
+    """
+
+    @staticmethod
+    def chain_digests(version_index, count=None):
+        """digests[p] covers the ids of version_index[:p + 1]; only the first count are computed."""
+        digests = []
+        running = hashlib.sha256()
+        for row in version_index[:count]:
+            running.update(str(row[0]).encode("ascii"))
+            digests.append(running.copy().hexdigest())
+        return digests
+
+    @staticmethod
+    def _cache_key(org_policy_id, chain_digest):
+        return f"{BLAME_CACHE_PREFIX}:{org_policy_id}:{chain_digest}"
+
+    @staticmethod
+    def annotate(org_policy_id, target_version=None):
+        """
+        Return (target_version, lines, origins, stats) where origins[i] is the
+        (policy_version_id, version) that introduced lines[i].
+        """
+        version_index = PolicyService.get_policy_checkpoint_index(org_policy_id)
+        if not version_index:
+            raise ObjectDoesNotExist("No versions found for this policy")
+        if target_version is None:
+            target_position = len(version_index) - 1
+            target_version = version_index[-1][1]
+        else:
+            target_position = next((i for i, row in enumerate(version_index) if row[1] == target_version), None)
+            if target_position is None:
+                raise ObjectDoesNotExist(f"Version {target_version} not found for this policy")
+
+        ids = [str(row[0]) for row in version_index[:target_position + 1]]
+        digests = PolicyBlameService.chain_digests(version_index, target_position + 1)
+        keys = {PolicyBlameService._cache_key(org_policy_id, digest): position for position, digest in enumerate(digests)}
+        cached = cache.get_many(list(keys))
+
+        base_position = -1
+        lines, origins, origin_ids = [], [], []
+        if cached:
+            base_key = max(cached, key=lambda key: keys[key])
+            base_position = keys[base_key]
+            entry = cached[base_key]
+            lines = list(entry["lines"])
+            origins = array("I", entry["origins"]).tolist()
+            origin_ids = list(entry["origin_ids"])
+
+        replay_ids = ids[base_position + 1:]
+        record_cache("blame", not replay_ids)
+        checkpoint_ids = [str(row[0]) for row in version_index[base_position + 1:target_position + 1] if row[4]]
+        rows = PolicyService.load_replay_rows(replay_ids, checkpoint_ids)
+        with span("replay"):
+            for version_id in replay_ids:
+                origin_ids.append(version_id)
+                diff_text, checkpoint_html = rows.get(version_id, (None, None))
+                if checkpoint_html is not None:
+                    diff_text = compute_html_diff("\n".join(lines), checkpoint_html)
+                lines, origins = DiffProcessor.apply_diff_annotated(lines, origins, diff_text, len(origin_ids) - 1)
+        observe_replay_length(len(replay_ids))
+
+        if replay_ids:
+            cache.set(PolicyBlameService._cache_key(org_policy_id, digests[-1]), {
+                "lines": lines,
+                "origins": array("I", origins).tobytes(),
+                "origin_ids": origin_ids,
+            })
+
+        versions_by_id = {str(row[0]): row[1] for row in version_index}
+        resolved = [(origin_ids[origin], versions_by_id.get(origin_ids[origin])) for origin in origins]
+        stats = {
+            "cached_base_version": version_index[base_position][1] if base_position >= 0 else None,
+            "diffs_replayed": len(replay_ids),
+        }
+        return target_version, lines, resolved, stats
+
+
+def annotate_policy_version(org_policy_id, target_version=None):
+    return PolicyBlameService.annotate(org_policy_id, target_version)
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import zlib
+from collections import Counter
+from decouple import config
+from django.db import connection, transaction
+
+CHUNK_STORE_ENABLED = config('POLICY_CHUNK_STORE', default=False, cast=bool)
+CHUNK_TARGET_LINES = config('POLICY_CHUNK_TARGET_LINES', default=16, cast=int)
+CHUNK_MAX_LINES = 4 * CHUNK_TARGET_LINES
+CHUNK_MIN_BYTES = config('POLICY_CHUNK_MIN_BYTES', default=512, cast=int)
+CHUNK_CODEC = "chunks"
+DIGEST_BYTES = 32
+
+
+class PolicyChunkStore:
+    """
+    Content-addressed line chunks shared by every policy version (policy_chunks, migration 0004).
+
+    Lines are grouped into chunks at content-defined boundaries (a line whose CRC is a
+    multiple of CHUNK_TARGET_LINES ends a chunk), so the same run of template-derived lines
+    produces the same chunks in every organization's copy, whatever precedes it. A chunked
+    row has storage_codec "chunks": checkpoint_blob is the concatenated SHA-256 digests of
+    the checkpoint's chunks, and diff changes carry "chunks" (hex digests) instead of "lines"
+    for their old and new text when it is larger than CHUNK_MIN_BYTES.
+
+    refcount counts references from policy_versions rows. Writers that go through
+    PolicyBlobStore and the compaction job keep it current; gc() deletes chunks nobody
+    references, and recount() rebuilds the counts from the rows after deletes made elsewhere.
+    """
+
+    @staticmethod
+    def split_chunks(lines):
+        chunks, current = [], []
+        for line in lines:
+            current.append(line)
+            if zlib.crc32(line.encode("utf-8")) % CHUNK_TARGET_LINES == 0 or len(current) >= CHUNK_MAX_LINES:
+                chunks.append("\n".join(current))
+                current = []
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+
+    @staticmethod
+    def digest(content):
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _chunk_lines(lines, new_chunks):
+        hashes = []
+        for content in PolicyChunkStore.split_chunks(lines):
+            digest = PolicyChunkStore.digest(content)
+            new_chunks[digest] = content
+            hashes.append(digest)
+        return hashes
+
+    @staticmethod
+    def encode_version(diff_json, checkpoint_html):
+        """
+        Column values like PolicyBlobStore.encode_version, with text moved into the chunk store.
+        The chunks are written (and their refcounts raised) before returning.
+        """
+        new_chunks = {}
+        references = []
+        columns = {"diff_data": diff_json, "diff_blob": None, "checkpoint_template": checkpoint_html,
+                   "checkpoint_blob": None, "storage_codec": None}
+        if checkpoint_html:
+            hashes = PolicyChunkStore._chunk_lines(checkpoint_html.split("\n"), new_chunks)
+            columns["checkpoint_template"] = None
+            columns["checkpoint_blob"] = b"".join(bytes.fromhex(digest) for digest in hashes)
+            references.extend(hashes)
+        if isinstance(diff_json, dict) and isinstance(diff_json.get("changes"), list):
+            changes, chunked = [], False
+            for change in diff_json["changes"]:
+                if isinstance(change, dict):
+                    change = dict(change)
+                    for side in ("old", "new"):
+                        info = change.get(side)
+                        if isinstance(info, dict) and sum(len(line) for line in info.get("lines", [])) >= CHUNK_MIN_BYTES:
+                            info = dict(info)
+                            info["chunks"] = PolicyChunkStore._chunk_lines(info.pop("lines"), new_chunks)
+                            references.extend(info["chunks"])
+                            change[side] = info
+                            chunked = True
+                changes.append(change)
+            if chunked:
+                # raw_bytes keeps get_checkpoint_debt pricing the diff at its expanded size.
+                columns["diff_data"] = {**diff_json, "changes": changes, "raw_bytes": len(json.dumps(diff_json))}
+        if not references:
+            return columns
+        PolicyChunkStore.store(new_chunks, Counter(references))
+        columns["storage_codec"] = CHUNK_CODEC
+        return columns
+
+    @staticmethod
+    def store(contents, counts):
+        """Insert missing chunks and add counts[hash] references to each."""
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                """
+                INSERT INTO policy_chunks (hash, content, refcount, created_at) VALUES (%s, %s, %s, NOW())
+                ON CONFLICT (hash) DO UPDATE SET refcount = policy_chunks.refcount + EXCLUDED.refcount
+                """,
+                [(digest, contents[digest], count) for digest, count in sorted(counts.items())],
+            )
+
+    @staticmethod
+    def release(counts):
+        """Drop counts[hash] references; chunks reaching zero are left for gc()."""
+        if not counts:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "UPDATE policy_chunks SET refcount = GREATEST(refcount - %s, 0) WHERE hash = %s",
+                [(count, digest) for digest, count in sorted(counts.items())],
+            )
+
+    @staticmethod
+    def fetch(hashes):
+        """Bulk-load chunk contents: {hash: content} in one query."""
+        hashes = list(set(hashes))
+        if not hashes:
+            return {}
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT hash, content FROM policy_chunks WHERE hash = ANY(%s)", [hashes])
+            return dict(cursor.fetchall())
+
+    @staticmethod
+    def checkpoint_hashes(checkpoint_blob):
+        blob = bytes(checkpoint_blob or b"")
+        return [blob[offset:offset + DIGEST_BYTES].hex() for offset in range(0, len(blob), DIGEST_BYTES)]
+
+    @staticmethod
+    def diff_hashes(diff_json):
+        hashes = []
+        for change in (diff_json or {}).get("changes") or []:
+            if isinstance(change, dict):
+                for side in ("old", "new"):
+                    hashes.extend((change.get(side) or {}).get("chunks", []))
+        return hashes
+
+    @staticmethod
+    def row_hashes(diff_data_str, checkpoint_blob):
+        """Every chunk reference one chunked row holds, with repeats."""
+        diff_json = json.loads(diff_data_str) if diff_data_str else None
+        return PolicyChunkStore.diff_hashes(diff_json) + PolicyChunkStore.checkpoint_hashes(checkpoint_blob)
+
+    @staticmethod
+    def _resolve(hashes, chunks):
+        missing = [digest for digest in hashes if digest not in chunks]
+        if missing:
+            chunks.update(PolicyChunkStore.fetch(missing))
+        try:
+            return [chunks[digest] for digest in hashes]
+        except KeyError as error:
+            raise LookupError(f"Chunk {error.args[0]} is missing from policy_chunks")
+
+    @staticmethod
+    def expand_checkpoint(checkpoint_blob, chunks=None):
+        chunks = {} if chunks is None else chunks
+        return "\n".join(PolicyChunkStore._resolve(PolicyChunkStore.checkpoint_hashes(checkpoint_blob), chunks))
+
+    @staticmethod
+    def expand_diff(diff_json, chunks=None):
+        """The diff with every "chunks" list turned back into "lines"."""
+        chunks = {} if chunks is None else chunks
+        changes = []
+        for change in diff_json.get("changes") or []:
+            if isinstance(change, dict):
+                change = dict(change)
+                for side in ("old", "new"):
+                    info = change.get(side)
+                    if isinstance(info, dict) and "chunks" in info:
+                        info = dict(info)
+                        contents = PolicyChunkStore._resolve(info.pop("chunks"), chunks)
+                        info["lines"] = [line for content in contents for line in content.split("\n")]
+                        change[side] = info
+            changes.append(change)
+        expanded = {**diff_json, "changes": changes}
+        expanded.pop("raw_bytes", None)
+        return expanded
+
+    @staticmethod
+    def prefetch(rows):
+        """
+        One bulk fetch for a reconstruction: rows are (diff_data_str, checkpoint_blob, storage_codec)
+        and the result maps every chunk they reference to its content.
+        """
+        hashes = []
+        for diff_data_str, checkpoint_blob, codec in rows:
+            if codec == CHUNK_CODEC:
+                hashes.extend(PolicyChunkStore.row_hashes(diff_data_str, checkpoint_blob))
+        return PolicyChunkStore.fetch(hashes)
+
+    @staticmethod
+    def gc(batch_size=1000):
+        """Delete unreferenced chunks in batches; returns how many were removed."""
+        removed = 0
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    DELETE FROM policy_chunks WHERE hash IN (
+                        SELECT hash FROM policy_chunks WHERE refcount <= 0 LIMIT %s FOR UPDATE SKIP LOCKED)
+                    """,
+                    [batch_size],
+                )
+                removed += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    return removed
+
+    @staticmethod
+    def recount(batch_size=500):
+        """
+        Recompute every refcount from the chunked policy_versions rows; returns the number of live chunks.
+        Chunk writers wait on the table lock, so no reference being written is missed by the scan.
+        """
+        counts = Counter()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("LOCK TABLE policy_chunks IN SHARE ROW EXCLUSIVE MODE")
+            with connection.chunked_cursor() as cursor:
+                cursor.execute(
+                    "SELECT diff_data::text, checkpoint_blob FROM policy_versions WHERE storage_codec = %s", [CHUNK_CODEC],
+                )
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for diff_data_str, checkpoint_blob in rows:
+                        counts.update(PolicyChunkStore.row_hashes(diff_data_str, checkpoint_blob))
+            with connection.cursor() as cursor:
+                cursor.execute("UPDATE policy_chunks SET refcount = 0 WHERE refcount <> 0")
+                cursor.executemany("UPDATE policy_chunks SET refcount = %s WHERE hash = %s",
+                                   [(count, digest) for digest, count in counts.items()])
+        return len(counts)
@@ -0,0 +1,180 @@
+import json
+import logging
+import time
+from collections import Counter
+from decouple import config
+from django.db import connection, transaction
+from ..utils.checkpoint_policy import CheckpointPolicy, CHECKPOINT_REPLAY_BYTES
+from ..utils.diff_utils import DiffProcessor, compute_html_diff, apply_diff
+from .chunk_store import CHUNK_CODEC, PolicyChunkStore
+from .storage_service import PolicyBlobStore
+
+logger = logging.getLogger(__name__)
+
+COMPACTION_SLEEP_SECONDS = config('POLICY_COMPACTION_SLEEP_SECONDS', default=0.2, cast=float)
+
+# Versions in these states, or carrying an approval decision, stay addressable when drafts are squashed.
+KEPT_STATUSES = ("in_review", "published", "archived")
+
+
+class PolicyCompactionService:
+    """
+    Rewrites one policy's history at a time so every reader replays less.
+
+    The chain is replayed once from "" (and every stored checkpoint checked against it);
+    as the replay reaches each kept version its delta is recomputed against the version kept
+    before it and its checkpoint re-placed with CheckpointPolicy.next_step, the replay-cost
+    rule new versions are written with, using checkpoint_bytes as the budget. The HTML of
+    every kept version is unchanged, and rewritten rows are stored through PolicyBlobStore
+    like any new version. Draft versions that were never published, approved or made current can be
+    squashed into the next kept version; the first and the latest version are always kept.
+
+    Each policy is compacted in its own transaction under a SKIP LOCKED row lock on
+    org_policies, so a policy that a live request is editing is skipped, not waited for.
+    """
+
+    @staticmethod
+    def _load_history(org_policy_id):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT id FROM org_policies WHERE id = %s FOR UPDATE SKIP LOCKED", [str(org_policy_id)])
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute(
+                """
+                SELECT id, version, status, is_current, approved_by, published_at, diff_data::text, checkpoint_template,
+                       diff_blob, checkpoint_blob, storage_codec
+                FROM policy_versions WHERE org_policy_id = %s ORDER BY created_at ASC, id ASC FOR UPDATE
+                """,
+                [str(org_policy_id)],
+            )
+            stored_rows = cursor.fetchall()
+            chunks = PolicyChunkStore.prefetch((row[6], row[9], row[10]) for row in stored_rows)
+            rows = [
+                row[:6] + (PolicyBlobStore.diff_text(row[6], row[8], row[10], chunks),
+                           PolicyBlobStore.checkpoint_html(row[7], row[9], row[10], chunks))
+                for row in stored_rows
+            ]
+            # Chunk references held by each row, released when the row is rewritten or squashed.
+            references = {str(row[0]): PolicyChunkStore.row_hashes(row[6], row[9]) for row in stored_rows if row[10] == CHUNK_CODEC}
+            cursor.execute(
+                """
+                SELECT DISTINCT policy_version_id FROM policy_approvers
+                WHERE policy_version_id = ANY(%s::uuid[]) AND status IS NOT NULL AND status <> 'pending'
+                """,
+                [[str(row[0]) for row in rows]],
+            )
+            decided = {str(row[0]) for row in cursor.fetchall()}
+        return rows, decided, references
+
+    @staticmethod
+    def _is_kept(row, decided):
+        version_id, _, status, is_current, approved_by, published_at = row[:6]
+        return bool(status in KEPT_STATUSES or is_current or approved_by or published_at or str(version_id) in decided)
+
+    @staticmethod
+    def compact_policy(org_policy_id, squash_drafts=False, checkpoint_bytes=CHECKPOINT_REPLAY_BYTES, dry_run=False):
+        """Compact one policy; returns a stats dict whose "result" is compacted, unchanged, busy or inconsistent."""
+        stats = {"org_policy_id": str(org_policy_id), "result": "unchanged", "versions": 0, "squashed": 0,
+                 "rewritten": 0, "checkpoints_before": 0, "checkpoints_after": 0, "bytes_before": 0, "bytes_after": 0}
+        with transaction.atomic():
+            history = PolicyCompactionService._load_history(org_policy_id)
+            if history is None:
+                stats["result"] = "busy"
+                return stats
+            rows, decided, references = history
+            stats["versions"] = len(rows)
+            if not rows:
+                return stats
+
+            last = len(rows) - 1
+            kept = {
+                index for index, row in enumerate(rows)
+                if not squash_drafts or index in (0, last) or PolicyCompactionService._is_kept(row, decided)
+            }
+            squashed_ids = [str(row[0]) for index, row in enumerate(rows) if index not in kept]
+
+            # One pass holds two documents: the replay so far and the version kept before it.
+            updates = []
+            current_html = previous_html = ""
+            previous_size = None
+            replay_bytes = changes = 0
+            for index, row in enumerate(rows):
+                diff_data_str, checkpoint = row[6], row[7]
+                stats["bytes_before"] += len(diff_data_str or "") + len(checkpoint or "")
+                if diff_data_str and diff_data_str.strip():
+                    current_html = apply_diff(current_html, json.loads(diff_data_str))
+                if checkpoint:
+                    stats["checkpoints_before"] += 1
+                    # A checkpoint that disagrees with the replay holds content no reader would lose today; leave it for a human.
+                    if checkpoint != current_html:
+                        stats["result"] = "inconsistent"
+                        logger.warning("Skipping compaction of %s: checkpoint of %s does not match the replayed chain",
+                                       org_policy_id, row[1], extra={"org_policy_id": str(org_policy_id), "version": row[1]})
+                        # Drop the chunks already written for the versions before it.
+                        transaction.set_rollback(True)
+                        return stats
+                if index not in kept:
+                    continue
+
+                diff = compute_html_diff(previous_html, current_html)
+                diff_text = json.dumps(diff)
+                is_checkpoint, replay_bytes, changes = CheckpointPolicy.next_step(
+                    replay_bytes, changes, previous_size, len(diff_text), len(diff["changes"]), len(current_html),
+                    replay_budget=checkpoint_bytes,
+                )
+                previous_html, previous_size = current_html, len(current_html)
+                new_checkpoint = current_html if is_checkpoint else None
+                stats["bytes_after"] += len(diff_text) + len(new_checkpoint or "")
+                stats["checkpoints_after"] += is_checkpoint
+                if DiffProcessor.load_diff(diff_data_str) != diff or (checkpoint or None) != new_checkpoint:
+                    stored = PolicyBlobStore.encode_version(org_policy_id, diff, new_checkpoint)
+                    updates.append((
+                        diff_text if stored["diff_data"] is diff else json.dumps(stored["diff_data"]),
+                        stored["diff_blob"], stored["checkpoint_template"], stored["checkpoint_blob"],
+                        stored["storage_codec"], stored["changes_count"], str(row[0]),
+                    ))
+            stats["squashed"] = len(squashed_ids)
+            stats["rewritten"] = len(updates)
+            if not updates and not squashed_ids:
+                return stats
+            stats["result"] = "compacted"
+            if dry_run:
+                transaction.set_rollback(True)
+                return stats
+
+            with connection.cursor() as cursor:
+                if updates:
+                    cursor.executemany(
+                        """
+                        UPDATE policy_versions SET diff_data = %s::jsonb, diff_blob = %s, checkpoint_template = %s,
+                            checkpoint_blob = %s, storage_codec = %s, changes_count = %s, updated_at = NOW()
+                        WHERE id = %s
+                        """,
+                        updates,
+                    )
+                if squashed_ids:
+                    cursor.execute("DELETE FROM policy_approvers WHERE policy_version_id = ANY(%s::uuid[])", [squashed_ids])
+                    cursor.execute("DELETE FROM policy_search_index WHERE policy_version_id = ANY(%s::uuid[])", [squashed_ids])
+                    cursor.execute("DELETE FROM policy_versions WHERE id = ANY(%s::uuid[])", [squashed_ids])
+            released = Counter()
+            for version_id in [update[-1] for update in updates] + squashed_ids:
+                released.update(references.get(version_id, []))
+            PolicyChunkStore.release(released)
+        logger.info(
+            "Compacted %s: %d -> %d versions, %d -> %d bytes", org_policy_id, stats["versions"],
+            stats["versions"] - stats["squashed"], stats["bytes_before"], stats["bytes_after"], extra=stats,
+        )
+        return stats
+
+    @staticmethod
+    def compact_policies(org_policy_ids, squash_drafts=False, checkpoint_bytes=CHECKPOINT_REPLAY_BYTES,
+                         dry_run=False, sleep_seconds=COMPACTION_SLEEP_SECONDS):
+        """Compact policies one transaction at a time, pausing between them; yields each policy's stats."""
+        for position, org_policy_id in enumerate(org_policy_ids):
+            if position and sleep_seconds:
+                time.sleep(sleep_seconds)
+            yield PolicyCompactionService.compact_policy(org_policy_id, squash_drafts, checkpoint_bytes, dry_run)
+
+
+def compact_policy(org_policy_id, squash_drafts=False, checkpoint_bytes=CHECKPOINT_REPLAY_BYTES, dry_run=False):
+    return PolicyCompactionService.compact_policy(org_policy_id, squash_drafts, checkpoint_bytes, dry_run)
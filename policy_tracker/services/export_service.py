@@ -0,0 +1,76 @@
+import json
+import re
+import zipfile
+from .view_helpers import PolicyService, render_pdf_from_html
+
+EXPORT_CHUNK_SIZE = 20
+
+
+class _StreamBuffer:
+    """Write-only sink that lets zipfile emit an archive piece by piece."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class PolicyExportService:
+    """Walks a policy's version chain once and yields every version as it is rebuilt."""
+
+    @staticmethod
+    def iter_replayed_versions(org_policy_id):
+        """
+        Yield (index_row, html) for every version in creation order, where index_row is the
+        (id, version, status, created_at, has_checkpoint) row of get_policy_checkpoint_index.
+        The chain is replayed once through PolicyService.iter_replay, EXPORT_CHUNK_SIZE rows at a time.
+        """
+        version_index = PolicyService.get_policy_checkpoint_index(org_policy_id)
+        for position, html in PolicyService.iter_replay(version_index, batch_size=EXPORT_CHUNK_SIZE):
+            yield version_index[position], html
+
+    @staticmethod
+    def iter_ndjson(org_policy_id):
+        for position, (row, html) in enumerate(PolicyExportService.iter_replayed_versions(org_policy_id), start=1):
+            version_id, version, status, created_at, _ = row
+            record = {
+                "position": position,
+                "policy_version_id": str(version_id),
+                "version": version,
+                "status": status,
+                "created_at": created_at.isoformat() if created_at else None,
+                "html_length": len(html),
+                "html": html,
+            }
+            yield (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+
+    @staticmethod
+    def iter_zip(org_policy_id, include_pdf=False):
+        buffer = _StreamBuffer()
+        with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for position, (row, html) in enumerate(PolicyExportService.iter_replayed_versions(org_policy_id), start=1):
+                base_name = f"{position:04d}_v{PolicyExportService.safe_name(row[1])}"
+                archive.writestr(f"{base_name}.html", html)
+                if include_pdf:
+                    archive.writestr(f"{base_name}.pdf", render_pdf_from_html(html))
+                yield buffer.drain()
+        yield buffer.drain()
+
+    @staticmethod
+    def safe_name(value):
+        return re.sub(r'[^A-Za-z0-9._-]+', '_', value or 'unknown')
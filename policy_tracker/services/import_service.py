@@ -0,0 +1,208 @@
+import json
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.db import transaction
+from django.utils import timezone
+from ..models import OrgPolicy
+from ..utils.pdf_processor import extract_pdf_for_import
+from .policy_service import PolicyAIService, PolicyVersionService
+from .view_helpers import PolicyService
+
+IMPORT_UPDATED_BY = "legacy-import"
+
+
+def version_sort_key(version):
+    """Natural order for version labels: "1.9" < "1.10" < "2", "rev 9" < "rev 10"."""
+    return tuple((0, int(part)) if part.isdigit() else (1, part.lower())
+                 for part in re.findall(r'\d+|[^\W\d_]+', str(version)))
+
+
+class LegacyImportState:
+    """Resumable import progress, persisted as JSON next to the source once each batch commits."""
+
+    def __init__(self, path):
+        self.path = path
+        self.sources = {}
+        self.extractions = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as handle:
+                saved = json.load(handle)
+            self.sources = saved.get("sources", {})
+            self.extractions = saved.get("extractions", {})
+
+    def is_done(self, key):
+        return self.sources.get(key, {}).get("status") == "imported"
+
+    def save(self):
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as handle:
+            json.dump({"sources": self.sources, "extractions": self.extractions}, handle)
+        os.replace(temporary_path, self.path)
+
+
+class LegacyPolicyImporter:
+    """
+    PDF -> text -> AI title/version -> versioned OrgPolicy for a directory or zip archive.
+
+    Text extraction runs in a process pool, AI calls in a bounded thread pool with results
+    cached by content hash, and inserts go through create_or_update_policy_with_version in one
+    transaction per batch with a savepoint per document.
+
+    Each policy's versions are appended in version_sort_key order: a batch is sorted by it, and
+    a document older than a version an earlier batch already stored is refused rather than
+    appended out of order. A document whose version is already stored with the same HTML was
+    committed by a run that stopped before saving its state; it is recorded, not re-inserted.
+    """
+
+    def __init__(self, organization, source, state_path=None, batch_size=25, extract_workers=4, ai_concurrency=4, log=print):
+        self.organization = organization
+        self.source = source
+        self.state = LegacyImportState(state_path or f"{source.rstrip(os.sep)}.import-state.json")
+        self.batch_size = batch_size
+        self.extract_workers = extract_workers
+        self.ai_concurrency = ai_concurrency
+        self.log = log
+        self.stats = {"imported": 0, "skipped": 0, "failed": 0, "bytes": 0}
+
+    def discover(self):
+        """Yield (key, path, member) for every PDF in the source, in a stable order."""
+        if zipfile.is_zipfile(self.source):
+            with zipfile.ZipFile(self.source) as archive:
+                members = sorted(name for name in archive.namelist() if name.lower().endswith('.pdf'))
+            for member in members:
+                yield f"{os.path.basename(self.source)}::{member}", self.source, member
+            return
+        for root, dirs, files in os.walk(self.source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith('.pdf'):
+                    path = os.path.join(root, name)
+                    yield os.path.relpath(path, self.source), path, None
+
+    def run(self):
+        started = time.monotonic()
+        pending = []
+        with ProcessPoolExecutor(max_workers=self.extract_workers) as extract_pool, \
+                ThreadPoolExecutor(max_workers=self.ai_concurrency) as ai_pool:
+            for key, path, member in self.discover():
+                if self.state.is_done(key):
+                    self.stats["skipped"] += 1
+                    continue
+                pending.append((key, path, member))
+                if len(pending) >= self.batch_size:
+                    self._process_batch(pending, extract_pool, ai_pool)
+                    pending = []
+                    self._report_progress(started)
+            if pending:
+                self._process_batch(pending, extract_pool, ai_pool)
+        elapsed = time.monotonic() - started
+        return {
+            **self.stats,
+            "seconds": round(elapsed, 2),
+            "documents_per_second": round(self.stats["imported"] / elapsed, 2) if elapsed else 0.0,
+            "mb_per_second": round(self.stats["bytes"] / elapsed / 1_000_000, 2) if elapsed else 0.0,
+            "failures": {key: entry["error"] for key, entry in self.state.sources.items() if entry.get("status") == "failed"},
+        }
+
+    def _process_batch(self, batch, extract_pool, ai_pool):
+        paths = [path for _, path, _ in batch]
+        members = [member for _, _, member in batch]
+        extracted = list(extract_pool.map(extract_pdf_for_import, paths, members))
+
+        documents = []
+        for (key, _, _), result in zip(batch, extracted):
+            if "error" in result:
+                self._fail(key, f"extraction failed: {result['error']}")
+            elif not result["text"]:
+                self._fail(key, "no extractable text")
+            else:
+                documents.append((key, result))
+
+        # One AI call per distinct document; repeated content reuses the cached answer.
+        uncached = {}
+        for key, result in documents:
+            if result["sha256"] not in self.state.extractions:
+                uncached.setdefault(result["sha256"], result["text"])
+        ai_results = ai_pool.map(PolicyAIService.extract_title_version_from_pdf, uncached.values())
+        ai_errors = {}
+        for sha256, (status, extracted_data) in zip(uncached, ai_results):
+            # Only successful answers are checkpointed so a resumed run retries timeouts and misses.
+            if extracted_data:
+                self.state.extractions[sha256] = extracted_data
+            else:
+                ai_errors[sha256] = {"error": status.get("message")}
+
+        ready = []
+        for key, result in documents:
+            extraction = self.state.extractions.get(result["sha256"]) or ai_errors[result["sha256"]]
+            if not extraction.get("title") or not extraction.get("version"):
+                self._fail(key, f"title/version not detected: {extraction.get('error', 'missing fields')}")
+                continue
+            ready.append((key, result, extraction))
+        # Older versions of the same policy must be written first to keep the diff chain ordered.
+        ready.sort(key=lambda item: (item[2]["title"].strip().lower(), version_sort_key(item[2]["version"])))
+
+        with transaction.atomic():
+            for key, result, extraction in ready:
+                title, version = extraction["title"].strip(), str(extraction["version"])
+                try:
+                    with transaction.atomic():
+                        created, head_version = self._find_in_chain(title, version, result["html"])
+                        if created is None and head_version is not None \
+                                and version_sort_key(version) < version_sort_key(head_version):
+                            self._fail(key, f"version {version} is older than {head_version}, already imported for {title!r}")
+                            continue
+                        if created is None:
+                            created = PolicyVersionService.create_or_update_policy_with_version(
+                                title,
+                                result["html"],
+                                version,
+                                self.organization,
+                                timezone.now(),
+                                IMPORT_UPDATED_BY,
+                            )
+                            self.stats["imported"] += 1
+                            self.stats["bytes"] += result["size"]
+                        else:
+                            self.stats["skipped"] += 1
+                except Exception as e:
+                    self._fail(key, f"insert failed: {str(e)}")
+                    continue
+                self.state.sources[key] = {
+                    "status": "imported",
+                    "sha256": result["sha256"],
+                    "org_policy_id": str(created["org_policy_id"]),
+                    "policy_version_id": str(created["policy_version_id"]),
+                }
+            # Saved only once the batch is durable; a run stopped in between is caught by _find_in_chain.
+            transaction.on_commit(self.state.save)
+
+    def _find_in_chain(self, title, version, html):
+        """
+        (created, head_version) for a document about to be imported: created describes the stored
+        version when the same version with the same HTML is already there, head_version is the
+        policy's latest version (None for a policy that does not exist yet).
+        """
+        org_policy = OrgPolicy.objects.filter(title=title, organization=self.organization).only("id").first()
+        if org_policy is None:
+            return None, None
+        version_index = PolicyService.get_policy_checkpoint_index(org_policy.id)
+        if not version_index:
+            return None, None
+        position = PolicyService.find_version_position(version_index, version)
+        if position is not None and PolicyService.replay_to_position(version_index, position)[0] == html:
+            return {"org_policy_id": org_policy.id, "policy_version_id": version_index[position][0]}, None
+        return None, version_index[-1][1]
+
+    def _fail(self, key, error):
+        self.state.sources[key] = {"status": "failed", "error": error}
+        self.stats["failed"] += 1
+        self.log(f"FAILED {key}: {error}")
+
+    def _report_progress(self, started):
+        elapsed = time.monotonic() - started
+        rate = self.stats["imported"] / elapsed if elapsed else 0.0
+        self.log(f"imported={self.stats['imported']} failed={self.stats['failed']} skipped={self.stats['skipped']} ({rate:.2f} docs/s)")
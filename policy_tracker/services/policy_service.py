@@ -1,13 +1,33 @@
+import hashlib
+import logging
+import re
+import time
 import requests
 import json
 from decouple import config
+from django.core.cache import caches
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import transaction
 from django.utils import timezone
 from ..models import Organization, OrgPolicy, PolicyVersion
-from ..utils.diff_utils import compute_html_diff, apply_diff
+from ..utils.checkpoint_policy import CheckpointPolicy
+from ..utils.diff_utils import compute_html_diff
+from ..utils.prompt_builder import PromptBuilder
+from ..utils.metrics import span, PhaseTimer, record_cache, observe_replay_length
+from .search_service import PolicySearchService
+from .storage_service import PolicyBlobStore
+from .view_helpers import PolicyService
+
+logger = logging.getLogger(__name__)
 
 AI_CHAT_URL = config("AI_CHAT_URL")
+AI_EXTRACTION_PROMPT_CHARS = 4000
+AI_EXTRACTION_CACHE_ENABLED = config("AI_EXTRACTION_CACHE_ENABLED", default=True, cast=bool)
+AI_EXTRACTION_CACHE_TTL = config("AI_EXTRACTION_CACHE_TTL", default=30 * 86400, cast=int)
+AI_EXTRACTION_NEGATIVE_TTL = config("AI_EXTRACTION_NEGATIVE_TTL", default=86400, cast=int)
+AI_STREAM_IDLE_TIMEOUT = config("AI_STREAM_IDLE_TIMEOUT", default=30, cast=int)
+MISSING_FIELDS_MESSAGE = "Missing required fields"
+_WHITESPACE_PATTERN = re.compile(r'\s+')
 
 
 # =============================================================================
@@ -17,15 +37,47 @@ class PolicyAIService:
     """Handles AI-related operations such as title extraction and HTML generation."""
 
     @staticmethod
-    def extract_title_version_from_pdf(pdf_text):
+    def extraction_cache_key(pdf_text):
+        """Hash of the whitespace-normalized text the prompt actually sees."""
+        normalized = _WHITESPACE_PATTERN.sub(' ', pdf_text[:AI_EXTRACTION_PROMPT_CHARS]).strip()
+        return f"ai_title_version:{hashlib.sha256(normalized.encode('utf-8')).hexdigest()}"
+
+    @staticmethod
+    def extract_title_version_from_pdf(pdf_text, bypass_cache=False):
         """
         Extract policy title and version from PDF text content using AI.
+
+        Answers are memoized in the "ai_extraction" cache: successful extractions for
+        AI_EXTRACTION_CACHE_TTL, answers with a missing title/version for the shorter
+        AI_EXTRACTION_NEGATIVE_TTL. Timeouts and transport errors are never cached.
+        bypass_cache forces a fresh call and overwrites the stored answer.
         """
+        if not AI_EXTRACTION_CACHE_ENABLED:
+            return PolicyAIService._request_title_version(pdf_text)
+
+        store = caches["ai_extraction"]
+        cache_key = PolicyAIService.extraction_cache_key(pdf_text)
+        if not bypass_cache:
+            cached = store.get(cache_key)
+            record_cache("ai_extraction", cached is not None)
+            if cached is not None:
+                result, extracted_data = cached
+                return {**result, "cached": True}, extracted_data
+
+        result, extracted_data = PolicyAIService._request_title_version(pdf_text)
+        if extracted_data is not None:
+            store.set(cache_key, (result, extracted_data), AI_EXTRACTION_CACHE_TTL)
+        elif result["message"].startswith(MISSING_FIELDS_MESSAGE):
+            store.set(cache_key, (result, extracted_data), AI_EXTRACTION_NEGATIVE_TTL)
+        return result, extracted_data
+
+    @staticmethod
+    def _request_title_version(pdf_text):
         prompt = f"""
         Analyze the following PDF text content and extract the policy title and version number.
 
         PDF CONTENT:
-        {pdf_text[:4000]}
+        {pdf_text[:AI_EXTRACTION_PROMPT_CHARS]}
 
         INSTRUCTIONS:
         1. Identify the main policy title — look for the most prominent heading or title.
@@ -41,7 +93,8 @@ class PolicyAIService:
 
         payload = {"query": prompt}
         try:
-            response = requests.post(AI_CHAT_URL, json=payload, timeout=30)
+            with span("llm"):
+                response = requests.post(AI_CHAT_URL, json=payload, timeout=30)
             response.raise_for_status()
             response_text = response.json().get("response", "").strip()
             response_text = response_text.replace("```json", "").replace("```", "").strip()
@@ -56,7 +109,7 @@ class PolicyAIService:
             if missing_fields:
                 return {
                     "status": 400,
-                    "message": f"Missing required fields: {', '.join(missing_fields)}",
+                    "message": f"{MISSING_FIELDS_MESSAGE}: {', '.join(missing_fields)}",
                     "missing_fields": missing_fields,
                     "extracted_data": extracted_data,
                 }, None
@@ -75,7 +128,7 @@ class PolicyAIService:
                 "extracted_data": {"title": None, "version": None},
             }, None
         except Exception as e:
-            print(f"PDF extraction failed: {str(e)}")
+            logger.warning("AI title/version extraction failed: %s", e)
             return {
                 "status": 400,
                 "message": f"Failed to extract title and version: {str(e)}",
@@ -84,15 +137,20 @@ class PolicyAIService:
             }, None
 
     @staticmethod
-    def format_html_with_ai(template, title, department, category, organization_name, organization_logo):
+    def build_generation_prompt(template, title, department, category, organization_name):
         """
-        Generate policy HTML content using AI based on department & category.
+        Build the policy generation prompt. The template is condensed to a token-budgeted
+        outline (see PromptBuilder) rather than sent verbatim, so prompt size no longer grows
+        with the stored template's markup.
         """
+        template_outline, prompt_stats = PromptBuilder.build_template_context(template)
         prompt = f"""
         Create a detailed policy document in HTML format based on {department} and {category}.
-        Read the whole {template} template provided below and use it to structure the new policy document,
+        Read the whole template outline provided below and use it to structure the new policy document,
         and give your best to fill in relevant content.
-        
+
+        TEMPLATE OUTLINE:
+        {template_outline}
 
         IMPORTANT:
         - Make sure the title in document matches: {title}
@@ -111,34 +169,104 @@ class PolicyAIService:
         - Content must be 100 to 120 words long.
         - Utmost importtant : Description under each heading must be atleast 20 words long.
         """
+        prompt_stats["prompt_tokens"] = PromptBuilder.estimate_tokens(prompt)
+        return prompt, prompt_stats
+
+    @staticmethod
+    def clean_generated_html(response_text):
+        # Clean unwanted formatting
+        response_text = response_text.strip().strip('"\n ')
+        if response_text.startswith("```html"):
+            response_text = response_text[7:]
+        if response_text.endswith("```"):
+            response_text = response_text[:-3]
+        response_text = response_text.strip()
+
+        start_index = response_text.find("<!DOCTYPE html>")
+        if start_index >= 0:
+            response_text = response_text[start_index:]
+        return response_text
 
+    @staticmethod
+    def format_html_with_ai(template, title, department, category, organization_name, organization_logo):
+        """
+        Generate policy HTML content using AI based on department & category.
+        """
+        prompt, prompt_stats = PolicyAIService.build_generation_prompt(template, title, department, category, organization_name)
         payload = {"query": prompt}
 
+        started = time.monotonic()
         try:
-            response = requests.post(AI_CHAT_URL, json=payload, timeout=100)
+            with span("llm"):
+                response = requests.post(AI_CHAT_URL, json=payload, timeout=100)
             response.raise_for_status()
-            response_text = response.json().get("response", "").strip()
-
-            # Clean unwanted formatting
-            response_text = response_text.strip('"\n ')
-            if response_text.startswith("```html"):
-                response_text = response_text[7:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
-            response_text = response_text.strip()
-
-            start_index = response_text.find("<!DOCTYPE html>")
-            if start_index >= 0:
-                response_text = response_text[start_index:]
-
-            return {"status": 200, "message": "Policy generated successfully"}, response_text
+            response_text = response.json().get("response", "")
+            latency_ms = round((time.monotonic() - started) * 1000)
+            logger.info(
+                "AI policy generation: %d prompt tokens in %d ms", prompt_stats["prompt_tokens"], latency_ms,
+                extra={**prompt_stats, "latency_ms": latency_ms},
+            )
+            return {"status": 200, "message": "Policy generated successfully"}, PolicyAIService.clean_generated_html(response_text)
 
         except requests.Timeout:
+            latency_ms = round((time.monotonic() - started) * 1000)
+            logger.warning(
+                "AI policy generation timed out after %d ms", latency_ms,
+                extra={**prompt_stats, "latency_ms": latency_ms},
+            )
             return {"status": 408, "message": "AI service timeout"}, ""
         except Exception as e:
-            print(f"AI policy generation failed: {str(e)}")
+            latency_ms = round((time.monotonic() - started) * 1000)
+            logger.warning(
+                "AI policy generation failed: %s", e,
+                extra={**prompt_stats, "latency_ms": latency_ms},
+            )
             return {"status": 500, "message": f"AI policy generation failed: {str(e)}"}, ""
 
+    @staticmethod
+    def stream_html_with_ai(template, title, department, category, organization_name, organization_logo):
+        """
+        Streaming variant of format_html_with_ai: yields raw text fragments as the model produces them.
+
+        Sends {"query", "stream": true} and reads newline-delimited JSON objects carrying a
+        "response" fragment (Ollama style; an SSE "data:" prefix and a "[DONE]" sentinel are also
+        accepted) until "done". Callers run the concatenation through clean_generated_html.
+        Transport errors and timeouts propagate as requests exceptions.
+        """
+        prompt, prompt_stats = PolicyAIService.build_generation_prompt(template, title, department, category, organization_name)
+        payload = {"query": prompt, "stream": True}
+
+        started = time.monotonic()
+        first_fragment_at = None
+        with requests.post(AI_CHAT_URL, json=payload, stream=True, timeout=(10, AI_STREAM_IDLE_TIMEOUT)) as response:
+            response.raise_for_status()
+            # application/x-ndjson carries no charset; without one iter_lines would hand back bytes.
+            response.encoding = response.encoding or "utf-8"
+            for line in response.iter_lines(decode_unicode=True):
+                line = (line or "").strip()
+                if line.startswith("data:"):
+                    line = line[5:].strip()
+                if not line:
+                    continue
+                if line == "[DONE]":
+                    break
+                message = json.loads(line)
+                fragment = message.get("response", "")
+                if fragment:
+                    if first_fragment_at is None:
+                        first_fragment_at = time.monotonic()
+                    yield fragment
+                if message.get("done"):
+                    break
+        finished = time.monotonic()
+        PhaseTimer.record("llm", finished - started)
+        latency_ms = round((finished - started) * 1000)
+        logger.info(
+            "AI policy generation (stream): %d prompt tokens in %d ms", prompt_stats["prompt_tokens"], latency_ms,
+            extra={**prompt_stats, "latency_ms": latency_ms,
+                   "first_fragment_ms": round(((first_fragment_at or finished) - started) * 1000)},
+        )
+
 
 # =============================================================================
 # POLICY VERSION SERVICE
@@ -161,24 +289,24 @@ class PolicyVersionService:
                 "template": formatted_html,
                 "policy_type": "existingpolicy",
                 "created_at": created_at,
-                "updated_by": updated_by,
             },
         )
 
         # === Case 1: New Policy ===
         if created:
-            print(f"Creating new OrgPolicy '{title}' ({version}) for organization {org.id}")
-            diff_json = compute_html_diff("", formatted_html)
+            logger.info("Creating OrgPolicy %r (%s) for organization %s", title, version, org.id)
+            with span("diff"):
+                diff_json = compute_html_diff("", formatted_html)
 
             policy_version = PolicyVersion.objects.create(
                 org_policy_id=org_policy.id,
                 version=version,
-                diff_data=diff_json,
                 status="draft",
-                checkpoint_template=formatted_html,  # Initial checkpoint
                 created_at=created_at,
-                updated_by=updated_by,
+                # Initial checkpoint
+                **PolicyBlobStore.encode_version(org_policy.id, diff_json, formatted_html),
             )
+            PolicySearchService.index_head(policy_version.id, org_policy, version, formatted_html)
             return {
                 "org_policy_id": org_policy.id,
                 "policy_version_id": policy_version.id,
@@ -187,35 +315,43 @@ class PolicyVersionService:
             }
 
         # === Case 2: Update existing policy ===
-        print(f"Updating OrgPolicy '{title}' to version {version} for org {org.id}")
-        old_html = org_policy.template or ""
-        diff_json = compute_html_diff(old_html, formatted_html)
-        print(f"Diff computed: {len(diff_json.get('changes', []))} changes")
+        logger.info("Updating OrgPolicy %r to version %s for organization %s", title, version, org.id)
+        # Diff against the document readers replay, not org_policy.template, which other writers leave behind.
+        version_index = PolicyService.get_policy_checkpoint_index(org_policy.id)
+        if version_index:
+            with span("replay"):
+                old_html, _, _ = PolicyService.replay_to_position(version_index, len(version_index) - 1)
+        else:
+            old_html = org_policy.template or ""
+        with span("diff"):
+            diff_json = compute_html_diff(old_html, formatted_html)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Diff computed: %d changes", len(diff_json.get("changes", [])))
 
         # Update OrgPolicy template
         org_policy.template = formatted_html
-        org_policy.updated_by = updated_by
         org_policy.updated_at = timezone.now()
         org_policy.save()
 
+        # Checkpoint once replaying from the last one would cost more than the configured budget
+        _, replay_bytes, changes_since_checkpoint = PolicyService.get_checkpoint_debt(org_policy.id)
+        is_checkpoint_version = CheckpointPolicy.should_checkpoint(
+            replay_bytes,
+            changes_since_checkpoint,
+            CheckpointPolicy.step_cost(len(old_html), len(json.dumps(diff_json))),
+            len(diff_json["changes"]),
+        )
+
         # Create new PolicyVersion
         policy_version = PolicyVersion.objects.create(
             org_policy_id=org_policy.id,
             version=version,
-            diff_data=diff_json,
             status="draft",
             created_at=created_at,
-            updated_by=updated_by,
+            **PolicyBlobStore.encode_version(org_policy.id, diff_json, formatted_html if is_checkpoint_version else None),
         )
 
-        # Add checkpoint every 5 versions
-        try:
-            version_num = int(version.strip("V"))
-            if version_num % 5 == 0:
-                policy_version.checkpoint_template = formatted_html
-                policy_version.save(update_fields=["checkpoint_template"])
-        except Exception:
-            pass
+        PolicySearchService.index_head(policy_version.id, org_policy, version, formatted_html)
 
         return {
             "org_policy_id": org_policy.id,
@@ -230,79 +366,36 @@ class PolicyVersionService:
     @staticmethod
     def reconstruct_policy_html_at_version(org_policy_id, target_version):
         """
-        Reconstruct HTML content for a specific policy version.
+        Reconstruct HTML content for a specific policy version, starting from the nearest
+        checkpoint at or before it. An unknown version reconstructs the latest one.
         """
-        all_versions = PolicyVersion.objects.filter(
-            org_policy_id=org_policy_id
-        ).order_by("created_at")
-
-        if not all_versions.exists():
+        version_index = PolicyService.get_policy_checkpoint_index(str(org_policy_id))
+        if not version_index:
             raise ObjectDoesNotExist("No versions found for this policy")
 
-        nearest_checkpoint = PolicyVersion.objects.filter(
-            org_policy_id=org_policy_id,
-            checkpoint_template__isnull=False
-        ).order_by("-created_at").first()
-
-        if nearest_checkpoint:
-            print(f"🧩 Using checkpoint {nearest_checkpoint.version} for reconstruction → target {target_version}")
-            return PolicyVersionService._reconstruct_from_checkpoint(
-                all_versions, nearest_checkpoint, target_version
-            )
-        else:
-            print(f"🧩 No checkpoint found — reconstructing sequentially up to {target_version}")
-            return PolicyVersionService._reconstruct_sequentially(all_versions, target_version)
-
-    @staticmethod
-    def _reconstruct_from_checkpoint(all_versions, checkpoint_version, target_version):
-        """Reconstruct HTML from nearest checkpoint to target version."""
-        current_html = checkpoint_version.checkpoint_template or ""
-        start_applying = False
-
-        for version in all_versions:
-            if version.id == checkpoint_version.id:
-                start_applying = True
-                continue
-
-            if start_applying and version.diff_data:
-                try:
-                    current_html = apply_diff(current_html, version.diff_data)
-                except Exception as e:
-                    print(f"⚠️ Diff apply failed for {version.version}: {e}")
-
-            if version.version == target_version:
-                break
-
-        return current_html
-
-    @staticmethod
-    def _reconstruct_sequentially(all_versions, target_version):
-        """Reconstruct HTML sequentially from version 1 up to target version."""
-        base_version = all_versions.first()
-        current_html = base_version.checkpoint_template or ""
-
-        for version in all_versions:
-            if version.diff_data:
-                try:
-                    current_html = apply_diff(current_html, version.diff_data)
-                except Exception as e:
-                    print(f"⚠️ Diff apply failed for {version.version}: {e}")
-
-            if version.version == target_version:
-                break
-
-        return current_html
+        target_position = PolicyService.find_version_position(version_index, target_version)
+        if target_position is None:
+            target_position = len(version_index) - 1
+        with span("replay"):
+            html, diffs_applied, checkpoint_version = PolicyService.replay_to_position(version_index, target_position)
+        logger.debug("Reconstructed %s from %s with %d diffs", target_version,
+                     f"checkpoint {checkpoint_version}" if checkpoint_version else "the start", diffs_applied)
+        observe_replay_length(diffs_applied)
+        return html
 
 
 # =============================================================================
 # LEGACY COMPATIBILITY ALIASES
 # =============================================================================
-def extract_title_version_from_pdf(pdf_text):
-    return PolicyAIService.extract_title_version_from_pdf(pdf_text)
+def extract_title_version_from_pdf(pdf_text, bypass_cache=False):
+    return PolicyAIService.extract_title_version_from_pdf(pdf_text, bypass_cache)
 
 def format_html_with_ai(template, title, department, category, organization_name, organization_logo):
     return PolicyAIService.format_html_with_ai(template, title, department, category, organization_name, organization_logo)
 
+def stream_html_with_ai(template, title, department, category, organization_name, organization_logo):
+    return PolicyAIService.stream_html_with_ai(template, title, department, category, organization_name, organization_logo)
+
 def create_or_update_policy_with_version(title, html_template, version, org, created_at, updated_by, description=None):
     return PolicyVersionService.create_or_update_policy_with_version(title, html_template, version, org, created_at, updated_by, description)
 
@@ -0,0 +1,173 @@
+import logging
+import re
+from decouple import config
+from django.db import connection, transaction
+from ..utils.pdf_processor import html_to_text
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_HISTORY = config('POLICY_SEARCH_INDEX_HISTORY', default=False, cast=bool)
+SEARCH_MAX_RESULTS = 100
+
+
+class PolicySearchService:
+    """
+    Maintains the policy_search_index table: a tsvector/GIN index on PostgreSQL and an FTS5
+    virtual table on SQLite. Head versions are always indexed; older ones only when history is kept.
+    """
+
+    @staticmethod
+    def _is_postgres():
+        return connection.vendor == 'postgresql'
+
+    @staticmethod
+    def index_version(policy_version_id, org_policy, version, html, is_head=True, keep_history=None):
+        if keep_history is None:
+            keep_history = SEARCH_INDEX_HISTORY
+        if not is_head and not keep_history:
+            return
+        content = html_to_text(html)
+        row = [
+            str(policy_version_id),
+            str(org_policy.id),
+            str(org_policy.organization_id) if org_policy.organization_id else None,
+            org_policy.department,
+            org_policy.title,
+            version,
+        ]
+        # One transaction for the whole replacement, so a reader never sees two heads or none.
+        with transaction.atomic(using=connection.alias, savepoint=False), connection.cursor() as cursor:
+            if is_head and PolicySearchService._is_postgres():
+                # Writers append under this row lock, so while it is held the newest version cannot
+                # change: one that is no longer the newest (a rebuild racing an edit) is not made head.
+                cursor.execute(
+                    """
+                    SELECT (SELECT id FROM policy_versions WHERE org_policy_id = org_policies.id
+                            ORDER BY created_at DESC LIMIT 1)
+                    FROM org_policies WHERE id = %s FOR UPDATE
+                    """,
+                    [str(org_policy.id)],
+                )
+                head = cursor.fetchone()
+                if head and head[0] is not None and str(head[0]) != str(policy_version_id):
+                    if not keep_history:
+                        return
+                    is_head = False
+            if is_head:
+                if keep_history:
+                    cursor.execute("UPDATE policy_search_index SET is_head = %s WHERE org_policy_id = %s", [False, str(org_policy.id)])
+                else:
+                    cursor.execute("DELETE FROM policy_search_index WHERE org_policy_id = %s", [str(org_policy.id)])
+            if PolicySearchService._is_postgres():
+                cursor.execute(
+                    """
+                    INSERT INTO policy_search_index
+                    (policy_version_id, org_policy_id, organization_id, department, title, version, is_head, content, indexed_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())
+                    ON CONFLICT (policy_version_id) DO UPDATE SET
+                        organization_id = EXCLUDED.organization_id,
+                        department = EXCLUDED.department,
+                        title = EXCLUDED.title,
+                        version = EXCLUDED.version,
+                        is_head = EXCLUDED.is_head,
+                        content = EXCLUDED.content,
+                        indexed_at = NOW()
+                    """,
+                    row + [is_head, content],
+                )
+            else:
+                cursor.execute("DELETE FROM policy_search_index WHERE policy_version_id = %s", [row[0]])
+                cursor.execute(
+                    """
+                    INSERT INTO policy_search_index
+                    (policy_version_id, org_policy_id, organization_id, department, title, version, is_head, content)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    row + [1 if is_head else 0, content],
+                )
+
+    @staticmethod
+    def index_head(policy_version_id, org_policy, version, html):
+        """
+        Index a freshly written head version inside the transaction that wrote it, while that
+        transaction still holds the org_policies row lock, so concurrent edits replace the head
+        in the order they were written. A failure is logged and rolls back only the index rows.
+        """
+        try:
+            with transaction.atomic():
+                PolicySearchService.index_version(policy_version_id, org_policy, version, html)
+        except Exception:
+            logger.exception("Indexing policy version %s failed", policy_version_id,
+                             extra={"policy_version_id": str(policy_version_id)})
+
+    @staticmethod
+    def _fts5_query(query):
+        terms = re.findall(r'\w+', query, flags=re.UNICODE)
+        return " ".join(f'"{term}"' for term in terms)
+
+    @staticmethod
+    def search(query, organization_id, department=None, include_history=False, limit=20):
+        limit = max(1, min(int(limit), SEARCH_MAX_RESULTS))
+        filters = ["organization_id = %s"]
+        params = [str(organization_id)]
+        if department:
+            filters.append("department = %s")
+            params.append(department)
+        if PolicySearchService._is_postgres():
+            if not include_history:
+                filters.append("is_head")
+            sql = f"""
+                SELECT ranked.policy_version_id, ranked.org_policy_id, ranked.title, ranked.version,
+                       ranked.department, ranked.is_head, ranked.rank,
+                       ts_headline('english', ranked.content, ranked.query, 'MaxFragments=2, MaxWords=25, MinWords=8') AS snippet
+                FROM (
+                    SELECT policy_version_id, org_policy_id, title, version, department, is_head, content, query,
+                           ts_rank(search_vector, query) AS rank
+                    FROM policy_search_index, websearch_to_tsquery('english', %s) AS query
+                    WHERE search_vector @@ query AND {' AND '.join(filters)}
+                    ORDER BY rank DESC
+                    LIMIT %s
+                ) AS ranked
+                ORDER BY ranked.rank DESC
+            """
+            params = [query] + params + [limit]
+        else:
+            match = PolicySearchService._fts5_query(query)
+            if not match:
+                return []
+            if not include_history:
+                filters.append("is_head = 1")
+            sql = f"""
+                SELECT policy_version_id, org_policy_id, title, version, department, is_head,
+                       -bm25(policy_search_index) AS rank,
+                       snippet(policy_search_index, 7, '<b>', '</b>', '...', 25) AS snippet
+                FROM policy_search_index
+                WHERE policy_search_index MATCH %s AND {' AND '.join(filters)}
+                ORDER BY bm25(policy_search_index)
+                LIMIT %s
+            """
+            params = [match] + params + [limit]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return [
+            {
+                "policy_version_id": str(policy_version_id),
+                "org_policy_id": str(org_policy_id),
+                "title": title,
+                "version": version,
+                "department": department,
+                "is_head": bool(is_head),
+                "rank": float(rank),
+                "snippet": snippet,
+            }
+            for policy_version_id, org_policy_id, title, version, department, is_head, rank, snippet in rows
+        ]
+
+
+def index_policy_version(policy_version_id, org_policy, version, html, is_head=True, keep_history=None):
+    return PolicySearchService.index_version(policy_version_id, org_policy, version, html, is_head, keep_history)
+
+
+def search_policies(query, organization_id, department=None, include_history=False, limit=20):
+    return PolicySearchService.search(query, organization_id, department, include_history, limit)
@@ -0,0 +1,384 @@
+import json
+import logging
+import time
+from decouple import config
+from django.core.cache import cache
+from django.db import connection, transaction
+from ..utils.blob_codec import BlobCodec
+from .chunk_store import CHUNK_CODEC, CHUNK_MIN_BYTES, CHUNK_STORE_ENABLED, PolicyChunkStore
+from ..utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+STORAGE_SCAN_BATCH_SIZE = 500
+STORAGE_COMPRESSION = config('POLICY_STORAGE_COMPRESSION', default='zlib')  # "", "zlib" or "zstd"
+COMPRESS_CHECKPOINT_MIN_BYTES = config('POLICY_COMPRESS_CHECKPOINT_MIN_BYTES', default=2048, cast=int)
+COMPRESS_DIFF_MIN_BYTES = config('POLICY_COMPRESS_DIFF_MIN_BYTES', default=64 * 1024, cast=int)
+DICTIONARY_LOOKUP_TTL = 300
+DICTIONARY_MAX_SAMPLES = 200
+LONG_CHAIN_VERSIONS = config('POLICY_LONG_CHAIN_VERSIONS', default=50, cast=int)
+EXPENSIVE_REPLAY_BYTES = config('POLICY_EXPENSIVE_REPLAY_BYTES', default=50 * 1024 * 1024, cast=int)
+
+STORAGE_SCAN_SQL = """
+    SELECT pv.org_policy_id,
+           op.organization_id,
+           COALESCE(octet_length(pv.diff_blob), octet_length(pv.diff_data::text), 0),
+           COALESCE(octet_length(pv.checkpoint_blob), octet_length(NULLIF(pv.checkpoint_template, '')), 0),
+           CASE WHEN jsonb_typeof(pv.diff_data->'changes') = 'array'
+                THEN jsonb_array_length(pv.diff_data->'changes')
+                ELSE COALESCE((pv.diff_data->>'change_count')::int, 0) END
+    FROM policy_versions pv
+    LEFT JOIN org_policies op ON op.id = pv.org_policy_id
+    {where}
+    ORDER BY pv.org_policy_id, pv.created_at, pv.id
+"""
+
+
+class PolicyStorageService:
+    """
+    Storage footprint and chain health of policy_versions, computed in one ordered pass.
+    Sizes are as stored, i.e. compressed or chunk references where PolicyBlobStore encoded the row.
+
+    Replay cost is estimated in bytes processed: apply_diff splits and re-joins the whole
+    document for every version it applies, so each replayed version costs roughly the
+    document size plus its own diff. The document size is taken from the latest checkpoint,
+    or from the first version's diff when a policy has none.
+    """
+
+    @staticmethod
+    def _new_policy_stats(org_policy_id, organization_id):
+        return {
+            "org_policy_id": str(org_policy_id),
+            "organization_id": str(organization_id) if organization_id else None,
+            "versions": 0,
+            "changes": 0,
+            "diff_bytes": 0,
+            "largest_diff_bytes": 0,
+            "checkpoints": 0,
+            "checkpoint_bytes": 0,
+            "last_checkpoint_bytes": 0,
+            "chain_since_checkpoint": 0,
+            "diff_bytes_since_checkpoint": 0,
+            "first_diff_bytes": 0,
+        }
+
+    @staticmethod
+    def _finish_policy_stats(stats):
+        first_diff_bytes = stats.pop("first_diff_bytes")
+        document_bytes = stats.pop("last_checkpoint_bytes") or first_diff_bytes
+        stats["estimated_document_bytes"] = document_bytes
+        # Checkpoints are placed by CheckpointPolicy once the replay cost accumulated since the last one
+        # exceeds its budget, and readers start from the nearest checkpoint; full_replay_cost is what
+        # the same read would cost with no checkpoints at all.
+        stats["full_replay_cost"] = stats["versions"] * document_bytes + stats["diff_bytes"]
+        stats["checkpoint_replay_cost"] = (
+            (document_bytes if stats["checkpoints"] else 0)
+            + stats["chain_since_checkpoint"] * document_bytes + stats["diff_bytes_since_checkpoint"]
+        )
+        flags = []
+        if stats["chain_since_checkpoint"] >= LONG_CHAIN_VERSIONS:
+            flags.append("long_chain")
+        if stats["full_replay_cost"] >= EXPENSIVE_REPLAY_BYTES:
+            flags.append("expensive_replay")
+        if stats["checkpoints"] > 1 and stats["checkpoint_bytes"] > stats["diff_bytes"]:
+            flags.append("checkpoint_heavy")
+        stats["flags"] = flags
+        return stats
+
+    @staticmethod
+    def iter_policy_stats(organization_id=None, batch_size=STORAGE_SCAN_BATCH_SIZE):
+        """Yield one stats dict per policy, reading rows through a server-side cursor in batches."""
+        where, params = "", []
+        if organization_id:
+            where, params = "WHERE op.organization_id = %s", [str(organization_id)]
+        # Named (server-side) cursors only live inside a transaction.
+        with transaction.atomic(), connection.chunked_cursor() as cursor:
+            cursor.execute(STORAGE_SCAN_SQL.format(where=where), params)
+            stats = None
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for org_policy_id, org_id, diff_bytes, checkpoint_bytes, changes in rows:
+                    if stats is None or stats["org_policy_id"] != str(org_policy_id):
+                        if stats is not None:
+                            yield PolicyStorageService._finish_policy_stats(stats)
+                        stats = PolicyStorageService._new_policy_stats(org_policy_id, org_id)
+                        stats["first_diff_bytes"] = diff_bytes
+                    stats["versions"] += 1
+                    stats["changes"] += changes
+                    stats["diff_bytes"] += diff_bytes
+                    stats["largest_diff_bytes"] = max(stats["largest_diff_bytes"], diff_bytes)
+                    if checkpoint_bytes:
+                        stats["checkpoints"] += 1
+                        stats["checkpoint_bytes"] += checkpoint_bytes
+                        stats["last_checkpoint_bytes"] = checkpoint_bytes
+                        stats["chain_since_checkpoint"] = 0
+                        stats["diff_bytes_since_checkpoint"] = 0
+                    else:
+                        stats["chain_since_checkpoint"] += 1
+                        stats["diff_bytes_since_checkpoint"] += diff_bytes
+            if stats is not None:
+                yield PolicyStorageService._finish_policy_stats(stats)
+
+    @staticmethod
+    def build_report(organization_id=None, batch_size=STORAGE_SCAN_BATCH_SIZE, top=20):
+        """Totals per organization plus the top policies by replay cost and by storage."""
+        organizations = {}
+        worst_replay, worst_storage = [], []
+        policies = 0
+        for stats in PolicyStorageService.iter_policy_stats(organization_id, batch_size):
+            policies += 1
+            org = organizations.setdefault(stats["organization_id"], {
+                "organization_id": stats["organization_id"],
+                "policies": 0, "versions": 0, "diff_bytes": 0, "checkpoint_bytes": 0,
+                "full_replay_cost": 0, "flagged_policies": 0,
+            })
+            org["policies"] += 1
+            org["versions"] += stats["versions"]
+            org["diff_bytes"] += stats["diff_bytes"]
+            org["checkpoint_bytes"] += stats["checkpoint_bytes"]
+            org["full_replay_cost"] += stats["full_replay_cost"]
+            org["flagged_policies"] += bool(stats["flags"])
+            # Keep only the running top-N lists so memory stays flat however many policies there are.
+            worst_replay = sorted(worst_replay + [stats], key=lambda row: row["full_replay_cost"], reverse=True)[:top]
+            worst_storage = sorted(
+                worst_storage + [stats], key=lambda row: row["diff_bytes"] + row["checkpoint_bytes"], reverse=True
+            )[:top]
+        return {
+            "policies": policies,
+            "organizations": sorted(organizations.values(), key=lambda row: row["diff_bytes"] + row["checkpoint_bytes"], reverse=True),
+            "compaction_candidates": [row for row in worst_replay if row["flags"]],
+            "worst_replay_cost": worst_replay,
+            "largest_storage": worst_storage,
+        }
+
+
+# Dictionary rows are never updated in place (retraining inserts a new row), so they can be kept for the process lifetime.
+_dictionaries = {}
+
+
+class PolicyBlobStore:
+    """
+    Transparent compression of checkpoint_template and oversized diff_data (migration 0003).
+
+    A compressed value moves to checkpoint_blob / diff_blob and the row's storage_codec tag
+    records how to decode it (see BlobCodec). checkpoint_template is then NULL and diff_data
+    keeps a small stub with the line counts, lengths and change count that SQL readers use
+    without touching the blob. Blobs are only decoded when a replay actually needs the row.
+    Compression uses the newest dictionary trained for the policy's template (matched on
+    title, as initialise does), else the newest global one, else none. With POLICY_CHUNK_STORE
+    on, rows reference shared chunks instead (codec "chunks", see PolicyChunkStore).
+    """
+
+    @staticmethod
+    def dictionary(dictionary_id):
+        if dictionary_id not in _dictionaries:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT dictionary FROM policy_compression_dicts WHERE id = %s", [dictionary_id])
+                row = cursor.fetchone()
+            if row is None:
+                raise LookupError(f"Compression dictionary {dictionary_id} is missing")
+            _dictionaries[dictionary_id] = bytes(row[0])
+        return _dictionaries[dictionary_id]
+
+    @staticmethod
+    def dictionary_for_policy(org_policy_id, codec):
+        cache_key = f"policy_compression_dict:{org_policy_id}:{codec}"
+        dictionary_id = cache.get(cache_key)
+        if dictionary_id is None:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT d.id FROM policy_compression_dicts d
+                    WHERE d.codec = %s AND (d.policy_template_id IS NULL OR d.policy_template_id IN (
+                        SELECT pt.id FROM policy_templates pt JOIN org_policies op ON op.title = pt.title WHERE op.id = %s))
+                    ORDER BY d.policy_template_id IS NULL, d.id DESC LIMIT 1
+                    """,
+                    [codec, str(org_policy_id)],
+                )
+                row = cursor.fetchone()
+            dictionary_id = row[0] if row else 0
+            cache.set(cache_key, dictionary_id, DICTIONARY_LOOKUP_TTL)
+        return dictionary_id or None
+
+    @staticmethod
+    def _compress(text, codec, dictionary_id):
+        dictionary = PolicyBlobStore.dictionary(dictionary_id) if dictionary_id else None
+        return BlobCodec.compress(text.encode("utf-8"), codec, dictionary)
+
+    @staticmethod
+    def encode_version(org_policy_id, diff_json, checkpoint_html, codec=None):
+        """
+        Column values for a policy_versions row: diff_data (a dict), diff_blob, checkpoint_template,
+        checkpoint_blob, storage_codec and changes_count. Values stay uncompressed when compression
+        is off, they are below the size thresholds, or compressing does not make them smaller.
+        """
+        # Counted here so listings read a plain integer instead of the (TOASTed) diff.
+        changes_count = len(diff_json.get("changes") or []) if isinstance(diff_json, dict) else 0
+        if codec == CHUNK_CODEC or (codec is None and CHUNK_STORE_ENABLED):
+            with span("chunk_store"):
+                return {**PolicyChunkStore.encode_version(diff_json, checkpoint_html), "changes_count": changes_count}
+        codec = STORAGE_COMPRESSION if codec is None else codec
+        columns = {"diff_data": diff_json, "diff_blob": None, "checkpoint_template": checkpoint_html,
+                   "checkpoint_blob": None, "storage_codec": None, "changes_count": changes_count}
+        if not codec:
+            return columns
+        diff_text = json.dumps(diff_json) if diff_json is not None else ""
+        wants_checkpoint = bool(checkpoint_html) and len(checkpoint_html) >= COMPRESS_CHECKPOINT_MIN_BYTES
+        wants_diff = len(diff_text) >= COMPRESS_DIFF_MIN_BYTES
+        if not wants_checkpoint and not wants_diff:
+            return columns
+        dictionary_id = PolicyBlobStore.dictionary_for_policy(org_policy_id, codec)
+        with span("compress"):
+            if wants_checkpoint:
+                blob = PolicyBlobStore._compress(checkpoint_html, codec, dictionary_id)
+                if len(blob) < len(checkpoint_html.encode("utf-8")):
+                    columns["checkpoint_template"], columns["checkpoint_blob"] = None, blob
+            if wants_diff:
+                blob = PolicyBlobStore._compress(diff_text, codec, dictionary_id)
+                if len(blob) < len(diff_text):
+                    columns["diff_blob"] = blob
+                    columns["diff_data"] = {
+                        "compressed": True,
+                        "old_line_count": diff_json.get("old_line_count"),
+                        "new_line_count": diff_json.get("new_line_count"),
+                        "old_length": diff_json.get("old_length"),
+                        "new_length": diff_json.get("new_length"),
+                        "change_count": changes_count,
+                        "raw_bytes": len(diff_text),
+                    }
+        if columns["checkpoint_blob"] is not None or columns["diff_blob"] is not None:
+            columns["storage_codec"] = BlobCodec.make_tag(codec, dictionary_id)
+        return columns
+
+    @staticmethod
+    def decode(blob, tag):
+        codec, dictionary_id = BlobCodec.parse_tag(tag)
+        dictionary = PolicyBlobStore.dictionary(dictionary_id) if dictionary_id is not None else None
+        with span("decompress"):
+            return BlobCodec.decompress(blob, codec, dictionary).decode("utf-8")
+
+    @staticmethod
+    def diff_text(diff_data_str, diff_blob, tag, chunks=None):
+        """
+        The full diff JSON text of a row, whichever column holds it. chunks is an optional
+        PolicyChunkStore.prefetch() result; chunks missing from it are fetched for this row.
+        """
+        if tag == CHUNK_CODEC and diff_data_str:
+            return json.dumps(PolicyChunkStore.expand_diff(json.loads(diff_data_str), chunks))
+        return PolicyBlobStore.decode(diff_blob, tag) if diff_blob is not None else diff_data_str
+
+    @staticmethod
+    def checkpoint_html(checkpoint_template, checkpoint_blob, tag, chunks=None):
+        if tag == CHUNK_CODEC and checkpoint_blob is not None:
+            return PolicyChunkStore.expand_checkpoint(checkpoint_blob, chunks)
+        return PolicyBlobStore.decode(checkpoint_blob, tag) if checkpoint_blob is not None else checkpoint_template
+
+    @staticmethod
+    def train_dictionaries(codec="zlib", template_ids=None, max_samples=DICTIONARY_MAX_SAMPLES):
+        """
+        Train one dictionary per policy template from the template text and the latest
+        checkpoints of policies created from it. Returns [(template_id, dictionary_id, samples)].
+        """
+        trained = []
+        with connection.cursor() as cursor:
+            if template_ids:
+                cursor.execute("SELECT id, title, template FROM policy_templates WHERE id = ANY(%s::uuid[])",
+                               [[str(template_id) for template_id in template_ids]])
+            else:
+                cursor.execute("SELECT id, title, template FROM policy_templates WHERE title IS NOT NULL")
+            templates = cursor.fetchall()
+        for template_id, title, template_html in templates:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT DISTINCT ON (pv.org_policy_id) pv.checkpoint_template, pv.checkpoint_blob, pv.storage_codec
+                    FROM policy_versions pv JOIN org_policies op ON op.id = pv.org_policy_id
+                    WHERE op.title = %s AND (pv.checkpoint_blob IS NOT NULL OR COALESCE(octet_length(pv.checkpoint_template), 0) > 0)
+                    ORDER BY pv.org_policy_id, pv.created_at DESC
+                    LIMIT %s
+                    """,
+                    [title, max_samples],
+                )
+                samples = [PolicyBlobStore.checkpoint_html(*row) for row in cursor.fetchall()]
+            if template_html:
+                samples.append(template_html)
+            if not samples:
+                continue
+            dictionary = BlobCodec.build_dictionary(samples, codec)
+            if not dictionary:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    INSERT INTO policy_compression_dicts (policy_template_id, codec, dictionary, sample_count, created_at)
+                    VALUES (%s, %s, %s, %s, NOW()) RETURNING id
+                    """,
+                    [str(template_id), codec, dictionary, len(samples)],
+                )
+                trained.append((str(template_id), cursor.fetchone()[0], len(samples)))
+        return trained
+
+    @staticmethod
+    def compress_existing(organization_id=None, codec=None, batch_size=STORAGE_SCAN_BATCH_SIZE, sleep_seconds=0.0):
+        """
+        Backfill: compress stored rows that are over the thresholds, one small transaction per
+        batch (SKIP LOCKED, so rows a live request holds are left for the next run).
+        Returns (rows_compressed, bytes_before, bytes_after).
+        """
+        codec = codec or STORAGE_COMPRESSION or "zlib"
+        checkpoint_min, diff_min = ((CHUNK_MIN_BYTES, CHUNK_MIN_BYTES) if codec == CHUNK_CODEC
+                                    else (COMPRESS_CHECKPOINT_MIN_BYTES, COMPRESS_DIFF_MIN_BYTES))
+        where = "op.organization_id = %s AND " if organization_id else ""
+        params = [str(organization_id)] if organization_id else []
+        last_id = "00000000-0000-0000-0000-000000000000"
+        compressed = bytes_before = bytes_after = 0
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    SELECT pv.id, pv.org_policy_id, pv.diff_data::text, pv.checkpoint_template
+                    FROM policy_versions pv JOIN org_policies op ON op.id = pv.org_policy_id
+                    WHERE {where}pv.id > %s AND pv.storage_codec IS NULL
+                      AND (COALESCE(octet_length(pv.checkpoint_template), 0) >= %s OR octet_length(pv.diff_data::text) >= %s)
+                    ORDER BY pv.id LIMIT %s
+                    FOR UPDATE OF pv SKIP LOCKED
+                    """,
+                    params + [last_id, checkpoint_min, diff_min, batch_size],
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                updates = []
+                for version_id, org_policy_id, diff_data_str, checkpoint_template in rows:
+                    columns = PolicyBlobStore.encode_version(
+                        org_policy_id, json.loads(diff_data_str) if diff_data_str else None, checkpoint_template, codec,
+                    )
+                    if columns["storage_codec"] is None:
+                        continue
+                    bytes_before += len(diff_data_str or "") + len(checkpoint_template or "")
+                    bytes_after += (len(columns["diff_blob"] or b"") or len(json.dumps(columns["diff_data"])))
+                    bytes_after += len(columns["checkpoint_blob"] or b"") or len(columns["checkpoint_template"] or "")
+                    updates.append((json.dumps(columns["diff_data"]) if columns["diff_data"] is not None else None,
+                                    columns["diff_blob"], columns["checkpoint_template"], columns["checkpoint_blob"],
+                                    columns["storage_codec"], str(version_id)))
+                if updates:
+                    cursor.executemany(
+                        """
+                        UPDATE policy_versions SET diff_data = %s::jsonb, diff_blob = %s, checkpoint_template = %s,
+                            checkpoint_blob = %s, storage_codec = %s
+                        WHERE id = %s
+                        """,
+                        updates,
+                    )
+                compressed += len(updates)
+                last_id = str(rows[-1][0])
+            logger.info("Compressed %d policy_versions rows so far", compressed, extra={"compressed_rows": compressed})
+            if sleep_seconds:
+                time.sleep(sleep_seconds)
+        return compressed, bytes_before, bytes_after
+
+
+def build_storage_report(organization_id=None, batch_size=STORAGE_SCAN_BATCH_SIZE, top=20):
+    return PolicyStorageService.build_report(organization_id, batch_size, top)
@@ -1,9 +1,18 @@
+import base64
 import json
 import uuid
+from datetime import datetime
 from django.http import JsonResponse
 from django.db import transaction, connection
 from io import BytesIO
 from xhtml2pdf import pisa
+from ..utils.diff_utils import squash_chain, apply_diff, DiffProcessor
+from ..utils.metrics import span
+from .chunk_store import PolicyChunkStore
+from .storage_service import PolicyBlobStore
+
+REPLAY_BATCH_SIZE = 200
+
 
 class PolicyService:
     @staticmethod
@@ -44,14 +53,222 @@ class PolicyService:
             )
             return cursor.fetchone()
 
+    @staticmethod
+    def get_policy_version_index(org_policy_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT id, version, created_at FROM policy_versions WHERE org_policy_id = %s ORDER BY created_at ASC",
+                [org_policy_id],
+            )
+            return cursor.fetchall()
+
+    @staticmethod
+    def get_policy_checkpoint_index(org_policy_id):
+        """(id, version, status, created_at, has_checkpoint) per version; octet_length reads the TOAST header, not the blob."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT id, version, status, created_at,
+                       checkpoint_blob IS NOT NULL OR COALESCE(octet_length(checkpoint_template), 0) > 0
+                FROM policy_versions WHERE org_policy_id = %s ORDER BY created_at ASC
+                """,
+                [org_policy_id],
+            )
+            return cursor.fetchall()
+
+    @staticmethod
+    def find_version_position(version_index, version):
+        return next((position for position, row in enumerate(version_index) if row[1] == version), None)
+
+    @staticmethod
+    def load_replay_rows(version_ids, checkpoint_ids):
+        """
+        {version_id: (diff_text, checkpoint_html)} for a stretch of chain, decoded and in one query.
+        Versions in checkpoint_ids contribute only their checkpoint, every other one only its diff.
+        """
+        if not version_ids:
+            return {}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT id,
+                       CASE WHEN id = ANY(%s::uuid[]) THEN NULL ELSE diff_data::text END,
+                       CASE WHEN id = ANY(%s::uuid[]) THEN NULL ELSE diff_blob END,
+                       CASE WHEN id = ANY(%s::uuid[]) THEN checkpoint_template END,
+                       CASE WHEN id = ANY(%s::uuid[]) THEN checkpoint_blob END,
+                       storage_codec
+                FROM policy_versions WHERE id = ANY(%s::uuid[])
+                """,
+                [list(checkpoint_ids)] * 4 + [list(version_ids)],
+            )
+            rows = cursor.fetchall()
+        # Every chunk the stretch references, in one query rather than one per row.
+        chunks = PolicyChunkStore.prefetch((row[1], row[4], row[5]) for row in rows)
+        return {
+            str(version_id): (
+                PolicyBlobStore.diff_text(diff_data_str, diff_blob, codec, chunks),
+                PolicyBlobStore.checkpoint_html(checkpoint_template, checkpoint_blob, codec, chunks)
+                if checkpoint_template is not None or checkpoint_blob is not None else None,
+            )
+            for version_id, diff_data_str, diff_blob, checkpoint_template, checkpoint_blob, codec in rows
+        }
+
+    @staticmethod
+    def replay_step(html, diff_text, checkpoint_html):
+        """
+        One version of the chain: a version with a checkpoint is its checkpoint, any other applies
+        its diff to the version before it. Every reader rebuilds documents through this rule.
+        """
+        if checkpoint_html is not None:
+            return checkpoint_html, False
+        if diff_text and diff_text.strip():
+            try:
+                return apply_diff(html, json.loads(diff_text)), True
+            except Exception:
+                pass
+        return html, False
+
+    @staticmethod
+    def iter_replay(version_index, target_positions=None, stats=None, batch_size=REPLAY_BATCH_SIZE):
+        """
+        Walk a checkpoint index (see get_policy_checkpoint_index) once and yield (position, html) at
+        each target position in ascending order, every position when target_positions is None.
+        The walk starts at the nearest checkpoint at or before the first target and reads rows
+        batch_size at a time, so one document is held at a time. stats, when given, receives
+        diffs_applied and checkpoint_version (the last checkpoint the walk started from).
+        """
+        stats = {} if stats is None else stats
+        stats.update(diffs_applied=0, checkpoint_version=None)
+        targets = sorted(set(range(len(version_index)) if target_positions is None else target_positions))
+        if not targets:
+            return
+        start = next((position for position in range(targets[0], -1, -1) if version_index[position][4]), 0)
+        html = ""
+        next_target = 0
+        for batch_start in range(start, targets[-1] + 1, batch_size):
+            batch = version_index[batch_start:min(batch_start + batch_size, targets[-1] + 1)]
+            rows = PolicyService.load_replay_rows(
+                [str(row[0]) for row in batch], [str(row[0]) for row in batch if row[4]],
+            )
+            for offset, row in enumerate(batch):
+                diff_text, checkpoint_html = rows.get(str(row[0]), (None, None))
+                html, applied = PolicyService.replay_step(html, diff_text, checkpoint_html)
+                stats["diffs_applied"] += applied
+                if checkpoint_html is not None:
+                    stats["checkpoint_version"] = row[1]
+                if batch_start + offset == targets[next_target]:
+                    yield targets[next_target], html
+                    next_target += 1
+
+    @staticmethod
+    def replay_to_position(version_index, target_position):
+        """
+        Rebuild the HTML at target_position starting from the nearest checkpoint at or before it.
+        Returns (html, diffs_applied, checkpoint_version) where checkpoint_version is None for a replay from "".
+        """
+        stats = {}
+        html = ""
+        for _, html in PolicyService.iter_replay(version_index, [target_position], stats):
+            pass
+        return html, stats["diffs_applied"], stats["checkpoint_version"]
+
+    @staticmethod
+    def get_checkpoint_debt(org_policy_id):
+        """
+        Replay cost accumulated since the policy's last checkpoint: (versions, replay_bytes, changes).
+        Each version costs the length of the document it applies to (its stored old_length) plus its diff.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT COUNT(*),
+                       COALESCE(SUM(COALESCE((diff_data->>'raw_bytes')::bigint, octet_length(diff_data::text))
+                                    + COALESCE((diff_data->>'old_length')::bigint, 0)), 0),
+                       COALESCE(SUM(CASE WHEN jsonb_typeof(diff_data->'changes') = 'array'
+                                         THEN jsonb_array_length(diff_data->'changes')
+                                         ELSE COALESCE((diff_data->>'change_count')::int, 0) END), 0)
+                FROM policy_versions
+                WHERE org_policy_id = %s AND created_at > COALESCE(
+                    (SELECT MAX(created_at) FROM policy_versions
+                     WHERE org_policy_id = %s
+                       AND (checkpoint_blob IS NOT NULL OR COALESCE(octet_length(checkpoint_template), 0) > 0)),
+                    '-infinity'::timestamptz)
+                """,
+                [str(org_policy_id), str(org_policy_id)],
+            )
+            versions, replay_bytes, changes = cursor.fetchone()
+            return versions, int(replay_bytes), int(changes)
+
+    @staticmethod
+    def get_policy_version_diffs(version_ids):
+        if not version_ids:
+            return {}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT id, diff_data::text, diff_blob, storage_codec FROM policy_versions WHERE id = ANY(%s::uuid[])",
+                [[str(version_id) for version_id in version_ids]],
+            )
+            rows = cursor.fetchall()
+        chunks = PolicyChunkStore.prefetch((row[1], None, row[3]) for row in rows)
+        return {str(row[0]): PolicyBlobStore.diff_text(*row[1:], chunks) for row in rows}
+
+    @staticmethod
+    def compose_version_range(version_index, from_position, to_position):
+        """
+        Compose the stored deltas after from_position up to to_position of a checkpoint index into
+        one diff. Returns None when the chain does not link up, or a checkpoint inside the range
+        replaces the document, and the caller must rebuild instead.
+        """
+        if any(row[4] for row in version_index[from_position + 1:to_position + 1]):
+            return None
+        range_ids = [str(row[0]) for row in version_index[from_position:to_position + 1]]
+        diffs_by_id = PolicyService.get_policy_version_diffs(range_ids)
+        diffs = [DiffProcessor.load_diff(diffs_by_id.get(version_id)) for version_id in range_ids]
+        # diffs[0] belongs to the starting version; only its line counts are used.
+        anchor = diffs[0]
+        if anchor is None:
+            return None
+        line_count = anchor.get("new_line_count")
+        identity = {
+            "changes": [],
+            "old_line_count": line_count,
+            "new_line_count": line_count,
+            "old_length": anchor.get("new_length"),
+            "new_length": anchor.get("new_length"),
+        }
+        try:
+            return squash_chain([identity] + diffs[1:])
+        except ValueError:
+            return None
+
+    @staticmethod
+    def encode_history_cursor(created_at, version_id):
+        raw = f"{created_at.isoformat()}|{version_id}"
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_history_cursor(cursor_token):
+        try:
+            raw = base64.urlsafe_b64decode(cursor_token.encode('ascii')).decode('utf-8')
+            created_at_str, version_id = raw.split('|', 1)
+            return datetime.fromisoformat(created_at_str), uuid.UUID(version_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
+
     @staticmethod
     def create_policy_version_record(version_data):
+        # [id, org_policy_id, version, diff_json_str, checkpoint, status] plus, optionally, diff_blob, checkpoint_blob, codec
+        # and changes_count (as PolicyBlobStore.encode_version returns them).
+        # Chains are ordered by created_at: stamp the insert itself, not the start of a transaction that may have waited on a lock.
+        version_data = list(version_data) + [None] * (10 - len(version_data))
+        version_data[9] = version_data[9] or 0
         with connection.cursor() as cursor:
             cursor.execute(
                 """
                 INSERT INTO policy_versions
-                (id, org_policy_id, version, diff_data, checkpoint_template, status, created_at, updated_at)
-                VALUES (%s, %s, %s, %s::jsonb, %s, %s, NOW(), NOW())
+                (id, org_policy_id, version, diff_data, checkpoint_template, status,
+                 diff_blob, checkpoint_blob, storage_codec, changes_count, created_at, updated_at)
+                VALUES (%s, %s, %s, %s::jsonb, %s, %s, %s, %s, %s, %s, clock_timestamp(), clock_timestamp())
                 RETURNING id
                 """,
                 version_data,
@@ -76,7 +293,8 @@ class PolicyResponseBuilder:
 
 def render_pdf_from_html(html_source: str) -> bytes:
     result = BytesIO()
-    pdf = pisa.CreatePDF(src=html_source, dest=result)
+    with span("pdf"):
+        pdf = pisa.CreatePDF(src=html_source, dest=result)
     if pdf.err:
         raise RuntimeError(f"PDF generation failed: {pdf.err}")
     return result.getvalue()
@@ -1,14 +1,31 @@
 import json
+import logging
 import uuid
-import traceback
+import requests
+from django.core.exceptions import ObjectDoesNotExist
 from django.db import transaction, connection
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
 from decouple import config
 from io import BytesIO
 from xhtml2pdf import pisa
-from .policy_service import format_html_with_ai
-from ..utils.diff_utils import compute_html_diff, apply_diff
+from .policy_service import format_html_with_ai, stream_html_with_ai, PolicyAIService
+from ..utils.checkpoint_policy import CheckpointPolicy
+from ..utils.diff_utils import compute_html_diff
 from ..models import PolicyTemplate, Organization, OrgPolicy, PolicyVersion, Employee, PolicyApprover
 from .view_helpers import PolicyService, PolicyResponseBuilder
+from .export_service import PolicyExportService
+from .batch_service import PolicyBatchService
+from .search_service import PolicySearchService
+from .storage_service import PolicyBlobStore
+from .blame_service import PolicyBlameService
+from .compare_service import PolicyCompareService
+from .policy_service import extract_title_version_from_pdf
+from ..utils.pdf_processor import PDFProcessor
+from ..utils.upload_handlers import spooled_upload_handlers
+from ..utils.metrics import span, observe_diff_size, observe_replay_length, render_metrics
+
+logger = logging.getLogger(__name__)
 
 def initialise_policy_op(body_bytes):
     try:
@@ -37,6 +54,10 @@ def initialise_policy_op(body_bytes):
             return PolicyResponseBuilder.error("Policy template not found", status=404)
         if not policy_template.title or policy_template.title.strip() == '':
             return PolicyResponseBuilder.error("Policy template title is required but missing or empty", status=400)
+        if data.get('stream'):
+            return _stream_initialised_policy(
+                policy_template, organization, department, category, version, workforce_assignment, organization_logo
+            )
         formatting_result, llm_template = format_html_with_ai(
             policy_template.template,
             policy_template.title,
@@ -48,35 +69,12 @@ def initialise_policy_op(body_bytes):
         if not formatting_result or formatting_result.get('status') != 200:
             error_msg = formatting_result.get('message', 'Unknown LLM error') if formatting_result else 'LLM service unavailable'
             return PolicyResponseBuilder.error(f"AI policy generation failed: {error_msg}", status=502)
-        with transaction.atomic():
-            workforce_assignments_obj = {"assignments": workforce_assignment}
-            workforce_assignments_json = json.dumps(workforce_assignments_obj, ensure_ascii=False)
-            org_policy, created = OrgPolicy.objects.select_for_update().get_or_create(
-                title=policy_template.title,
-                organization=organization,
-                defaults={
-                    'template': llm_template,
-                    'policy_type': 'existingpolicy',
-                    'department': department,
-                    'category': category,
-                    'workforce_assignments': workforce_assignments_json,
-                },
-            )
-            if not created:
-                org_policy.template = llm_template
-                org_policy.department = department
-                org_policy.category = category
-                org_policy.workforce_assignments = workforce_assignments_json
-                org_policy.save()
+        org_policy, created = _save_initialised_policy(
+            policy_template, organization, department, category, workforce_assignment, llm_template
+        )
         return PolicyResponseBuilder.success(
             "Policy initialized successfully",
-            {
-                "org_policy_id": str(org_policy.id),
-                "created": created,
-                "title": policy_template.title,
-                "version": version,
-                "workforce_assignments": workforce_assignment,
-            },
+            _initialised_policy_data(org_policy, created, policy_template, version, workforce_assignment),
             status=201 if created else 200
         )
     except json.JSONDecodeError:
@@ -84,9 +82,100 @@ def initialise_policy_op(body_bytes):
     except ValueError as e:
         return PolicyResponseBuilder.error(str(e), status=400)
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("initialise_policy_op failed")
         return PolicyResponseBuilder.error(f"Internal server error: {str(e)}", status=500)
 
+def _save_initialised_policy(policy_template, organization, department, category, workforce_assignment, llm_template):
+    with transaction.atomic():
+        workforce_assignments_obj = {"assignments": workforce_assignment}
+        workforce_assignments_json = json.dumps(workforce_assignments_obj, ensure_ascii=False)
+        org_policy, created = OrgPolicy.objects.select_for_update().get_or_create(
+            title=policy_template.title,
+            organization=organization,
+            defaults={
+                'template': llm_template,
+                'policy_type': 'existingpolicy',
+                'department': department,
+                'category': category,
+                'workforce_assignments': workforce_assignments_json,
+            },
+        )
+        if not created:
+            org_policy.template = llm_template
+            org_policy.department = department
+            org_policy.category = category
+            org_policy.workforce_assignments = workforce_assignments_json
+            org_policy.save()
+    return org_policy, created
+
+def _initialised_policy_data(org_policy, created, policy_template, version, workforce_assignment):
+    return {
+        "org_policy_id": str(org_policy.id),
+        "created": created,
+        "title": policy_template.title,
+        "version": version,
+        "workforce_assignments": workforce_assignment,
+    }
+
+STREAM_PREAMBLE_MAX_CHARS = 1024
+
+def _sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def _stream_initialised_policy(policy_template, organization, department, category, version, workforce_assignment, organization_logo):
+    """
+    Server-sent events for /policy/initialise with "stream": true.
+
+    "chunk" events relay partial HTML as the model writes it; once the stream completes the
+    cleaned document is saved exactly as in the blocking path and a final "done" event carries
+    the usual response fields. Failures end the stream with an "error" event.
+    """
+    def events():
+        parts = []
+        document_started = False
+        try:
+            for fragment in stream_html_with_ai(
+                policy_template.template,
+                policy_template.title,
+                department,
+                category,
+                organization.name,
+                organization_logo,
+            ):
+                parts.append(fragment)
+                if document_started:
+                    yield _sse_event("chunk", {"html": fragment})
+                    continue
+                # Hold back the model's preamble (code fences, chatter) until the document starts.
+                buffered = "".join(parts)
+                start_index = buffered.find("<!DOCTYPE html>")
+                if start_index < 0 and len(buffered) < STREAM_PREAMBLE_MAX_CHARS:
+                    continue
+                document_started = True
+                yield _sse_event("chunk", {"html": buffered[max(start_index, 0):]})
+            llm_template = PolicyAIService.clean_generated_html("".join(parts))
+            if not llm_template:
+                yield _sse_event("error", {"status": 502, "error": "AI policy generation failed: empty response"})
+                return
+            org_policy, created = _save_initialised_policy(
+                policy_template, organization, department, category, workforce_assignment, llm_template
+            )
+            yield _sse_event("done", {
+                "message": "Policy initialized successfully",
+                "status": 201 if created else 200,
+                **_initialised_policy_data(org_policy, created, policy_template, version, workforce_assignment),
+            })
+        except requests.Timeout:
+            yield _sse_event("error", {"status": 502, "error": "AI policy generation failed: AI service timeout"})
+        except Exception as e:
+            logger.exception("Streaming policy generation failed")
+            yield _sse_event("error", {"status": 502, "error": f"AI policy generation failed: {str(e)}"})
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
 def create_initialised_policy_op(body_bytes):
     try:
         data = json.loads(body_bytes)
@@ -113,16 +202,14 @@ def create_initialised_policy_op(body_bytes):
             return PolicyResponseBuilder.error("OrgPolicy not found", status=404)
         checkpoint_content = html_content if html_content is not None else org_policy.template or ""
         checkpoint_source = "provided_html" if html_content is not None else "org_policy_template"
-        old_html = ""
-        new_html = org_policy.template or ""
-        diff_json = compute_html_diff(old_html, new_html)
+        # v1 is its checkpoint; its diff describes the same document so diff-only readers agree.
+        diff_json = compute_html_diff("", checkpoint_content)
         with transaction.atomic():
             policy_version = PolicyVersion.objects.create(
                 org_policy_id=org_policy.id,
                 version=version,
-                diff_data=diff_json,
-                checkpoint_template=checkpoint_content,
                 status='draft',
+                **PolicyBlobStore.encode_version(org_policy.id, diff_json, checkpoint_content),
                 created_at=created_by,
                 updated_at=created_by,
             )
@@ -131,6 +218,7 @@ def create_initialised_policy_op(body_bytes):
                     policy_version_id=policy_version.id,
                     approver_id=approver
                 )
+            PolicySearchService.index_head(policy_version.id, org_policy, version, checkpoint_content)
         return PolicyResponseBuilder.success(
             "Initialized policy version created successfully",
             {
@@ -146,9 +234,48 @@ def create_initialised_policy_op(body_bytes):
     except json.JSONDecodeError:
         return PolicyResponseBuilder.error("Invalid JSON payload", status=400)
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("create_initialised_policy_op failed")
         return PolicyResponseBuilder.error(f"Internal server error: {str(e)}", status=500)
 
+def _next_version_number(org_policy_id, version, last_version_str):
+    def parse_version(v):
+        parts = v.split('.')
+        while len(parts) < 2:
+            parts.append('0')
+        try:
+            major = int(parts[0])
+            minor = int(parts[1])
+        except Exception:
+            return 1, 0
+        return major, minor
+
+    if not version:
+        if last_version_str:
+            try:
+                last_major, last_minor = parse_version(last_version_str)
+                latest_ver_obj = PolicyVersion.objects.filter(org_policy_id=org_policy_id).order_by('-created_at').first()
+                from django.utils import timezone
+                if latest_ver_obj and getattr(latest_ver_obj, "expired_at", None) and timezone.now().date() > latest_ver_obj.expired_at:
+                    version = f"{last_major + 1}.0"
+                else:
+                    version = f"{last_major}.{last_minor + 1}"
+            except Exception:
+                version = "1.0"
+        else:
+            version = "1.0"
+    else:
+        try:
+            prov_major, prov_minor = parse_version(version)
+            latest_ver_obj = PolicyVersion.objects.filter(org_policy_id=org_policy_id).order_by('-created_at').first()
+            from django.utils import timezone
+            if latest_ver_obj and getattr(latest_ver_obj, "expired_at", None) and timezone.now().date() > latest_ver_obj.expired_at:
+                version = f"{prov_major + 1}.0"
+            else:
+                version = f"{prov_major + 1}.0"
+        except Exception:
+            version = "1.0"
+    return version
+
 def update_policy_op(body_bytes):
     try:
         body_content = body_bytes
@@ -171,71 +298,47 @@ def update_policy_op(body_bytes):
         org_policy_row = PolicyService.get_org_policy_by_id(org_policy_id)
         if not org_policy_row:
             return PolicyResponseBuilder.error("OrgPolicy not found", status=404)
-        existing_versions_count = PolicyService.count_policy_versions(org_policy_id)
-        new_version_position = existing_versions_count + 1
-        last_version_str = PolicyService.get_latest_version_number(org_policy_id)
-        def parse_version(v):
-            parts = v.split('.')
-            while len(parts) < 2:
-                parts.append('0')
-            try:
-                major = int(parts[0])
-                minor = int(parts[1])
-            except Exception:
-                return 1, 0
-            return major, minor
-
-        if not version:
-            if last_version_str:
-                try:
-                    last_major, last_minor = parse_version(last_version_str)
-                    latest_ver_obj = PolicyVersion.objects.filter(org_policy_id=org_policy_id).order_by('-created_at').first()
-                    from django.utils import timezone
-                    if latest_ver_obj and getattr(latest_ver_obj, "expired_at", None) and timezone.now().date() > latest_ver_obj.expired_at:
-                        version = f"{last_major + 1}.0"
-                    else:
-                        version = f"{last_major}.{last_minor + 1}"
-                except Exception:
-                    version = "1.0"
-            else:
-                version = "1.0"
-        else:
-            try:
-                prov_major, prov_minor = parse_version(version)
-                latest_ver_obj = PolicyVersion.objects.filter(org_policy_id=org_policy_id).order_by('-created_at').first()
-                from django.utils import timezone
-                if latest_ver_obj and getattr(latest_ver_obj, "expired_at", None) and timezone.now().date() > latest_ver_obj.expired_at:
-                    version = f"{prov_major + 1}.0"
-                else:
-                    version = f"{prov_major + 1}.0"
-            except Exception:
-                version = "1.0"
-        first_version_row = PolicyService.get_first_policy_version(org_policy_id)
-        old_html = ""
-        if first_version_row:
-            first_version_id, first_version_number, diff_data_str, created_at = first_version_row
-            if diff_data_str and diff_data_str.strip():
-                try:
-                    diff_dict = json.loads(diff_data_str)
-                    old_html = apply_diff("", diff_dict)
-                except Exception:
-                    pass
-        diff_json = compute_html_diff(old_html, new_html)
-        is_checkpoint_version = (new_version_position % 10 == 1) and (new_version_position >= 11)
-        checkpoint_content = new_html if is_checkpoint_version else ""
         try:
             with transaction.atomic():
-                new_policy_version_id = str(uuid.uuid4())
+                # Writers of one policy queue on its org_policies row, so the version number, the
+                # head the delta is taken against and the checkpoint debt are all read under the lock.
+                org_policy = OrgPolicy.objects.select_for_update().get(id=uuid.UUID(org_policy_id))
+                # The index is in chain order: it gives the position and latest version number too.
+                version_index = PolicyService.get_policy_checkpoint_index(org_policy_id)
+                new_version_position = len(version_index) + 1
+                version = _next_version_number(org_policy_id, version, version_index[-1][1] if version_index else None)
+                # The new delta is taken against the current head, so replaying the chain in order reproduces new_html.
+                old_html = ""
+                if version_index:
+                    with span("replay"):
+                        old_html, diffs_applied, _ = PolicyService.replay_to_position(version_index, len(version_index) - 1)
+                    observe_replay_length(diffs_applied)
+                with span("diff"):
+                    diff_json = compute_html_diff(old_html, new_html)
                 diff_json_str = json.dumps(diff_json)
+                _, replay_bytes, changes_since_checkpoint = PolicyService.get_checkpoint_debt(org_policy_id)
+                is_checkpoint_version = bool(version_index) and CheckpointPolicy.should_checkpoint(
+                    replay_bytes,
+                    changes_since_checkpoint,
+                    CheckpointPolicy.step_cost(len(old_html), len(diff_json_str)),
+                    len(diff_json["changes"]),
+                )
+                checkpoint_content = new_html if is_checkpoint_version else ""
+                new_policy_version_id = str(uuid.uuid4())
+                observe_diff_size(diff_json_str)
+                stored = PolicyBlobStore.encode_version(org_policy_id, diff_json, checkpoint_content)
                 inserted_id = PolicyService.create_policy_version_record([
                     new_policy_version_id,
                     org_policy_id,
                     version,
-                    diff_json_str,
-                    checkpoint_content,
+                    diff_json_str if stored["diff_data"] is diff_json else json.dumps(stored["diff_data"]),
+                    stored["checkpoint_template"],
                     'draft',
+                    stored["diff_blob"],
+                    stored["checkpoint_blob"],
+                    stored["storage_codec"],
+                    stored["changes_count"],
                 ])
-                org_policy = OrgPolicy.objects.get(id=uuid.UUID(org_policy_id))
                 org_policy.workforce_assignments = json.dumps({"assignments": workforce_assignment}, ensure_ascii=False)
                 org_policy.save()
                 if Employee.objects.filter(id=uuid.UUID(approver)).exists():
@@ -245,8 +348,9 @@ def update_policy_op(body_bytes):
                     )
                 else:
                     raise Exception("Approver not found")
+                PolicySearchService.index_head(new_policy_version_id, org_policy, version, new_html)
         except Exception as e:
-            traceback.print_exc()
+            logger.exception("update_policy_op: writing the new version failed")
             return PolicyResponseBuilder.error(f"Failed to create policy version: {str(e)}", status=500)
         response_data = {
             "org_policy_id": org_policy_id,
@@ -261,7 +365,7 @@ def update_policy_op(body_bytes):
     except json.JSONDecodeError:
         return PolicyResponseBuilder.error("Invalid JSON payload", status=400)
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("update_policy_op failed")
         return PolicyResponseBuilder.error(f"Internal server error: {str(e)}", status=500)
 
 def get_policy_version_html_op(body_bytes):
@@ -292,33 +396,16 @@ def get_policy_version_html_op(body_bytes):
                 target_version = row[0] if row else None
         if not target_version:
             return PolicyResponseBuilder.error("No versions found for this policy", status=404)
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT version, diff_data::text, checkpoint_template FROM policy_versions WHERE org_policy_id = %s ORDER BY created_at ASC", [org_policy_id])
-            all_versions = cursor.fetchall()
-        if not all_versions:
+        version_index = PolicyService.get_policy_checkpoint_index(org_policy_id)
+        if not version_index:
             return PolicyResponseBuilder.error("No versions found for this policy", status=404)
-        current_html = ""
-        target_found = False
-        for version_data in all_versions:
-            version_num, diff_data_str, checkpoint_content = version_data
-            if diff_data_str and diff_data_str.strip():
-                try:
-                    diff_dict = json.loads(diff_data_str)
-                    current_html = apply_diff(current_html, diff_dict)
-                except Exception:
-                    pass
-            if version_num == target_version:
-                target_found = True
-                break
-        if not target_found:
+        target_position = PolicyService.find_version_position(version_index, target_version)
+        if target_position is None:
             return PolicyResponseBuilder.error(f"Version {target_version} not found for this policy", status=404)
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT status, created_at FROM policy_versions WHERE org_policy_id = %s AND version = %s LIMIT 1", [org_policy_id, target_version])
-            version_info = cursor.fetchone()
-        if version_info:
-            status, created_at = version_info
-        else:
-            status, created_at = "unknown", None
+        with span("replay"):
+            current_html, diffs_applied, checkpoint_version = PolicyService.replay_to_position(version_index, target_position)
+        observe_replay_length(diffs_applied)
+        _, _, status, created_at, _ = version_index[target_position]
         return PolicyResponseBuilder.success(
             "Policy version HTML retrieved successfully",
             {
@@ -328,7 +415,7 @@ def get_policy_version_html_op(body_bytes):
                 "html": current_html,
                 "created_at": created_at.isoformat() if created_at else None,
                 "status": "draft",
-                "reconstruction_method": "sequential",
+                "reconstruction_method": "checkpoint" if checkpoint_version else "sequential",
                 "html_length": len(current_html),
                 "organization_id": organization_id
             }
@@ -336,7 +423,7 @@ def get_policy_version_html_op(body_bytes):
     except json.JSONDecodeError:
         return PolicyResponseBuilder.error("Invalid JSON payload", status=400)
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("get_policy_version_html_op failed")
         return PolicyResponseBuilder.error(f"Internal server error: {str(e)}", status=500)
 
 def get_policy_pdf_op(body_bytes):
@@ -382,33 +469,16 @@ def get_policy_pdf_op(body_bytes):
                 target_version = row[0] if row else None
         if not target_version:
             return PolicyResponseBuilder.error("No versions found for this policy", status=404)
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT version, diff_data::text, checkpoint_template FROM policy_versions WHERE org_policy_id = %s ORDER BY created_at ASC", [org_policy_id])
-            all_versions = cursor.fetchall()
-        if not all_versions:
+        version_index = PolicyService.get_policy_checkpoint_index(org_policy_id)
+        if not version_index:
             return PolicyResponseBuilder.error("No versions found for this policy", status=404)
-        current_html = ""
-        target_found = False
-        for version_data in all_versions:
-            version_num, diff_data_str, checkpoint_content = version_data
-            if diff_data_str and diff_data_str.strip():
-                try:
-                    diff_dict = json.loads(diff_data_str)
-                    current_html = apply_diff(current_html, diff_dict)
-                except Exception:
-                    pass
-            if version_num == target_version:
-                target_found = True
-                break
-        if not target_found:
+        target_position = PolicyService.find_version_position(version_index, target_version)
+        if target_position is None:
             return PolicyResponseBuilder.error(f"Version {target_version} not found for this policy", status=404)
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT status, created_at FROM policy_versions WHERE org_policy_id = %s AND version = %s LIMIT 1", [org_policy_id, target_version])
-            version_info = cursor.fetchone()
-        if version_info:
-            status, created_at = version_info
-        else:
-            status, created_at = "unknown", None
+        with span("replay"):
+            current_html, diffs_applied, checkpoint_version = PolicyService.replay_to_position(version_index, target_position)
+        observe_replay_length(diffs_applied)
+        _, _, status, created_at, _ = version_index[target_position]
         html_with_logo = f"""
 <html>
 <head>
@@ -479,7 +549,8 @@ def get_policy_pdf_op(body_bytes):
 </html>
 """
         pdf_buffer = BytesIO()
-        pisa_status = pisa.CreatePDF(html_with_logo, dest=pdf_buffer)
+        with span("pdf"):
+            pisa_status = pisa.CreatePDF(html_with_logo, dest=pdf_buffer)
         if pisa_status.err:
             return PolicyResponseBuilder.error("Failed to generate PDF", status=500)
         pdf_buffer.seek(0)
@@ -501,5 +572,419 @@ def get_policy_pdf_op(body_bytes):
     except json.JSONDecodeError:
         return PolicyResponseBuilder.error("Invalid JSON payload", status=400)
     except Exception as e:
-        traceback.print_exc()
-        return PolicyResponseBuilder.error(f"Internal server error: {str(e)}", status=500)
\ No newline at end of file
+        logger.exception("get_policy_pdf_op failed")
+        return PolicyResponseBuilder.error(f"Internal server error: {str(e)}", status=500)
+
+def _replay_policy_versions(org_policy_id, target_versions):
+    version_index = PolicyService.get_policy_checkpoint_index(org_policy_id)
+    rebuilt = {}
+    diffs_applied = 0
+    with span("replay"):
+        for version_num in set(target_versions):
+            position = PolicyService.find_version_position(version_index, version_num)
+            if position is None:
+                continue
+            rebuilt[version_num], applied, _ = PolicyService.replay_to_position(version_index, position)
+            diffs_applied += applied
+    observe_replay_length(diffs_applied)
+    return rebuilt
+
+def get_policy_version_delta_op(body_bytes):
+    try:
+        body_content = body_bytes
+        if isinstance(body_content, bytes):
+            body_content = body_content.decode('utf-8')
+        data = json.loads(body_content)
+        org_policy_id = data.get("org_policy_id")
+        from_version = data.get("from_version")
+        to_version = data.get("to_version")
+        if not org_policy_id:
+            return PolicyResponseBuilder.error("org_policy_id is required in payload", status=400)
+        if not from_version:
+            return PolicyResponseBuilder.error("from_version is required in payload", status=400)
+        try:
+            PolicyService.validate_uuid(org_policy_id, 'org_policy_id')
+        except ValueError:
+            return PolicyResponseBuilder.error("Invalid org_policy_id format", status=400)
+        org_policy_row = PolicyService.get_org_policy_by_id(org_policy_id)
+        if not org_policy_row:
+            return PolicyResponseBuilder.error("OrgPolicy not found", status=404)
+        org_policy_id_db, org_policy_title = org_policy_row
+        version_index = PolicyService.get_policy_checkpoint_index(org_policy_id)
+        if not version_index:
+            return PolicyResponseBuilder.error("No versions found for this policy", status=404)
+        positions = {}
+        for position, row in enumerate(version_index):
+            positions.setdefault(row[1], position)
+        if not to_version:
+            to_version = version_index[-1][1]
+        for requested in (from_version, to_version):
+            if requested not in positions:
+                return PolicyResponseBuilder.error(f"Version {requested} not found for this policy", status=404)
+        from_position = positions[from_version]
+        to_position = positions[to_version]
+        if from_position > to_position:
+            return PolicyResponseBuilder.error("from_version must not be newer than to_version", status=400)
+        delta = PolicyService.compose_version_range(version_index, from_position, to_position)
+        delta_method = "composed"
+        if delta is None:
+            rebuilt = _replay_policy_versions(org_policy_id, [from_version, to_version])
+            delta = compute_html_diff(rebuilt.get(from_version, ""), rebuilt.get(to_version, ""))
+            delta_method = "rebuilt"
+        return PolicyResponseBuilder.success(
+            "Policy version delta retrieved successfully",
+            {
+                "org_policy_id": org_policy_id,
+                "policy_title": org_policy_title,
+                "from_version": from_version,
+                "to_version": to_version,
+                "diff": delta,
+                "delta_method": delta_method,
+                "versions_composed": to_position - from_position,
+                "changes_count": len(delta.get('changes', [])),
+            }
+        )
+    except json.JSONDecodeError:
+        return PolicyResponseBuilder.error("Invalid JSON payload", status=400)
+    except Exception as e:
+        logger.exception("get_policy_version_delta_op failed")
+        return PolicyResponseBuilder.error(f"Internal server error: {str(e)}", status=500)
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+def list_policy_versions_op(body_bytes):
+    try:
+        body_content = body_bytes
+        if isinstance(body_content, bytes):
+            body_content = body_content.decode('utf-8')
+        data = json.loads(body_content)
+        org_policy_id = data.get("org_policy_id")
+        if not org_policy_id:
+            return PolicyResponseBuilder.error("org_policy_id is required in payload", status=400)
+        try:
+            PolicyService.validate_uuid(org_policy_id, 'org_policy_id')
+        except ValueError:
+            return PolicyResponseBuilder.error("Invalid org_policy_id format", status=400)
+        try:
+            limit = int(data.get("limit") or HISTORY_PAGE_SIZE)
+        except (TypeError, ValueError):
+            return PolicyResponseBuilder.error("limit must be an integer", status=400)
+        limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+        descending = str(data.get("order", "asc")).lower() == "desc"
+        org_policy_row = PolicyService.get_org_policy_by_id(org_policy_id)
+        if not org_policy_row:
+            return PolicyResponseBuilder.error("OrgPolicy not found", status=404)
+        org_policy_id_db, org_policy_title = org_policy_row
+        # Only narrow columns: diff_data and checkpoint_template live in TOAST, and changes_count is stored at write time.
+        versions = PolicyVersion.objects.filter(org_policy_id=org_policy_id).only(
+            'id', 'version', 'status', 'is_current', 'expired_at', 'published_at', 'created_at', 'changes_count'
+        )
+        cursor_token = data.get("cursor")
+        if cursor_token:
+            try:
+                cursor_created_at, cursor_id = PolicyService.decode_history_cursor(cursor_token)
+            except ValueError:
+                return PolicyResponseBuilder.error("Invalid cursor", status=400)
+            if descending:
+                versions = versions.filter(Q(created_at__lt=cursor_created_at) | Q(created_at=cursor_created_at, id__lt=cursor_id))
+            else:
+                versions = versions.filter(Q(created_at__gt=cursor_created_at) | Q(created_at=cursor_created_at, id__gt=cursor_id))
+        ordering = ('-created_at', '-id') if descending else ('created_at', 'id')
+        page = list(versions.order_by(*ordering)[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        approvers_by_version = {}
+        if page:
+            approver_rows = PolicyApprover.objects.filter(
+                policy_version_id__in=[version.id for version in page]
+            ).values_list('policy_version_id', 'approver_id', 'status')
+            for policy_version_id, approver_id, approver_status in approver_rows:
+                approvers_by_version.setdefault(policy_version_id, []).append({
+                    "approver_id": str(approver_id),
+                    "status": approver_status,
+                })
+        items = [
+            {
+                "policy_version_id": str(version.id),
+                "version": version.version,
+                "status": version.status,
+                "is_current": version.is_current,
+                "expired_at": version.expired_at.isoformat() if version.expired_at else None,
+                "published_at": version.published_at.isoformat() if version.published_at else None,
+                "created_at": version.created_at.isoformat() if version.created_at else None,
+                "approvers": approvers_by_version.get(version.id, []),
+                "changes_count": version.changes_count,
+            }
+            for version in page
+        ]
+        next_cursor = None
+        if has_more and page:
+            next_cursor = PolicyService.encode_history_cursor(page[-1].created_at, page[-1].id)
+        return PolicyResponseBuilder.success(
+            "Policy version history retrieved successfully",
+            {
+                "org_policy_id": org_policy_id,
+                "policy_title": org_policy_title,
+                "versions": items,
+                "next_cursor": next_cursor,
+                "has_more": has_more,
+            }
+        )
+    except json.JSONDecodeError:
+        return PolicyResponseBuilder.error("Invalid JSON payload", status=400)
+    except Exception as e:
+        logger.exception("list_policy_versions_op failed")
+        return PolicyResponseBuilder.error(f"Internal server error: {str(e)}", status=500)
+
+def export_policy_history_op(body_bytes):
+    try:
+        body_content = body_bytes
+        if isinstance(body_content, bytes):
+            body_content = body_content.decode('utf-8')
+        data = json.loads(body_content)
+        org_policy_id = data.get("org_policy_id")
+        export_format = data.get("format", "ndjson")
+        include_pdf = bool(data.get("include_pdf", False))
+        if not org_policy_id:
+            return PolicyResponseBuilder.error("org_policy_id is required in payload", status=400)
+        if export_format not in ("ndjson", "zip"):
+            return PolicyResponseBuilder.error("format must be 'ndjson' or 'zip'", status=400)
+        try:
+            PolicyService.validate_uuid(org_policy_id, 'org_policy_id')
+        except ValueError:
+            return PolicyResponseBuilder.error("Invalid org_policy_id format", status=400)
+        org_policy_row = PolicyService.get_org_policy_by_id(org_policy_id)
+        if not org_policy_row:
+            return PolicyResponseBuilder.error("OrgPolicy not found", status=404)
+        org_policy_id_db, org_policy_title = org_policy_row
+        file_stem = PolicyExportService.safe_name(org_policy_title)
+        if export_format == "zip":
+            response = StreamingHttpResponse(
+                PolicyExportService.iter_zip(org_policy_id, include_pdf=include_pdf),
+                content_type="application/zip",
+            )
+            response["Content-Disposition"] = f'attachment; filename="{file_stem}_history.zip"'
+        else:
+            response = StreamingHttpResponse(
+                PolicyExportService.iter_ndjson(org_policy_id),
+                content_type="application/x-ndjson",
+            )
+            response["Content-Disposition"] = f'attachment; filename="{file_stem}_history.ndjson"'
+        return response
+    except json.JSONDecodeError:
+        return PolicyResponseBuilder.error("Invalid JSON payload", status=400)
+    except Exception as e:
+        logger.exception("export_policy_history_op failed")
+        return PolicyResponseBuilder.error(f"Internal server error: {str(e)}", status=500)
+
+def get_policy_versions_batch_op(body_bytes):
+    try:
+        body_content = body_bytes
+        if isinstance(body_content, bytes):
+            body_content = body_content.decode('utf-8')
+        data = json.loads(body_content)
+        try:
+            items = PolicyBatchService.parse_items(data.get("items"))
+        except ValueError as e:
+            return PolicyResponseBuilder.error(str(e), status=400)
+        if data.get("stream"):
+            def ndjson_lines():
+                for result in PolicyBatchService.iter_results(items):
+                    yield (json.dumps(result, ensure_ascii=False) + "\n").encode('utf-8')
+            return StreamingHttpResponse(ndjson_lines(), content_type="application/x-ndjson")
+        results = list(PolicyBatchService.iter_results(items))
+        return PolicyResponseBuilder.success(
+            "Policy versions retrieved successfully",
+            {
+                "results": results,
+                "requested": len(items),
+                "failed": sum(1 for result in results if "error" in result),
+            }
+        )
+    except json.JSONDecodeError:
+        return PolicyResponseBuilder.error("Invalid JSON payload", status=400)
+    except Exception as e:
+        logger.exception("get_policy_versions_batch_op failed")
+        return PolicyResponseBuilder.error(f"Internal server error: {str(e)}", status=500)
+
+def search_policies_op(body_bytes):
+    try:
+        body_content = body_bytes
+        if isinstance(body_content, bytes):
+            body_content = body_content.decode('utf-8')
+        data = json.loads(body_content)
+        query = (data.get("query") or "").strip()
+        organization_id = data.get("organization_id")
+        if not query:
+            return PolicyResponseBuilder.error("query is required in payload", status=400)
+        if not organization_id:
+            return PolicyResponseBuilder.error("organization_id is required in payload", status=400)
+        try:
+            PolicyService.validate_uuid(organization_id, 'organization_id')
+        except ValueError:
+            return PolicyResponseBuilder.error("Invalid organization_id format", status=400)
+        try:
+            limit = int(data.get("limit") or 20)
+        except (TypeError, ValueError):
+            return PolicyResponseBuilder.error("limit must be an integer", status=400)
+        results = PolicySearchService.search(
+            query,
+            organization_id,
+            department=data.get("department"),
+            include_history=bool(data.get("include_history", False)),
+            limit=limit,
+        )
+        return PolicyResponseBuilder.success(
+            "Policy search completed successfully",
+            {
+                "query": query,
+                "organization_id": organization_id,
+                "results": results,
+                "count": len(results),
+            }
+        )
+    except json.JSONDecodeError:
+        return PolicyResponseBuilder.error("Invalid JSON payload", status=400)
+    except Exception as e:
+        logger.exception("search_policies_op failed")
+        return PolicyResponseBuilder.error(f"Internal server error: {str(e)}", status=500)
+
+def get_policy_blame_op(body_bytes):
+    try:
+        body_content = body_bytes
+        if isinstance(body_content, bytes):
+            body_content = body_content.decode('utf-8')
+        data = json.loads(body_content)
+        org_policy_id = data.get("org_policy_id")
+        if not org_policy_id:
+            return PolicyResponseBuilder.error("org_policy_id is required in payload", status=400)
+        try:
+            PolicyService.validate_uuid(org_policy_id, 'org_policy_id')
+        except ValueError:
+            return PolicyResponseBuilder.error("Invalid org_policy_id format", status=400)
+        org_policy_row = PolicyService.get_org_policy_by_id(org_policy_id)
+        if not org_policy_row:
+            return PolicyResponseBuilder.error("OrgPolicy not found", status=404)
+        org_policy_id_db, org_policy_title = org_policy_row
+        try:
+            target_version, lines, origins, stats = PolicyBlameService.annotate(org_policy_id, data.get("version"))
+        except ObjectDoesNotExist as e:
+            return PolicyResponseBuilder.error(str(e), status=404)
+        annotations = [
+            {
+                "line": line_number,
+                "text": text,
+                "policy_version_id": origin_id,
+                "version": origin_version,
+            }
+            for line_number, (text, (origin_id, origin_version)) in enumerate(zip(lines, origins), start=1)
+        ]
+        return PolicyResponseBuilder.success(
+            "Policy version blame retrieved successfully",
+            {
+                "org_policy_id": org_policy_id,
+                "policy_title": org_policy_title,
+                "version": target_version,
+                "line_count": len(lines),
+                "lines": annotations,
+                **stats,
+            }
+        )
+    except json.JSONDecodeError:
+        return PolicyResponseBuilder.error("Invalid JSON payload", status=400)
+    except Exception as e:
+        logger.exception("get_policy_blame_op failed")
+        return PolicyResponseBuilder.error(f"Internal server error: {str(e)}", status=500)
+
+def compare_policy_versions_op(body_bytes):
+    try:
+        body_content = body_bytes
+        if isinstance(body_content, bytes):
+            body_content = body_content.decode('utf-8')
+        data = json.loads(body_content)
+        org_policy_id = data.get("org_policy_id")
+        from_version = data.get("from_version")
+        to_version = data.get("to_version")
+        for field, value in (("org_policy_id", org_policy_id), ("from_version", from_version), ("to_version", to_version)):
+            if not value:
+                return PolicyResponseBuilder.error(f"{field} is required in payload", status=400)
+        try:
+            PolicyService.validate_uuid(org_policy_id, 'org_policy_id')
+        except ValueError:
+            return PolicyResponseBuilder.error("Invalid org_policy_id format", status=400)
+        org_policy_row = PolicyService.get_org_policy_by_id(org_policy_id)
+        if not org_policy_row:
+            return PolicyResponseBuilder.error("OrgPolicy not found", status=404)
+        org_policy_id_db, org_policy_title = org_policy_row
+        try:
+            comparison = PolicyCompareService.compare(
+                org_policy_id, from_version, to_version, include_pdf=bool(data.get("include_pdf", False))
+            )
+        except ObjectDoesNotExist as e:
+            return PolicyResponseBuilder.error(str(e), status=404)
+        return PolicyResponseBuilder.success(
+            "Policy versions compared successfully",
+            {
+                "org_policy_id": org_policy_id,
+                "policy_title": org_policy_title,
+                "from_version": from_version,
+                "to_version": to_version,
+                **comparison,
+            }
+        )
+    except json.JSONDecodeError:
+        return PolicyResponseBuilder.error("Invalid JSON payload", status=400)
+    except Exception as e:
+        logger.exception("compare_policy_versions_op failed")
+        return PolicyResponseBuilder.error(f"Internal server error: {str(e)}", status=500)
+
+POLICY_UPLOAD_MAX_BYTES = config('POLICY_UPLOAD_MAX_BYTES', default=64 * 1024 * 1024, cast=int)
+
+def upload_policy_pdf_op(request):
+    try:
+        if not request.content_type.startswith('multipart/form-data'):
+            return PolicyResponseBuilder.error("Request must be multipart/form-data", status=415)
+        try:
+            declared_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            declared_length = 0
+        if declared_length > POLICY_UPLOAD_MAX_BYTES:
+            return PolicyResponseBuilder.error(f"Upload exceeds the {POLICY_UPLOAD_MAX_BYTES} byte limit", status=413)
+        # Must be set before request.FILES is touched; the file part is spooled to disk, never held in memory.
+        upload_guard, request.upload_handlers = spooled_upload_handlers(request, POLICY_UPLOAD_MAX_BYTES)
+        uploaded_file = request.FILES.get('file')
+        if upload_guard.exceeded:
+            return PolicyResponseBuilder.error(f"Upload exceeds the {POLICY_UPLOAD_MAX_BYTES} byte limit", status=413)
+        if not uploaded_file:
+            return PolicyResponseBuilder.error("file is required", status=400)
+        try:
+            if uploaded_file.read(5) != b'%PDF-':
+                return PolicyResponseBuilder.error("Uploaded file is not a PDF", status=400)
+            uploaded_file.seek(0)
+            # Title and version detection only looks at the opening text, so stop after the first pages.
+            pdf_text = PDFProcessor.extract_text_from_file(uploaded_file, mode="head")
+        finally:
+            uploaded_file.close()
+        if not pdf_text:
+            return PolicyResponseBuilder.error("No extractable text found in PDF", status=422)
+        bypass_cache = request.POST.get('bypass_cache', '').lower() in ('1', 'true', 'yes')
+        extraction_result, extracted_data = extract_title_version_from_pdf(pdf_text, bypass_cache=bypass_cache)
+        return PolicyResponseBuilder.success(
+            "PDF processed successfully",
+            {
+                "file_name": uploaded_file.name,
+                "file_size": uploaded_file.size,
+                "text_length": len(pdf_text),
+                "extraction_mode": "head",
+                "title": extracted_data.get("title") if extracted_data else None,
+                "version": extracted_data.get("version") if extracted_data else None,
+                "extraction": extraction_result,
+            }
+        )
+    except Exception as e:
+        logger.exception("upload_policy_pdf_op failed")
+        return PolicyResponseBuilder.error(f"Internal server error: {str(e)}", status=500)
+
+def metrics_op():
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
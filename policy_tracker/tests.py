@@ -1,3 +1,896 @@
-from django.test import TestCase
+import base64
+import hashlib
+import importlib
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from unittest import mock
+import requests
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.db import connection, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+from .benchmarks.html_to_text import synthetic_policy_html
+from .benchmarks.llm_stub import StubLLMServer
+from .models import Employee, Organization, OrgPolicy, PolicyTemplate, PolicyVersion
+from .services import batch_service, policy_service, view_operations
+from .services.blame_service import PolicyBlameService
+from .services.chunk_store import PolicyChunkStore
+from .services.compaction_service import compact_policy
+from .services.import_service import LegacyPolicyImporter
+from .services.policy_service import PolicyAIService
+from .services.search_service import PolicySearchService
+from .services.view_helpers import PolicyService, render_pdf_from_html
+from .utils import pdf_processor
+from .utils.blob_codec import BlobCodec
+from .utils.checkpoint_policy import CheckpointPolicy
+from .utils.diff_utils import compute_html_diff, apply_diff, compose_diffs, squash_chain
+from .utils.pdf_processor import PDFProcessor
+from .utils.prompt_builder import CHARS_PER_TOKEN, PromptBuilder
+from .utils.query_profiler import QueryBudget, QueryProfile, assert_query_budget
+from .utils.upload_handlers import spooled_upload_handlers
+
+LINE_POOL = ["<h1>Policy</h1>", "<p>Scope</p>", "<p>Owner</p>", "<li>Item</li>", "", "<table>", "</table>"]
+
+
+def random_html(rng):
+    return "\n".join(rng.choice(LINE_POOL) for _ in range(rng.randint(0, 15)))
+
+
+def mutate_html(rng, html):
+    lines = html.split("\n") if html else []
+    for _ in range(rng.randint(0, 5)):
+        roll = rng.random()
+        if roll < 0.3 and lines:
+            del lines[rng.randrange(len(lines))]
+        elif roll < 0.6:
+            lines.insert(rng.randint(0, len(lines)), rng.choice(LINE_POOL + ["<p>New clause</p>"]))
+        elif lines:
+            lines[rng.randrange(len(lines))] = "<p>Edited</p>"
+    return "\n".join(lines)
+
+
+class PolicyDatabaseTestCase(TestCase):
+    """
+    One organization with a templated policy and an approver. The tables come from the models
+    (see CYBERWHIZ/test_runner.py); the raw-SQL search index comes from its migration.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        search_migration = importlib.import_module("policy_tracker.migrations.0002_policy_search_index")
+        with connection.schema_editor() as schema_editor:
+            search_migration.create_search_index(None, schema_editor)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.organization = Organization.objects.create(name="Acme", status="active")
+        cls.template = PolicyTemplate.objects.create(title="Access Control Policy", template="<h1>Access Control</h1>")
+        cls.base_html = synthetic_policy_html(6 * 1024, pretty=True, seed=11)
+        cls.org_policy = OrgPolicy.objects.create(
+            organization=cls.organization, title=cls.template.title, template=cls.base_html,
+            department="IT", workforce_assignments="{}",
+        )
+        cls.approver = Employee.objects.create(organization_id=cls.organization.id, sync_user_id=uuid.uuid4())
+
+    def post(self, endpoint, payload):
+        return self.client.post(f"/{endpoint}", json.dumps(payload), content_type="application/json")
+
+    def create_initial_version(self, html_content=None):
+        payload = {"org_policy_id": str(self.org_policy.id), "approver": str(self.approver.id)}
+        if html_content is not None:
+            payload["html_content"] = html_content
+        response = self.post("policy/create-initialised", payload)
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def update_policy(self, html):
+        response = self.post("policy/update", {
+            "org_policy_id": str(self.org_policy.id), "organization_id": str(self.organization.id),
+            "html_content": html, "workforce_assignment": [{"department": "IT"}], "approver": str(self.approver.id),
+        })
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def policy_html(self, version=None):
+        payload = {"org_policy_id": str(self.org_policy.id)}
+        if version:
+            payload["version"] = version
+        response = self.post("policy/data", payload)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["html"]
+
+
+class DiffCompositionTests(SimpleTestCase):
+    iterations = 500
+
+    def test_apply_composed_matches_sequential_apply(self):
+        rng = random.Random(2026)
+        for _ in range(self.iterations):
+            base = random_html(rng)
+            middle = mutate_html(rng, base)
+            final = mutate_html(rng, middle)
+            first = compute_html_diff(base, middle)
+            second = compute_html_diff(middle, final)
+            composed = compose_diffs(first, second)
+            self.assertEqual(apply_diff(base, composed), apply_diff(apply_diff(base, first), second))
+            self.assertEqual(composed["new_line_count"], len(final.split("\n")) if final else 0)
+
+    def test_composed_old_lines_match_base(self):
+        rng = random.Random(27)
+        for _ in range(self.iterations):
+            base = random_html(rng)
+            middle = mutate_html(rng, base)
+            final = mutate_html(rng, middle)
+            composed = compose_diffs(compute_html_diff(base, middle), compute_html_diff(middle, final))
+            base_lines = base.split("\n") if base else []
+            for change in composed["changes"]:
+                self.assertEqual(change["old"]["lines"], base_lines[change["old"]["start"]:change["old"]["end"]])
+
+    def test_squash_chain_matches_replay(self):
+        rng = random.Random(7)
+        for _ in range(self.iterations // 5):
+            versions = [random_html(rng)]
+            for _ in range(rng.randint(1, 12)):
+                versions.append(mutate_html(rng, versions[-1]))
+            diffs = [compute_html_diff(old, new) for old, new in zip(versions, versions[1:])]
+            self.assertEqual(apply_diff(versions[0], squash_chain(diffs)), versions[-1])
+
+    def test_squash_chain_rejects_unlinked_diffs(self):
+        with self.assertRaises(ValueError):
+            squash_chain([compute_html_diff("a", "a\nb"), compute_html_diff("a", "c")])
+
+
+class StreamingGenerationTests(SimpleTestCase):
+    generation_args = ("<h1>Template</h1><p>Body</p>", "Information Security Policy", "IT", "Security", "Acme", None)
+
+    def test_stream_matches_blocking_response(self):
+        with StubLLMServer(chunk_size=16) as stub, \
+                mock.patch("policy_tracker.services.policy_service.AI_CHAT_URL", stub.url):
+            fragments = list(PolicyAIService.stream_html_with_ai(*self.generation_args))
+            status, blocking_html = PolicyAIService.format_html_with_ai(*self.generation_args)
+        self.assertEqual(status["status"], 200)
+        self.assertGreater(len(fragments), 1)
+        self.assertEqual(PolicyAIService.clean_generated_html("".join(fragments)), blocking_html)
+
+    def test_stream_raises_on_upstream_error(self):
+        with StubLLMServer(error_rate=1.0) as stub, \
+                mock.patch("policy_tracker.services.policy_service.AI_CHAT_URL", stub.url):
+            with self.assertRaises(requests.HTTPError):
+                list(PolicyAIService.stream_html_with_ai(*self.generation_args))
+
+
+def fake_execute(sql, params, many, context):
+    return sql
+
+
+@override_settings(QUERY_BUDGETS={"default": {"queries": 20}, "policy/data": {"queries": 2, "db_ms": 1000}})
+class QueryProfilerTests(SimpleTestCase):
+    def run_queries(self, statements):
+        profile = QueryProfile()
+        for sql in statements:
+            profile(fake_execute, sql, [], False, {})
+        return profile
+
+    def test_profile_counts_and_keeps_slowest(self):
+        profile = self.run_queries(["SELECT 1", "SELECT 2", "SELECT 3"])
+        self.assertEqual(profile.count, 3)
+        self.assertIn(profile.slowest[1], {"SELECT 1", "SELECT 2", "SELECT 3"})
+        self.assertEqual(profile.summary()["query_count"], 3)
+
+    def test_budget_uses_endpoint_then_default(self):
+        self.assertEqual(QueryBudget.for_endpoint("policy/data"), (2, 1000))
+        self.assertEqual(QueryBudget.for_endpoint("policy/blame"), (20, None))
+
+    def test_budget_check_flags_regression(self):
+        with self.assertLogs("policy_tracker.utils.query_profiler", level="WARNING"):
+            self.assertFalse(QueryBudget.check("policy/data", self.run_queries(["SELECT 1"] * 3)))
+        self.assertTrue(QueryBudget.check("policy/data", self.run_queries(["SELECT 1"] * 2)))
+
+
+class CheckpointPlanningTests(SimpleTestCase):
+    def test_no_checkpoints_within_budget(self):
+        self.assertEqual(CheckpointPolicy.plan([100] * 5, [100, 10, 10, 10, 10], replay_budget=10_000), set())
+
+    def test_checkpoints_bound_replay_cost(self):
+        sizes = [1000] * 20
+        checkpoints = CheckpointPolicy.plan(sizes, [1000] + [50] * 19, replay_budget=3000)
+        self.assertNotIn(0, checkpoints)
+        cost = 0
+        for position in range(20):
+            cost = sizes[position] if position in checkpoints else cost + (sizes[position - 1] if position else 0) + (1000 if position == 0 else 50)
+            self.assertLessEqual(cost, 3000)
+
+    def test_large_rewrite_forces_earlier_checkpoint(self):
+        small = CheckpointPolicy.plan([1000] * 6, [1000] + [50] * 5, replay_budget=4000)
+        large = CheckpointPolicy.plan([1000] * 6, [1000, 2500] + [50] * 4, replay_budget=4000)
+        self.assertLess(min(large), min(small))
+
+    def test_change_budget_triggers_checkpoint(self):
+        checkpoints = CheckpointPolicy.plan([100] * 4, [100] * 4, [1, 30, 30, 30], replay_budget=10_000, change_budget=50)
+        self.assertEqual(checkpoints, {2})
+
+
+class BlobCodecTests(SimpleTestCase):
+    def test_tags_round_trip(self):
+        self.assertEqual(BlobCodec.parse_tag(BlobCodec.make_tag("zlib", 17)), ("zlib", 17))
+        self.assertEqual(BlobCodec.parse_tag("zlib"), ("zlib", None))
+
+    def test_zlib_round_trip_with_and_without_dictionary(self):
+        html = synthetic_policy_html(20 * 1024, pretty=True, seed=3)
+        dictionary = BlobCodec.build_dictionary([synthetic_policy_html(20 * 1024, pretty=True, seed=seed) for seed in range(4)])
+        self.assertLessEqual(len(dictionary), 32 * 1024)
+        plain = BlobCodec.compress(html.encode("utf-8"), "zlib")
+        primed = BlobCodec.compress(html.encode("utf-8"), "zlib", dictionary)
+        self.assertEqual(BlobCodec.decompress(plain, "zlib").decode("utf-8"), html)
+        self.assertEqual(BlobCodec.decompress(primed, "zlib", dictionary).decode("utf-8"), html)
+        self.assertLess(len(primed), len(plain))
+
+    def test_unknown_codec_is_rejected(self):
+        with self.assertRaises(ValueError):
+            BlobCodec.compress(b"x", "lz4")
+
+
+class ChunkStoreTests(SimpleTestCase):
+    def test_shared_lines_produce_shared_chunks(self):
+        body = synthetic_policy_html(40 * 1024, pretty=True, seed=5).split("\n")
+        first = PolicyChunkStore.split_chunks(["<h1>Acme Corp</h1>"] + body)
+        second = PolicyChunkStore.split_chunks(["<h1>Globex</h1>", "<p>Intro</p>"] + body)
+        self.assertEqual("\n".join(first).split("\n")[1:], body)
+        shared = set(map(PolicyChunkStore.digest, first)) & set(map(PolicyChunkStore.digest, second))
+        self.assertGreaterEqual(len(shared), len(first) - 2)
+
+    def test_round_trip_through_chunk_references(self):
+        old_html = synthetic_policy_html(8 * 1024, pretty=True, seed=1)
+        new_html = synthetic_policy_html(8 * 1024, pretty=True, seed=2)
+        diff = compute_html_diff(old_html, new_html)
+        stored = {}
+        with mock.patch.object(PolicyChunkStore, "store", side_effect=lambda contents, counts: stored.update(contents)):
+            columns = PolicyChunkStore.encode_version(diff, new_html)
+        self.assertEqual(columns["storage_codec"], "chunks")
+        self.assertIsNone(columns["checkpoint_template"])
+        self.assertTrue(set(PolicyChunkStore.diff_hashes(columns["diff_data"])) <= set(stored))
+        with mock.patch.object(PolicyChunkStore, "fetch", side_effect=AssertionError("prefetched chunks should suffice")):
+            self.assertEqual(PolicyChunkStore.expand_checkpoint(columns["checkpoint_blob"], dict(stored)), new_html)
+            self.assertEqual(apply_diff(old_html, PolicyChunkStore.expand_diff(columns["diff_data"], dict(stored))), new_html)
+
+    def test_small_versions_stay_inline(self):
+        diff = compute_html_diff("<p>a</p>", "<p>b</p>")
+        with mock.patch.object(PolicyChunkStore, "store") as store:
+            columns = PolicyChunkStore.encode_version(diff, "")
+        store.assert_not_called()
+        self.assertIs(columns["diff_data"], diff)
+        self.assertIsNone(columns["storage_codec"])
+
+
+class EndpointQueryBudgetTests(PolicyDatabaseTestCase):
+    """Fails when a write or read endpoint issues more queries than its QUERY_BUDGETS entry allows."""
+
+    def test_write_endpoints_stay_within_budget(self):
+        with assert_query_budget("policy/create-initialised"):
+            self.create_initial_version()
+        html = self.base_html
+        for step in range(3):
+            html = html.replace("</h2>", f" (rev {step})</h2>", 1)
+            with assert_query_budget("policy/update"):
+                self.update_policy(html)
+        self.assertEqual(PolicyVersion.objects.filter(org_policy_id=self.org_policy.id).count(), 4)
+
+    def test_read_endpoints_stay_within_budget(self):
+        self.create_initial_version()
+        html = self.base_html.replace("</h2>", " (revised)</h2>", 1)
+        version = self.update_policy(html)["version_number"]
+        with assert_query_budget("policy/data"):
+            self.assertEqual(self.policy_html(version), html)
+        with assert_query_budget("policy/download"), mock.patch.dict(os.environ, {"STACKFLOW_LOGO": ""}):
+            response = self.post("policy/download", {
+                "org_policy_id": str(self.org_policy.id), "version": version, "organization_id": str(self.organization.id),
+            })
+        self.assertEqual(response.status_code, 200)
+
+
+class ReaderConsistencyTests(PolicyDatabaseTestCase):
+    """Every endpoint that rebuilds a version replays it from its checkpoint and serves the same document."""
+
+    def test_readers_agree_when_a_checkpoint_disagrees_with_its_diff(self):
+        provided = synthetic_policy_html(6 * 1024, pretty=True, seed=12)
+        first = self.create_initial_version(html_content=provided)
+        # Chains written before v1's diff followed its checkpoint: the diff rebuilds the template instead.
+        PolicyVersion.objects.filter(id=first["policy_version_id"]).update(
+            diff_data=compute_html_diff("", self.base_html), diff_blob=None,
+        )
+        expected = {"1.0": provided}
+        html = provided
+        for step in range(2):
+            html = html.replace("</h2>", f" (rev {step})</h2>", 1)
+            expected[self.update_policy(html)["version_number"]] = html
+
+        response = self.post("policy/data/batch", {
+            "items": [{"org_policy_id": str(self.org_policy.id), "version": version} for version in expected],
+        })
+        batch = {result["version"]: result["html"] for result in response.json()["results"]}
+        response = self.post("policy/export", {"org_policy_id": str(self.org_policy.id)})
+        exported = {record["version"]: record["html"]
+                    for record in map(json.loads, b"".join(response.streaming_content).splitlines())}
+        for version, html in expected.items():
+            with self.subTest(version=version):
+                self.assertEqual(self.policy_html(version), html)
+                self.assertEqual(batch[version], html)
+                self.assertEqual(exported[version], html)
+                blame = self.post("policy/blame", {"org_policy_id": str(self.org_policy.id), "version": version}).json()
+                self.assertEqual("\n".join(line["text"] for line in blame["lines"]), html)
+
+        versions = list(expected)
+        delta = self.post("policy/delta", {
+            "org_policy_id": str(self.org_policy.id), "from_version": versions[0], "to_version": versions[-1],
+        }).json()
+        self.assertEqual(apply_diff(provided, delta["diff"]), html)
+
+
+class CompactionTests(PolicyDatabaseTestCase):
+    def test_squashing_drafts_keeps_kept_versions_byte_identical(self):
+        self.create_initial_version()
+        expected = {"1.0": self.base_html}
+        html = self.base_html
+        for step in range(8):
+            html = html.replace("</h2>", f" (rev {step})</h2>", 1)
+            expected[self.update_policy(html)["version_number"]] = html
+        versions = list(expected)
+        published = {versions[3], versions[6]}
+        PolicyVersion.objects.filter(org_policy_id=self.org_policy.id, version__in=published).update(status="published")
+
+        stats = compact_policy(self.org_policy.id, squash_drafts=True, checkpoint_bytes=16 * 1024)
+
+        kept = [versions[0], *sorted(published, key=versions.index), versions[-1]]
+        self.assertEqual(stats["result"], "compacted")
+        self.assertEqual(stats["squashed"], len(versions) - len(kept))
+        self.assertGreater(stats["checkpoints_after"], 0)
+        self.assertEqual(
+            list(PolicyVersion.objects.filter(org_policy_id=self.org_policy.id).order_by("created_at").values_list("version", flat=True)),
+            kept,
+        )
+        for version in kept:
+            with self.subTest(version=version):
+                self.assertEqual(self.policy_html(version), expected[version])
+        # The rewritten chain's checkpoints agree with its diffs, so a second pass has nothing to do.
+        self.assertEqual(compact_policy(self.org_policy.id, squash_drafts=True, checkpoint_bytes=16 * 1024)["result"], "unchanged")
+
+
+def fake_extract_pdf(path, member=None):
+    with open(path, "rb") as handle:
+        content = handle.read()
+    title, version, body = content.decode("utf-8").split("|", 2)
+    return {"sha256": hashlib.sha256(content).hexdigest(), "size": len(content), "text": f"{title} {version}",
+            "html": body}
+
+
+def fake_title_version(text):
+    title, version = text.rsplit(" ", 1)
+    return {"status": 200, "message": "ok"}, {"title": title, "version": version}
+
+
+@mock.patch("policy_tracker.services.import_service.ProcessPoolExecutor", ThreadPoolExecutor)
+@mock.patch("policy_tracker.services.import_service.extract_pdf_for_import", fake_extract_pdf)
+@mock.patch("policy_tracker.services.import_service.PolicyAIService.extract_title_version_from_pdf", fake_title_version)
+class LegacyImportTests(PolicyDatabaseTestCase):
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source)
+        self.addCleanup(lambda: os.path.exists(self.state_path) and os.remove(self.state_path))
+        self.state_path = f"{self.source}.import-state.json"
+
+    def write_pdf(self, name, version, html, title="Records Retention"):
+        with open(os.path.join(self.source, name), "w", encoding="utf-8") as handle:
+            handle.write(f"{title}|{version}|{html}")
+
+    def run_import(self, batch_size=25):
+        importer = LegacyPolicyImporter(self.organization, self.source, batch_size=batch_size, log=lambda message: None)
+        with self.captureOnCommitCallbacks(execute=True):
+            return importer.run()
+
+    def chain(self, title="Records Retention"):
+        org_policy = OrgPolicy.objects.get(title=title, organization=self.organization)
+        return list(PolicyVersion.objects.filter(org_policy_id=org_policy.id).order_by("created_at").values_list("version", flat=True))
+
+    def test_versions_are_appended_in_natural_order(self):
+        for name, version in (("a.pdf", "1.10"), ("b.pdf", "1.9"), ("c.pdf", "1.2")):
+            self.write_pdf(name, version, f"<p>Retention rules {version}</p>")
+        report = self.run_import()
+        self.assertEqual(report["imported"], 3)
+        self.assertEqual(self.chain(), ["1.2", "1.9", "1.10"])
+
+    def test_older_version_in_a_later_batch_is_refused(self):
+        self.write_pdf("a.pdf", "2.0", "<p>Retention rules 2.0</p>")
+        self.write_pdf("b.pdf", "1.9", "<p>Retention rules 1.9</p>")
+        report = self.run_import(batch_size=1)
+        self.assertEqual(report["imported"], 1)
+        self.assertIn("older than 2.0", report["failures"]["b.pdf"])
+        self.assertEqual(self.chain(), ["2.0"])
+
+    def test_resume_without_saved_state_does_not_duplicate_versions(self):
+        self.write_pdf("a.pdf", "1.0", "<p>Retention rules 1.0</p>")
+        self.write_pdf("b.pdf", "1.1", "<p>Retention rules 1.1</p>")
+        self.run_import(batch_size=1)
+        # As if the process stopped after the batches committed but before the state file was written.
+        os.remove(self.state_path)
+        report = self.run_import(batch_size=1)
+        self.assertEqual((report["imported"], report["skipped"]), (0, 2))
+        self.assertEqual(self.chain(), ["1.0", "1.1"])
+
+
+class PolicySearchTests(PolicyDatabaseTestCase):
+    provided = "<h1>Access Control</h1>\n<p>Badge readers guard the quarantine zone.</p>"
+
+    def search(self, query, **filters):
+        response = self.post("policy/search", {"query": query, "organization_id": str(self.organization.id), **filters})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["results"]
+
+    def test_initialised_version_is_indexed_with_the_content_it_serves(self):
+        created = self.create_initial_version(html_content=self.provided)
+        [result] = self.search("quarantine")
+        self.assertEqual((result["policy_version_id"], result["version"], result["is_head"]),
+                         (created["policy_version_id"], "1.0", True))
+        self.assertIn("<b>quarantine</b>", result["snippet"])
+        self.assertEqual(self.search("quarantine", department="Finance"), [])
+
+    def test_update_moves_the_head_and_drops_replaced_text(self):
+        self.create_initial_version(html_content=self.provided)
+        updated = self.update_policy(self.provided.replace("quarantine", "perimeter"))
+        self.assertEqual(self.search("quarantine"), [])
+        self.assertEqual([result["version"] for result in self.search("perimeter")], [updated["version_number"]])
+
+    def test_late_index_of_an_older_version_keeps_the_newer_head(self):
+        created = self.create_initial_version(html_content=self.provided)
+        updated = self.update_policy(self.provided.replace("quarantine", "perimeter"))
+        PolicySearchService.index_head(created["policy_version_id"], self.org_policy, "1.0", self.provided)
+        self.assertEqual(self.search("quarantine"), [])
+        [result] = self.search("perimeter")
+        self.assertEqual((result["version"], result["is_head"]), (updated["version_number"], True))
+
+    def test_history_is_searchable_when_kept(self):
+        PolicySearchService.index_version(uuid.uuid4(), self.org_policy, "1.0", self.provided, keep_history=True)
+        PolicySearchService.index_version(uuid.uuid4(), self.org_policy, "1.1", "<p>Visitors sign in.</p>", keep_history=True)
+        self.assertEqual(PolicySearchService.search("quarantine", self.organization.id), [])
+        [result] = PolicySearchService.search("quarantine", self.organization.id, include_history=True)
+        self.assertEqual((result["version"], result["is_head"]), ("1.0", False))
+
+
+class SQLiteSearchTests(SimpleTestCase):
+    """The FTS5 stand-in for policy_search_index that SQLite deployments use."""
+
+    def setUp(self):
+        self.connection = SQLiteDatabaseWrapper({**connection.settings_dict, "NAME": ":memory:"}, alias="search_fts5")
+        self.addCleanup(self.connection.close)
+        connections["search_fts5"] = self.connection
+        self.addCleanup(connections.__delitem__, "search_fts5")
+        search_migration = importlib.import_module("policy_tracker.migrations.0002_policy_search_index")
+        with self.connection.cursor() as cursor:
+            for statement in search_migration.SQLITE_SQL:
+                cursor.execute(statement)
+        patcher = mock.patch("policy_tracker.services.search_service.connection", self.connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.org_policy = mock.Mock(id=uuid.uuid4(), organization_id=uuid.uuid4(), department="IT", title="Access Control Policy")
+
+    def test_head_replaces_previous_version(self):
+        PolicySearchService.index_version(uuid.uuid4(), self.org_policy, "1.0", "<p>Badge readers guard the quarantine zone.</p>")
+        head_id = uuid.uuid4()
+        PolicySearchService.index_version(head_id, self.org_policy, "1.1", "<p>Badge readers guard the perimeter.</p>")
+        self.assertEqual(PolicySearchService.search("quarantine", self.org_policy.organization_id), [])
+        [result] = PolicySearchService.search("badge perimeter", self.org_policy.organization_id)
+        self.assertEqual((result["policy_version_id"], result["version"], result["is_head"]), (str(head_id), "1.1", True))
+        self.assertIn("<b>perimeter</b>", result["snippet"])
+        self.assertEqual(PolicySearchService.search("perimeter", uuid.uuid4()), [])
+
+    def test_punctuation_only_query_matches_nothing(self):
+        PolicySearchService.index_version(uuid.uuid4(), self.org_policy, "1.0", "<p>Badge readers.</p>")
+        self.assertEqual(PolicySearchService.search('"*', self.org_policy.organization_id), [])
+
+
+def crash_worker(chain, target_versions):
+    os._exit(1)
+
+
+class BatchEndpointTests(PolicyDatabaseTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(batch_service, "_executor", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: batch_service._executor and batch_service._executor.shutdown())
+        self.create_initial_version()
+        self.revised = self.base_html.replace("</h2>", " (revised)</h2>", 1)
+        self.revised_version = self.update_policy(self.revised)["version_number"]
+
+    def fetch(self, items):
+        response = self.post("policy/data/batch", {"items": items})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_results_and_per_item_errors(self):
+        policy_id = str(self.org_policy.id)
+        missing_id = str(uuid.uuid4())
+        body = self.fetch([
+            {"org_policy_id": policy_id}, {"org_policy_id": policy_id, "version": "1.0"},
+            {"org_policy_id": policy_id, "version": "9.9"}, {"org_policy_id": missing_id},
+        ])
+        results = {(result["org_policy_id"], result["version"]): result for result in body["results"]}
+        self.assertEqual((body["requested"], body["failed"]), (4, 2))
+        self.assertEqual(results[(policy_id, self.revised_version)]["html"], self.revised)
+        self.assertEqual(results[(policy_id, "1.0")]["html"], self.base_html)
+        self.assertEqual(results[(policy_id, "9.9")]["error"], "Version 9.9 not found for this policy")
+        self.assertEqual(results[(missing_id, None)]["error"], "OrgPolicy not found")
+
+    def test_invalid_items_are_rejected(self):
+        response = self.post("policy/data/batch", {"items": [{"org_policy_id": "not-a-uuid"}]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_a_broken_pool_is_replaced(self):
+        broken = ProcessPoolExecutor(max_workers=1)
+        with self.assertRaises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result()
+        batch_service._executor = broken
+        [result] = self.fetch([{"org_policy_id": str(self.org_policy.id)}])["results"]
+        self.assertEqual(result["html"], self.revised)
+        self.assertIsNot(batch_service._executor, broken)
+
+    def test_workers_that_keep_dying_are_reported(self):
+        with mock.patch.object(batch_service, "rebuild_policy_versions", crash_worker):
+            for _ in range(2):
+                [result] = self.fetch([{"org_policy_id": str(self.org_policy.id)}])["results"]
+                self.assertEqual(result["error"], "Reconstruction failed: the worker pool stopped")
+        [result] = self.fetch([{"org_policy_id": str(self.org_policy.id)}])["results"]
+        self.assertEqual(result["html"], self.revised)
+
+
+class VersionHistoryTests(PolicyDatabaseTestCase):
+    def setUp(self):
+        self.create_initial_version()
+        self.versions = ["1.0"]
+        html = self.base_html
+        for step in range(4):
+            html = html.replace("</h2>", f" (rev {step})</h2>", 1)
+            self.versions.append(self.update_policy(html)["version_number"])
+
+    def history(self, **payload):
+        response = self.post("policy/versions", {"org_policy_id": str(self.org_policy.id), **payload})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def walk(self, **payload):
+        pages, cursor = [], None
+        while True:
+            page = self.history(limit=2, **payload, **({"cursor": cursor} if cursor else {}))
+            pages.append([item["version"] for item in page["versions"]])
+            cursor = page["next_cursor"]
+            self.assertEqual(page["has_more"], cursor is not None)
+            if not cursor:
+                return pages
+
+    def test_keyset_pages_cover_the_history_once(self):
+        self.assertEqual(self.walk(), [self.versions[0:2], self.versions[2:4], self.versions[4:]])
+
+    def test_descending_order(self):
+        self.assertEqual(self.walk(order="desc"), [self.versions[:2:-1], self.versions[2:0:-1], self.versions[:1]])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.post("policy/versions", {"org_policy_id": str(self.org_policy.id), "cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "Invalid cursor")
+
+    def test_items_carry_approvers_and_stored_change_counts(self):
+        items = self.history(limit=10)["versions"]
+        stored = dict(PolicyVersion.objects.filter(org_policy_id=self.org_policy.id).values_list("version", "diff_data"))
+        for item in items:
+            with self.subTest(version=item["version"]):
+                self.assertEqual(item["approvers"], [{"approver_id": str(self.approver.id), "status": "pending"}])
+                self.assertEqual(item["changes_count"], len(stored[item["version"]]["changes"]))
+                self.assertGreater(item["changes_count"], 0)
+
+    def test_listing_never_reads_the_diff_or_checkpoint(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.history(limit=10)
+        listing = [query["sql"] for query in queries if "FROM \"policy_versions\"" in query["sql"]]
+        self.assertEqual(len(listing), 1)
+        self.assertNotIn("diff_data", listing[0])
+        self.assertNotIn("checkpoint_template", listing[0])
+
+
+def paged_pdf(pages):
+    body = "".join(f'<div style="page-break-after: always"><p>Marker{page:02d} section text.</p></div>' for page in range(1, pages + 1))
+    return render_pdf_from_html(f"<html><body>{body}</body></html>")
+
+
+class PdfExtractionTests(SimpleTestCase):
+    pdf = paged_pdf(6)
+
+    def setUp(self):
+        patcher = mock.patch.object(pdf_processor, "_extract_executor", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: pdf_processor._extract_executor and pdf_processor._extract_executor.shutdown())
+
+    def markers(self, text):
+        return re.findall(r"Marker(\d+)", text)
+
+    def test_head_mode_stops_at_max_pages(self):
+        text = PDFProcessor.extract_text_from_file(BytesIO(self.pdf), mode="head", max_pages=2, max_chars=10_000)
+        self.assertEqual(self.markers(text), ["01", "02"])
+
+    def test_head_mode_stops_at_max_chars(self):
+        text = PDFProcessor.extract_text_from_file(BytesIO(self.pdf), mode="head", max_pages=6, max_chars=30)
+        self.assertEqual(text, "Marker01 section text. Marker0")
+
+    @mock.patch.object(pdf_processor, "PDF_PARALLEL_MIN_PAGES", 2)
+    @mock.patch.object(pdf_processor, "PDF_EXTRACT_WORKERS", 4)
+    def test_full_mode_stitches_page_ranges_in_order(self):
+        text = PDFProcessor.extract_text_from_file(BytesIO(self.pdf))
+        self.assertEqual(self.markers(text), ["01", "02", "03", "04", "05", "06"])
+        self.assertIsNotNone(pdf_processor._extract_executor)
+
+    @mock.patch.object(pdf_processor, "PDF_PARALLEL_MIN_PAGES", 2)
+    @mock.patch.object(pdf_processor, "PDF_EXTRACT_WORKERS", 2)
+    def test_full_mode_replaces_a_broken_pool(self):
+        broken = ProcessPoolExecutor(max_workers=1)
+        with self.assertRaises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result()
+        pdf_processor._extract_executor = broken
+        text = PDFProcessor.extract_text_from_file(BytesIO(self.pdf))
+        self.assertEqual(self.markers(text), ["01", "02", "03", "04", "05", "06"])
+        self.assertIsNot(pdf_processor._extract_executor, broken)
+
+
+class BlameCacheTests(PolicyDatabaseTestCase):
+    def build_chain(self, drafts=4):
+        self.create_initial_version()
+        versions = ["1.0"]
+        html = self.base_html
+        for step in range(drafts):
+            html = html.replace("</h2>", f" (rev {step})</h2>", 1)
+            versions.append(self.update_policy(html)["version_number"])
+        return versions
+
+    def blame(self, version=None):
+        payload = {"org_policy_id": str(self.org_policy.id), **({"version": version} if version else {})}
+        response = self.post("policy/blame", payload)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_newer_version_extends_the_cached_ancestor(self):
+        versions = self.build_chain()
+        self.blame(versions[2])
+        body = self.blame()
+        self.assertEqual((body["cached_base_version"], body["diffs_replayed"]), (versions[2], 2))
+        self.assertEqual(self.blame()["diffs_replayed"], 0)
+
+    def test_squashed_drafts_are_not_served_from_entries_cached_before(self):
+        versions = self.build_chain()
+        self.blame()
+        # Compaction runs in another process: nothing it does reaches this process's cache.
+        compact_policy(self.org_policy.id, squash_drafts=True)
+        stale_ids = set(versions[1:-1])
+        body = self.blame()
+        self.assertIsNone(body["cached_base_version"])
+        self.assertFalse({line["version"] for line in body["lines"]} & (stale_ids | {None}))
+        cache.clear()
+        self.assertEqual(self.blame()["lines"], body["lines"])
+
+
+class CompareEndpointTests(PolicyDatabaseTestCase):
+    provided = "<h1>Access Control</h1>\n<p>Badge readers guard the quarantine zone.</p>\n<p>Visitors sign in.</p>"
+
+    def setUp(self):
+        self.create_initial_version(html_content=self.provided)
+        self.edited = self.provided.replace("quarantine", "perimeter")
+        self.edit_version = self.update_policy(self.edited)["version_number"]
+
+    def compare(self, from_version, to_version, **extra):
+        return self.post("policy/compare", {
+            "org_policy_id": str(self.org_policy.id), "from_version": from_version, "to_version": to_version, **extra,
+        })
+
+    def test_range_without_checkpoint_composes_the_stored_deltas(self):
+        body = self.compare("1.0", self.edit_version).json()
+        self.assertEqual(body["comparison_method"], "composed")
+        self.assertIn("<del>quarantine</del>", body["redline_html"])
+        self.assertIn("<ins>perimeter</ins>", body["redline_html"])
+        self.assertEqual((body["words_deleted"], body["words_inserted"], body["changed_regions"]), (1, 1, 1))
+
+    def test_checkpoint_in_range_falls_back_to_reconstruction(self):
+        with mock.patch.object(CheckpointPolicy, "should_checkpoint", return_value=True):
+            latest = self.update_policy(self.edited.replace("Visitors", "Contractors"))["version_number"]
+        index = PolicyService.get_policy_checkpoint_index(self.org_policy.id)
+        self.assertEqual([row[4] for row in index][1:], [False, True])
+        body = self.compare("1.0", latest).json()
+        self.assertEqual(body["comparison_method"], "rebuilt")
+        for fragment in ("<del>quarantine</del>", "<ins>perimeter</ins>", "<del>Visitors</del>", "<ins>Contractors</ins>"):
+            self.assertIn(fragment, body["redline_html"])
+
+    def test_second_call_is_served_from_the_cache(self):
+        first = self.compare("1.0", self.edit_version).json()
+        with mock.patch.object(PolicyBlameService, "annotate") as annotate:
+            second = self.compare("1.0", self.edit_version).json()
+        annotate.assert_not_called()
+        self.assertEqual(second["redline_html"], first["redline_html"])
+
+    def test_reversed_range_is_rebuilt_with_the_opposite_redline(self):
+        body = self.compare(self.edit_version, "1.0").json()
+        self.assertEqual(body["comparison_method"], "rebuilt")
+        self.assertIn("<del>perimeter</del>", body["redline_html"])
+        self.assertIn("<ins>quarantine</ins>", body["redline_html"])
+
+    def test_unknown_version_is_not_found(self):
+        response = self.compare("1.0", "9.9")
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("9.9", response.json()["error"])
+        self.assertEqual(self.compare("1.0", "").status_code, 400)
+
+    def test_pdf_is_rendered_on_request_only(self):
+        body = self.compare("1.0", self.edit_version, include_pdf=True).json()
+        self.assertTrue(base64.b64decode(body["pdf_base64"]).startswith(b"%PDF"))
+        self.assertNotIn("pdf_base64", self.compare("1.0", self.edit_version).json())
+
+
+class PdfUploadTests(SimpleTestCase):
+    limit = 4096
+
+    def setUp(self):
+        patcher = mock.patch.object(view_operations, "POLICY_UPLOAD_MAX_BYTES", self.limit)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, content, **extra):
+        upload = SimpleUploadedFile("policy.pdf", content, content_type="application/pdf")
+        return view_operations.upload_policy_pdf_op(RequestFactory().post("/policy/upload-pdf", {"file": upload}, **extra))
+
+    def test_declared_length_over_the_limit_is_rejected(self):
+        with mock.patch.object(view_operations.PDFProcessor, "extract_text_from_file") as extract:
+            response = self.upload(b"%PDF-" + b"x" * self.limit)
+        self.assertEqual(response.status_code, 413)
+        extract.assert_not_called()
+
+    def test_body_is_cut_off_at_the_chunk_that_crosses_the_limit(self):
+        guard, _ = spooled_upload_handlers(None, 10)
+        guard.handle_raw_input(None, {}, None, None)
+        guard.new_file("file", "policy.pdf", "application/pdf", None)
+        self.assertEqual(guard.receive_data_chunk(b"x" * 6, 0), b"x" * 6)
+        with self.assertRaises(StopUpload) as stopped:
+            guard.receive_data_chunk(b"x" * 6, 6)
+        self.assertTrue(stopped.exception.connection_reset)
+        self.assertTrue(guard.exceeded)
+
+    def test_non_multipart_request_is_rejected(self):
+        request = RequestFactory().post("/policy/upload-pdf", b"%PDF-", content_type="application/pdf")
+        self.assertEqual(view_operations.upload_policy_pdf_op(request).status_code, 415)
+
+    def test_file_is_spooled_to_disk(self):
+        spooled = []
+
+        def extract(uploaded_file, mode):
+            spooled.append(isinstance(uploaded_file, TemporaryUploadedFile))
+            return "Access Control Policy v1.2"
+
+        with mock.patch.object(view_operations.PDFProcessor, "extract_text_from_file", side_effect=extract), \
+                mock.patch.object(view_operations, "extract_title_version_from_pdf",
+                                  return_value=("ok", {"title": "Access Control Policy", "version": "1.2"})):
+            response = self.upload(b"%PDF-1.4 small")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(spooled, [True])
+        self.assertEqual(json.loads(response.content)["version"], "1.2")
+
+
+@override_settings(CACHES={**settings.CACHES, "ai_extraction": {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "ai-extraction-tests",
+}})
+class ExtractionCacheTests(SimpleTestCase):
+    pdf_text = "Access Control Policy\nVersion 1.2\nBadge readers guard the quarantine zone."
+
+    def setUp(self):
+        self.store = caches["ai_extraction"]
+        self.addCleanup(self.store.clear)
+        patcher = mock.patch.object(self.store, "set", wraps=self.store.set)
+        self.store_set = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reply(self, title, version):
+        response = mock.Mock()
+        response.json.return_value = {"response": json.dumps({"title": title, "version": version})}
+        return response
+
+    def extract(self, replies, bypass_cache=False):
+        with mock.patch.object(policy_service.requests, "post", side_effect=replies) as post:
+            result, extracted = PolicyAIService.extract_title_version_from_pdf(self.pdf_text, bypass_cache=bypass_cache)
+        return result, extracted, post.call_count
+
+    def stored_ttls(self):
+        return [call.args[2] for call in self.store_set.call_args_list]
+
+    def test_success_is_cached_for_the_full_ttl(self):
+        result, extracted, calls = self.extract([self.reply("Access Control Policy", "1.2")])
+        self.assertEqual((extracted, calls), ({"title": "Access Control Policy", "version": "1.2"}, 1))
+        self.assertEqual(self.stored_ttls(), [policy_service.AI_EXTRACTION_CACHE_TTL])
+        result, extracted, calls = self.extract([])
+        self.assertEqual((result["cached"], extracted["version"], calls), (True, "1.2", 0))
+
+    def test_missing_fields_are_cached_for_the_negative_ttl(self):
+        result, extracted, _ = self.extract([self.reply("Access Control Policy", None)])
+        self.assertEqual((result["missing_fields"], extracted), (["version"], None))
+        self.assertEqual(self.stored_ttls(), [policy_service.AI_EXTRACTION_NEGATIVE_TTL])
+        result, _, calls = self.extract([])
+        self.assertEqual((result["cached"], calls), (True, 0))
+
+    def test_transport_errors_are_not_cached(self):
+        for error in (requests.Timeout(), requests.ConnectionError("refused")):
+            with self.subTest(error=type(error).__name__):
+                result, extracted, _ = self.extract(error)
+                self.assertEqual((result["status"], extracted), (408 if isinstance(error, requests.Timeout) else 400, None))
+        self.store_set.assert_not_called()
+        _, extracted, calls = self.extract([self.reply("Access Control Policy", "1.2")])
+        self.assertEqual((extracted["version"], calls), ("1.2", 1))
+
+    def test_bypass_cache_overwrites_the_stored_answer(self):
+        self.extract([self.reply("Access Control Policy", "1.2")])
+        _, extracted, calls = self.extract([self.reply("Access Control Policy", "1.3")], bypass_cache=True)
+        self.assertEqual((extracted["version"], calls), ("1.3", 1))
+        result, extracted, calls = self.extract([])
+        self.assertEqual((result["cached"], extracted["version"], calls), (True, "1.3", 0))
+
+
+class PromptBuilderTests(SimpleTestCase):
+    def test_token_estimate_rounds_up(self):
+        self.assertEqual([PromptBuilder.estimate_tokens("x" * size) for size in (0, 1, 4, 5, 8)], [0, 1, 1, 2, 2])
+
+    def test_markup_and_repeated_boilerplate_are_stripped(self):
+        template = (
+            "<html><head><title>Ignored</title><style>p { color: red; }</style></head><body>"
+            "<nav>Home | About</nav><!-- draft note --><script>track()</script>"
+            "<h1>Access &amp; Control</h1><p>Confidential</p><p>Badge   readers<br>guard doors.</p>"
+            "<h2>Scope</h2><p>Confidential</p><ul><li>Staff</li><li>Visitors</li></ul>"
+            "<table><tr><td>Owner</td><td>IT</td></tr></table><p>Confidential</p><footer>Page 1</footer>"
+            "</body></html>"
+        )
+        self.assertEqual(PromptBuilder.condense_template(template), "\n".join([
+            "# Access & Control", "Confidential", "Badge readers", "guard doors.",
+            "## Scope", "- Staff", "- Visitors", "Owner | IT",
+        ]))
+
+    def test_truncation_keeps_headings_and_cuts_bodies_at_sentences(self):
+        text = "\n".join([
+            "# Purpose", "Short body.",
+            "# Scope", "First sentence of scope. " * 12,
+            "# Roles", "Owners approve changes. " * 12,
+        ])
+        context, truncated = PromptBuilder.truncate_sections(text, 40)
+        self.assertLessEqual(len(context), 40 * CHARS_PER_TOKEN)
+        self.assertEqual(truncated, 2)
+        self.assertEqual([line for line in context.split("\n") if line.startswith("#")], ["# Purpose", "# Scope", "# Roles"])
+        self.assertIn("Short body.", context)
+        self.assertIn("scope. [...]", context)
+        self.assertEqual(PromptBuilder.truncate_sections(text, 1000), (text, 0))
+
+    def test_output_never_exceeds_the_budget(self):
+        rng = random.Random(39)
+        for _ in range(2000):
+            lines = [
+                "#" * rng.randint(1, 3) + " " + "Heading" * rng.randint(1, 3) if rng.random() < 0.3
+                else " ".join(rng.choice(["Badge", "readers.", "guard", "doors;"]) for _ in range(rng.randint(1, 30)))
+                for _ in range(rng.randint(1, 30))
+            ]
+            budget = rng.randint(1, 60)
+            context, truncated = PromptBuilder.truncate_sections("\n".join(lines), budget)
+            self.assertLessEqual(len(context), budget * CHARS_PER_TOKEN, (lines, budget))
+            if "further sections omitted" in context:
+                self.assertTrue(context.endswith("further sections omitted]"))
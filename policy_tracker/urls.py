@@ -7,4 +7,13 @@ urlpatterns = [
     path("policy/update", views.update_policy, name="update_policy"),
     path("policy/data", views.get_policy_version_html, name="get_policy_version_html"),
     path("policy/download", views.get_policy_pdf, name="get_policy_version_html"),
+    path("policy/delta", views.get_policy_version_delta, name="get_policy_version_delta"),
+    path("policy/versions", views.list_policy_versions, name="list_policy_versions"),
+    path("policy/export", views.export_policy_history, name="export_policy_history"),
+    path("policy/data/batch", views.get_policy_versions_batch, name="get_policy_versions_batch"),
+    path("policy/search", views.search_policies, name="search_policies"),
+    path("policy/blame", views.get_policy_blame, name="get_policy_blame"),
+    path("policy/compare", views.compare_policy_versions, name="compare_policy_versions"),
+    path("policy/upload-pdf", views.upload_policy_pdf, name="upload_policy_pdf"),
+    path("metrics", views.metrics, name="metrics"),
 ]
\ No newline at end of file
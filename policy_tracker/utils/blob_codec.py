@@ -0,0 +1,90 @@
+import zlib
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # optional: zlib is always available
+    zstandard = None
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+ZLIB_MAX_DICTIONARY_BYTES = 32 * 1024  # zlib only looks back 32 KB, so a longer zdict is wasted
+ZSTD_DICTIONARY_BYTES = 112 * 1024
+CODECS = ("zlib", "zstd")
+
+
+class BlobCodec:
+    """
+    Compresses stored HTML and diff JSON, optionally against a shared dictionary.
+
+    A codec tag names the algorithm and, after a colon, the id of the dictionary the blob was
+    compressed with ("zlib", "zstd:17"). The tag is stored next to the blob so every row can
+    be decoded on its own, whatever the current default codec or dictionary is.
+    """
+
+    @staticmethod
+    def available_codecs() -> Tuple[str, ...]:
+        return CODECS if zstandard is not None else ("zlib",)
+
+    @staticmethod
+    def make_tag(codec: str, dictionary_id: Optional[int] = None) -> str:
+        return f"{codec}:{dictionary_id}" if dictionary_id is not None else codec
+
+    @staticmethod
+    def parse_tag(tag: str) -> Tuple[str, Optional[int]]:
+        codec, _, dictionary_id = tag.partition(":")
+        return codec, int(dictionary_id) if dictionary_id else None
+
+    @staticmethod
+    def compress(data: bytes, codec: str = "zlib", dictionary: Optional[bytes] = None) -> bytes:
+        if codec == "zlib":
+            compressor = zlib.compressobj(ZLIB_LEVEL, zdict=dictionary) if dictionary else zlib.compressobj(ZLIB_LEVEL)
+            return compressor.compress(data) + compressor.flush()
+        if codec == "zstd":
+            if zstandard is None:
+                raise ValueError("zstd codec requested but the zstandard package is not installed")
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            return zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data).compress(data)
+        raise ValueError(f"Unknown codec {codec!r}")
+
+    @staticmethod
+    def decompress(blob: bytes, codec: str, dictionary: Optional[bytes] = None) -> bytes:
+        if codec == "zlib":
+            decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+            return decompressor.decompress(bytes(blob)) + decompressor.flush()
+        if codec == "zstd":
+            if zstandard is None:
+                raise ValueError("Blob is zstd-compressed but the zstandard package is not installed")
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(bytes(blob))
+        raise ValueError(f"Unknown codec {codec!r}")
+
+    @staticmethod
+    def build_dictionary(samples: Iterable[str], codec: str = "zlib") -> bytes:
+        """
+        Dictionary from sample documents: a trained zstd dictionary when zstandard is available
+        and the samples suffice, otherwise the lines the samples share, most common last
+        (zlib matches best against the end of its zdict).
+        """
+        samples = [sample for sample in samples if sample]
+        if codec == "zstd" and zstandard is not None and len(samples) >= 8:
+            try:
+                return zstandard.train_dictionary(ZSTD_DICTIONARY_BYTES, [sample.encode("utf-8") for sample in samples]).as_bytes()
+            except zstandard.ZstdError:
+                pass
+        limit = ZLIB_MAX_DICTIONARY_BYTES if codec == "zlib" else ZSTD_DICTIONARY_BYTES
+        counts: Counter = Counter()
+        for sample in samples:
+            counts.update(set(line.strip() for line in sample.splitlines() if line.strip()))
+        minimum = 2 if len(samples) > 1 else 1
+        shared: List[str] = [line for line, count in sorted(counts.items(), key=lambda item: item[1]) if count >= minimum]
+        return "\n".join(shared).encode("utf-8")[-limit:]
+
+
+def compress(data: bytes, codec: str = "zlib", dictionary: Optional[bytes] = None) -> bytes:
+    return BlobCodec.compress(data, codec, dictionary)
+
+
+def decompress(blob: bytes, codec: str, dictionary: Optional[bytes] = None) -> bytes:
+    return BlobCodec.decompress(blob, codec, dictionary)
@@ -0,0 +1,94 @@
+from typing import Iterable, List, Optional, Set, Tuple
+from decouple import config
+
+CHECKPOINT_REPLAY_BYTES = config('POLICY_CHECKPOINT_REPLAY_BYTES', default=2 * 1024 * 1024, cast=int)
+CHECKPOINT_CHANGES = config('POLICY_CHECKPOINT_CHANGES', default=2000, cast=int)
+
+
+class CheckpointPolicy:
+    """
+    Decides where full checkpoint_template copies go, by replay cost rather than version count.
+
+    Applying one version's diff costs roughly the length of the document it is applied to
+    plus the size of the diff (apply_diff splits and re-joins the whole document), so ten
+    typo fixes on a small policy are cheap while one rewrite of a large one is not. A new
+    version becomes a checkpoint when the cost of replaying up to it from the previous
+    checkpoint would pass replay_budget bytes, or its change operations would pass
+    change_budget, which bounds the work of any reconstruction.
+    """
+
+    @staticmethod
+    def step_cost(document_length: int, diff_bytes: int) -> int:
+        return document_length + diff_bytes
+
+    @staticmethod
+    def should_checkpoint(
+        replay_bytes: int,
+        changes: int,
+        step_bytes: int,
+        step_changes: int,
+        replay_budget: Optional[int] = None,
+        change_budget: Optional[int] = None,
+    ) -> bool:
+        """replay_bytes/changes are accumulated since the last checkpoint; step_* describe the new version."""
+        replay_budget = CHECKPOINT_REPLAY_BYTES if replay_budget is None else replay_budget
+        change_budget = CHECKPOINT_CHANGES if change_budget is None else change_budget
+        return replay_bytes + step_bytes > replay_budget or changes + step_changes > change_budget
+
+    @staticmethod
+    def plan(
+        document_sizes: List[int],
+        diff_sizes: List[int],
+        change_counts: Optional[Iterable[int]] = None,
+        replay_budget: Optional[int] = None,
+        change_budget: Optional[int] = None,
+    ) -> Set[int]:
+        """
+        Positions in a whole history that should carry a checkpoint.
+
+        Cutting greedily whenever the next version would pass the budget gives the fewest
+        checkpoints that keep every reconstruction under it. Position 0 never needs one:
+        its diff is applied to an empty document.
+        """
+        change_counts = list(change_counts) if change_counts is not None else [0] * len(diff_sizes)
+        checkpoints: Set[int] = set()
+        replay_bytes = changes = 0
+        for position, diff_size in enumerate(diff_sizes):
+            is_checkpoint, replay_bytes, changes = CheckpointPolicy.next_step(
+                replay_bytes, changes, document_sizes[position - 1] if position else None, diff_size,
+                change_counts[position], document_sizes[position], replay_budget, change_budget,
+            )
+            if is_checkpoint:
+                checkpoints.add(position)
+        return checkpoints
+
+    @staticmethod
+    def next_step(
+        replay_bytes: int,
+        changes: int,
+        previous_size: Optional[int],
+        diff_size: int,
+        change_count: int,
+        document_size: int,
+        replay_budget: Optional[int] = None,
+        change_budget: Optional[int] = None,
+    ) -> Tuple[bool, int, int]:
+        """
+        One version of plan(), for callers that walk a history once: returns (is_checkpoint,
+        replay_bytes, changes) after the version. previous_size is None for the first version.
+        """
+        step_bytes = CheckpointPolicy.step_cost(previous_size or 0, diff_size)
+        if previous_size is not None and CheckpointPolicy.should_checkpoint(
+            replay_bytes, changes, step_bytes, change_count, replay_budget, change_budget,
+        ):
+            # Reconstructing from here starts by loading this version's full copy.
+            return True, document_size, 0
+        return False, replay_bytes + step_bytes, changes + change_count
+
+
+def should_checkpoint(replay_bytes: int, changes: int, step_bytes: int, step_changes: int) -> bool:
+    return CheckpointPolicy.should_checkpoint(replay_bytes, changes, step_bytes, step_changes)
+
+
+def plan_checkpoints(document_sizes: List[int], diff_sizes: List[int], change_counts=None) -> Set[int]:
+    return CheckpointPolicy.plan(document_sizes, diff_sizes, change_counts)
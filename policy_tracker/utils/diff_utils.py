@@ -1,6 +1,16 @@
+import bisect
 import difflib
 import json
-from typing import Dict, List, Any, Union
+import logging
+import re
+from typing import Dict, List, Any, Optional, Tuple, Union
+
+# A segment is either ("copy", start, end) over the base lines or ("lines", [...]) literal lines.
+Segment = Tuple[Any, ...]
+
+_WORD_TOKEN_PATTERN = re.compile(r'<[^>]*>|\s+|[^\s<]+|<')
+
+logger = logging.getLogger(__name__)
 
 
 class DiffProcessor:
@@ -43,30 +53,29 @@ class DiffProcessor:
 
     @staticmethod
     def apply_diff(base_html: str, diff_data: Union[Dict, str]) -> str:
-        print(f"[apply_diff] base_html length={len(base_html)}, diff_data type={type(diff_data)}")
+        # Called once per version during replay: evaluate the level once and do no formatting otherwise.
+        debug = logger.isEnabledFor(logging.DEBUG)
         if isinstance(diff_data, str):
             try:
                 diff_json = json.loads(diff_data)
-                print("[apply_diff] Parsed diff_data from JSON string")
             except json.JSONDecodeError:
-                print("[apply_diff] Failed to parse diff_data string — returning base_html")
+                logger.warning("apply_diff: diff_data is not valid JSON, returning base_html unchanged")
                 return base_html
         elif isinstance(diff_data, dict):
             diff_json = diff_data
         else:
-            print(f"[apply_diff] Unsupported diff_data type: {type(diff_data)}")
+            logger.warning("apply_diff: unsupported diff_data type %s", type(diff_data).__name__)
             return base_html
         changes = diff_json.get("changes")
         if not isinstance(changes, list):
-            print("[apply_diff] Invalid diff_data structure: missing 'changes' list")
+            logger.warning("apply_diff: diff_data has no 'changes' list, returning base_html unchanged")
             return base_html
         old_lines = DiffProcessor.split_html_lines(base_html)
         result: List[str] = []
         cursor = 0
-        print(f"[apply_diff] Applying {len(changes)} changes...")
         for idx, change in enumerate(changes):
             if not isinstance(change, dict):
-                print(f"[apply_diff] Skipping invalid change at index {idx}")
+                logger.warning("apply_diff: skipping invalid change at index %d", idx)
                 continue
             old_info = change.get("old", {})
             new_info = change.get("new", {})
@@ -84,14 +93,291 @@ class DiffProcessor:
             elif op_type == "delete":
                 pass
             else:
-                print(f"[apply_diff] Unknown operation type: {op_type}")
+                logger.warning("apply_diff: unknown operation type %r", op_type)
             cursor = i2
         if cursor < len(old_lines):
             result.extend(old_lines[cursor:])
         final_html = "\n".join(result)
-        print(f"[apply_diff] Completed — final length: {len(final_html)}")
+        if debug:
+            logger.debug(
+                "apply_diff: %d changes, %d -> %d chars", len(changes), len(base_html), len(final_html),
+                extra={"changes": len(changes), "base_length": len(base_html), "final_length": len(final_html)},
+            )
         return final_html
 
+    @staticmethod
+    def apply_diff_annotated(lines: List[str], origins: List[int], diff_data: Union[Dict, str, None], origin: int) -> Tuple[List[str], List[int]]:
+        # Same result as apply_diff on "\n".join(lines), carrying one origin marker per line.
+        diff_json = DiffProcessor.load_diff(diff_data)
+        if diff_json is None:
+            return lines, origins
+        new_lines: List[str] = []
+        new_origins: List[int] = []
+        for segment in DiffProcessor._diff_segments(diff_json, len(lines)):
+            if segment[0] == "copy":
+                new_lines.extend(lines[segment[1]:segment[2]])
+                new_origins.extend(origins[segment[1]:segment[2]])
+            else:
+                new_lines.extend(segment[1])
+                new_origins.extend([origin] * len(segment[1]))
+        if new_lines == [""]:
+            # apply_diff joins and re-splits, so a lone empty line collapses to an empty document.
+            return [], []
+        return new_lines, new_origins
+
+    @staticmethod
+    def _wrap_words(tokens: List[str], tag: str) -> List[str]:
+        # Markup tokens pass through untouched so the redline stays well formed.
+        wrapped: List[str] = []
+        run: List[str] = []
+        for token in tokens:
+            if token.startswith("<") and token.endswith(">"):
+                if run:
+                    wrapped.append(f"<{tag}>{''.join(run)}</{tag}>")
+                    run = []
+                wrapped.append(token)
+            else:
+                run.append(token)
+        if run:
+            wrapped.append(f"<{tag}>{''.join(run)}</{tag}>")
+        return wrapped
+
+    @staticmethod
+    def redline_words(old_html: str, new_html: str) -> Tuple[str, Dict[str, int]]:
+        old_tokens = _WORD_TOKEN_PATTERN.findall(old_html)
+        new_tokens = _WORD_TOKEN_PATTERN.findall(new_html)
+        matcher = difflib.SequenceMatcher(a=old_tokens, b=new_tokens, autojunk=False)
+        parts: List[str] = []
+        stats = {"words_inserted": 0, "words_deleted": 0}
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                parts.extend(new_tokens[j1:j2])
+                continue
+            if tag in ("delete", "replace"):
+                # Deleted markup is dropped; the new version's structure wins.
+                deleted = [t for t in old_tokens[i1:i2] if not (t.startswith("<") and t.endswith(">"))]
+                stats["words_deleted"] += sum(1 for t in deleted if not t.isspace())
+                parts.extend(DiffProcessor._wrap_words(deleted, "del"))
+            if tag in ("insert", "replace"):
+                inserted = new_tokens[j1:j2]
+                stats["words_inserted"] += sum(1 for t in inserted if not t.isspace() and not t.startswith("<"))
+                parts.extend(DiffProcessor._wrap_words(inserted, "ins"))
+        return "".join(parts), stats
+
+    @staticmethod
+    def render_redline(base_lines: List[str], diff_data: Union[Dict, str]) -> Tuple[str, Dict[str, int]]:
+        diff_json = DiffProcessor.load_diff(diff_data)
+        stats = {"words_inserted": 0, "words_deleted": 0, "changed_regions": 0}
+        if diff_json is None:
+            return "\n".join(base_lines), stats
+        output: List[str] = []
+        cursor = 0
+        total_old = len(base_lines)
+        for change in diff_json["changes"]:
+            if not isinstance(change, dict):
+                continue
+            old_info = change.get("old", {})
+            i1 = max(0, min(old_info.get("start", 0), total_old))
+            i2 = max(0, min(old_info.get("end", 0), total_old))
+            if cursor < i1:
+                output.extend(base_lines[cursor:i1])
+            new_lines = change.get("new", {}).get("lines", []) if change.get("op", "replace") in ("replace", "insert") else []
+            redline, region_stats = DiffProcessor.redline_words("\n".join(base_lines[i1:i2]), "\n".join(new_lines))
+            output.append(redline)
+            stats["words_inserted"] += region_stats["words_inserted"]
+            stats["words_deleted"] += region_stats["words_deleted"]
+            stats["changed_regions"] += 1
+            cursor = i2
+        if cursor < total_old:
+            output.extend(base_lines[cursor:])
+        return "\n".join(output), stats
+
+    @staticmethod
+    def load_diff(diff_data: Union[Dict, str, None]) -> Optional[Dict[str, Any]]:
+        if isinstance(diff_data, str):
+            if not diff_data.strip():
+                return None
+            try:
+                diff_data = json.loads(diff_data)
+            except json.JSONDecodeError:
+                return None
+        if not isinstance(diff_data, dict) or not isinstance(diff_data.get("changes"), list):
+            return None
+        return diff_data
+
+    @staticmethod
+    def _diff_segments(diff_json: Optional[Dict[str, Any]], total_old: int) -> List[Segment]:
+        # Mirrors the cursor walk in apply_diff, but yields base ranges instead of copied lines.
+        if diff_json is None:
+            return [("copy", 0, total_old)] if total_old else []
+        segments: List[Segment] = []
+        cursor = 0
+        for change in diff_json["changes"]:
+            if not isinstance(change, dict):
+                continue
+            old_info = change.get("old", {})
+            i1 = max(0, min(old_info.get("start", 0), total_old))
+            i2 = max(0, min(old_info.get("end", 0), total_old))
+            if cursor < i1:
+                segments.append(("copy", cursor, i1))
+            if change.get("op", "replace") in ("replace", "insert"):
+                new_lines = change.get("new", {}).get("lines", [])
+                if new_lines:
+                    segments.append(("lines", list(new_lines)))
+            cursor = i2
+        if cursor < total_old:
+            segments.append(("copy", cursor, total_old))
+        return segments
+
+    @staticmethod
+    def _segment_length(segment: Segment) -> int:
+        if segment[0] == "copy":
+            return segment[2] - segment[1]
+        return len(segment[1])
+
+    @staticmethod
+    def _slice_segments(segments: List[Segment], offsets: List[int], start: int, end: int) -> List[Segment]:
+        # offsets[k] is the output line at which segments[k] begins.
+        sliced: List[Segment] = []
+        k = max(0, bisect.bisect_right(offsets, start) - 1)
+        while k < len(segments) and start < end:
+            seg_start = offsets[k]
+            seg_len = DiffProcessor._segment_length(segments[k])
+            lo = start - seg_start
+            hi = min(end - seg_start, seg_len)
+            if hi > lo:
+                if segments[k][0] == "copy":
+                    base = segments[k][1]
+                    sliced.append(("copy", base + lo, base + hi))
+                else:
+                    sliced.append(("lines", segments[k][1][lo:hi]))
+                start = seg_start + hi
+            k += 1
+        return sliced
+
+    @staticmethod
+    def _known_old_lines(diff_json: Optional[Dict[str, Any]], total_old: int) -> Dict[int, str]:
+        known: Dict[int, str] = {}
+        if diff_json is None:
+            return known
+        for change in diff_json["changes"]:
+            if not isinstance(change, dict):
+                continue
+            old_info = change.get("old", {})
+            start = old_info.get("start", 0)
+            for offset, line in enumerate(old_info.get("lines", [])):
+                if 0 <= start + offset < total_old:
+                    known[start + offset] = line
+        return known
+
+    @staticmethod
+    def _segments_to_diff(segments: List[Segment], total_old: int, known_old: Dict[int, str]) -> List[Dict[str, Any]]:
+        changes: List[Dict[str, Any]] = []
+        cursor = 0
+        out = 0
+        pending: List[str] = []
+
+        def flush(upto: int) -> None:
+            nonlocal out, pending
+            if upto <= cursor and not pending:
+                return
+            if upto > cursor and pending:
+                op = "replace"
+            elif upto > cursor:
+                op = "delete"
+            else:
+                op = "insert"
+            changes.append({
+                "op": op,
+                "old": {
+                    "start": cursor,
+                    "end": upto,
+                    "lines": [known_old.get(i, "") for i in range(cursor, upto)],
+                },
+                "new": {
+                    "start": out,
+                    "end": out + len(pending),
+                    "lines": pending,
+                },
+            })
+            out += len(pending)
+            pending = []
+
+        for segment in segments:
+            if segment[0] == "lines":
+                pending.extend(segment[1])
+                continue
+            _, start, end = segment
+            if start == end:
+                continue
+            if start < cursor:
+                raise ValueError("Diff changes are out of order and cannot be composed")
+            flush(start)
+            out += end - start
+            cursor = end
+        flush(total_old)
+        return changes
+
+    @staticmethod
+    def compose_diffs(first: Union[Dict, str, None], second: Union[Dict, str, None]) -> Dict[str, Any]:
+        first_json = DiffProcessor.load_diff(first)
+        second_json = DiffProcessor.load_diff(second)
+        if first_json is None and second_json is None:
+            raise ValueError("At least one diff is required")
+        anchor = first_json if first_json is not None else second_json
+        if "old_line_count" not in anchor:
+            raise ValueError("Diff is missing old_line_count")
+        total_old = anchor["old_line_count"]
+
+        first_segments = DiffProcessor._diff_segments(first_json, total_old)
+        offsets: List[int] = []
+        mid_count = 0
+        for segment in first_segments:
+            offsets.append(mid_count)
+            mid_count += DiffProcessor._segment_length(segment)
+
+        known_old = DiffProcessor._known_old_lines(first_json, total_old)
+        composed: List[Segment] = []
+        for segment in DiffProcessor._diff_segments(second_json, mid_count):
+            if segment[0] == "lines":
+                composed.append(segment)
+            else:
+                composed.extend(DiffProcessor._slice_segments(first_segments, offsets, segment[1], segment[2]))
+
+        # Lines the second diff removed from untouched base regions are only known by its old.lines.
+        for mid_index, line in DiffProcessor._known_old_lines(second_json, mid_count).items():
+            for seg in DiffProcessor._slice_segments(first_segments, offsets, mid_index, mid_index + 1):
+                if seg[0] == "copy":
+                    known_old.setdefault(seg[1], line)
+
+        changes = DiffProcessor._segments_to_diff(composed, total_old, known_old)
+        new_line_count = sum(DiffProcessor._segment_length(segment) for segment in composed)
+        last = second_json if second_json is not None else first_json
+        return {
+            "changes": changes,
+            "old_line_count": total_old,
+            "new_line_count": new_line_count,
+            "old_length": anchor.get("old_length"),
+            "new_length": last.get("new_length"),
+        }
+
+    @staticmethod
+    def squash_chain(diffs: List[Union[Dict, str, None]], check_links: bool = True) -> Optional[Dict[str, Any]]:
+        chain = [diff_json for diff_json in (DiffProcessor.load_diff(d) for d in diffs) if diff_json is not None]
+        if not chain:
+            return None
+        if check_links:
+            for previous, current in zip(chain, chain[1:]):
+                if previous.get("new_line_count") != current.get("old_line_count"):
+                    raise ValueError("Diff chain is not contiguous")
+        # Pairwise rounds keep each composed diff small instead of growing one accumulator.
+        while len(chain) > 1:
+            merged = [DiffProcessor.compose_diffs(chain[i], chain[i + 1]) for i in range(0, len(chain) - 1, 2)]
+            if len(chain) % 2:
+                merged.append(chain[-1])
+            chain = merged
+        return chain[0]
+
 
 def split_html_lines(html: str) -> List[str]:
     return DiffProcessor.split_html_lines(html)
@@ -103,3 +389,11 @@ def compute_html_diff(old_html: str, new_html: str) -> Dict[str, Any]:
 
 def apply_diff(base_html: str, diff_data) -> str:
     return DiffProcessor.apply_diff(base_html, diff_data)
+
+
+def compose_diffs(first, second) -> Dict[str, Any]:
+    return DiffProcessor.compose_diffs(first, second)
+
+
+def squash_chain(diffs, check_links: bool = True) -> Optional[Dict[str, Any]]:
+    return DiffProcessor.squash_chain(diffs, check_links)
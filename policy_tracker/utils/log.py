@@ -0,0 +1,41 @@
+import json
+import logging
+import random
+
+# Attributes every LogRecord has; anything else on a record came from `extra=` and is emitted as a field.
+_STANDARD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class SampledDebugFilter(logging.Filter):
+    """
+    Lets through only a fraction of DEBUG records; INFO and above always pass.
+
+    Sampling caps the volume when debug logging is switched on for a busy path such as
+    apply_diff. It does not make debug logging free: callers still guard expensive
+    arguments with isEnabledFor so nothing is formatted while DEBUG is off.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1.0 or random.random() < self.rate
+
+
+class StructuredFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any `extra=` fields."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
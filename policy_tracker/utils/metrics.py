@@ -0,0 +1,177 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+# Phase name -> [seconds, calls] for the request being served; None outside a request.
+_request_phases: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("policy_tracker_request_phases", default=None)
+_endpoint: ContextVar[str] = ContextVar("policy_tracker_endpoint", default="background")
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # Label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = sorted((key, list(series[0]), series[1], series[2]) for key, series in self._series.items())
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                bucket_label = 'le="' + le + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, bucket_label)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+class MetricsRegistry:
+    """
+    Process-local metric registry rendered in the Prometheus text format.
+
+    Each worker process keeps its own numbers; scrape every worker (or run a single one)
+    as with any multi-process deployment of a Prometheus client.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "policy_tracker_request_seconds", "Request latency by endpoint.", ("endpoint", "method", "status")))
+PHASE_SECONDS = REGISTRY.register(Histogram(
+    "policy_tracker_phase_seconds", "Time spent in each request phase.", ("endpoint", "phase")))
+DIFF_BYTES = REGISTRY.register(Histogram(
+    "policy_tracker_diff_bytes", "Serialized size of computed diffs.", ("endpoint",), BYTES_BUCKETS))
+REPLAY_VERSIONS = REGISTRY.register(Histogram(
+    "policy_tracker_replay_versions", "Diffs applied to reconstruct one version.", ("endpoint",), COUNT_BUCKETS))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "policy_tracker_cache_requests_total", "Cache lookups by cache and result.", ("cache", "result")))
+
+
+class PhaseTimer:
+    @staticmethod
+    @contextmanager
+    def request(endpoint: str):
+        """Collect phase timings for one request; yields the {phase: [seconds, calls]} dict."""
+        phases: Dict[str, List[float]] = {}
+        phases_token = _request_phases.set(phases)
+        endpoint_token = _endpoint.set(endpoint)
+        try:
+            yield phases
+        finally:
+            _request_phases.reset(phases_token)
+            _endpoint.reset(endpoint_token)
+
+    @staticmethod
+    def record(phase: str, seconds: float) -> None:
+        PHASE_SECONDS.observe(seconds, endpoint=_endpoint.get(), phase=phase)
+        phases = _request_phases.get()
+        if phases is not None:
+            totals = phases.setdefault(phase, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+
+    @staticmethod
+    @contextmanager
+    def span(phase: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            PhaseTimer.record(phase, time.perf_counter() - started)
+
+    @staticmethod
+    def endpoint() -> str:
+        return _endpoint.get()
+
+
+def span(phase: str):
+    return PhaseTimer.span(phase)
+
+
+def observe_diff_size(diff_json_str: str) -> None:
+    DIFF_BYTES.observe(len(diff_json_str), endpoint=_endpoint.get())
+
+
+def observe_replay_length(diffs_applied: int) -> None:
+    REPLAY_VERSIONS.observe(diffs_applied, endpoint=_endpoint.get())
+
+
+def record_cache(cache_name: str, hit: bool, count: int = 1) -> None:
+    if count:
+        CACHE_REQUESTS.inc(count, cache=cache_name, result="hit" if hit else "miss")
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
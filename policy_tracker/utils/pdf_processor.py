@@ -1,8 +1,68 @@
 import base64
+import hashlib
+import html
+import logging
+import os
 import re
-from io import BytesIO
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO, StringIO
+from typing import BinaryIO, Iterable, Iterator, List, Optional
+from decouple import config
+from pdfminer.converter import TextConverter
 from pdfminer.high_level import extract_text
-from pdfminer.pdfdocument import PDFTextExtractionNotAllowed
+from pdfminer.layout import LAParams
+from pdfminer.pdfdocument import PDFDocument, PDFTextExtractionNotAllowed
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import resolve1
+
+PDF_HEAD_MAX_PAGES = config('PDF_HEAD_MAX_PAGES', default=3, cast=int)
+PDF_HEAD_MAX_CHARS = config('PDF_HEAD_MAX_CHARS', default=4000, cast=int)
+PDF_EXTRACT_WORKERS = config('PDF_EXTRACT_WORKERS', default=4, cast=int)
+PDF_PARALLEL_MIN_PAGES = config('PDF_PARALLEL_MIN_PAGES', default=16, cast=int)
+
+_extract_executor = None
+
+logger = logging.getLogger(__name__)
+
+# Precompiled passes for html_to_text. Tag passes that share a replacement are merged into one
+# alternation; that is only equivalent to the original one-pattern-per-pass order while no "<"
+# appears inside another tag, which _NESTED_TAG_PATTERN checks before the merged passes run.
+_SCRIPT_PATTERN = re.compile(r'<script[^>]*>.*?</script>', re.DOTALL)
+_STYLE_PATTERN = re.compile(r'<style[^>]*>.*?</style>', re.DOTALL)
+_BLOCK_PATTERN = re.compile(r'<script[^>]*>.*?</script>|<style[^>]*>.*?</style>', re.DOTALL)
+_BLOCK_START_PATTERN = re.compile(r'<script|<style')
+_NESTED_TAG_PATTERN = re.compile(r'<[^>]*<')
+_BR_PATTERN = re.compile(r'<br\s*/?>', re.IGNORECASE)
+_PARAGRAPH_PATTERN = re.compile(r'<p[^>]*>|</p>|<h[1-6][^>]*>|</h[1-6]>', re.IGNORECASE)
+_LIST_ITEM_PATTERN = re.compile(r'<li[^>]*>', re.IGNORECASE)
+_TAG_PATTERN = re.compile(r'<[^>]+>')
+_BLANK_LINES_PATTERN = re.compile(r'\n\s*\n')
+_SPACE_RUN_PATTERN = re.compile(r'  +')
+
+
+def _get_extract_executor():
+    global _extract_executor
+    if _extract_executor is None:
+        _extract_executor = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS)
+    return _extract_executor
+
+
+def _discard_extract_executor(executor):
+    """Drop a pool that lost a worker (e.g. to an OOM); a broken ProcessPoolExecutor refuses every later call."""
+    global _extract_executor
+    if _extract_executor is executor:
+        _extract_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_page_range(path, start, end):
+    return extract_text(path, page_numbers=range(start, end))
 
 
 class PDFProcessor:
@@ -10,16 +70,87 @@ class PDFProcessor:
     def extract_text_from_pdf(pdf_data: str) -> str:
         try:
             pdf_bytes = base64.b64decode(pdf_data)
-            text_content = extract_text(BytesIO(pdf_bytes))
+        except Exception as e:
+            logger.warning("Error decoding PDF payload: %s", e)
+            return ""
+        return PDFProcessor.extract_text_from_file(BytesIO(pdf_bytes))
+
+    @staticmethod
+    def extract_text_from_file(pdf_file: BinaryIO, mode: str = "full", max_pages: Optional[int] = None, max_chars: Optional[int] = None) -> str:
+        """
+        Extract text from a seekable binary file handle, e.g. an upload spooled to disk.
+        mode="head" stops after max_pages pages or max_chars characters, whichever comes first;
+        mode="full" reads every page, spreading large documents across a process pool.
+        """
+        try:
+            if mode == "head":
+                return PDFProcessor._extract_head(
+                    pdf_file,
+                    max_pages if max_pages is not None else PDF_HEAD_MAX_PAGES,
+                    max_chars if max_chars is not None else PDF_HEAD_MAX_CHARS,
+                )
+            text_content = PDFProcessor._extract_full(pdf_file)
             text_content = re.sub(r'\s+', ' ', text_content).strip()
             return text_content
         except PDFTextExtractionNotAllowed:
-            print("PDF does not allow text extraction")
+            logger.info("PDF does not allow text extraction")
             return ""
         except Exception as e:
-            print(f"Error extracting PDF text: {str(e)}")
+            logger.warning("Error extracting PDF text: %s", e)
             return ""
 
+    @staticmethod
+    def _extract_head(pdf_file: BinaryIO, max_pages: int, max_chars: int) -> str:
+        resource_manager = PDFResourceManager(caching=True)
+        output = StringIO()
+        text_content = ""
+        with TextConverter(resource_manager, output, laparams=LAParams()) as device:
+            interpreter = PDFPageInterpreter(resource_manager, device)
+            for page in PDFPage.get_pages(pdf_file, maxpages=max_pages):
+                interpreter.process_page(page)
+                text_content = re.sub(r'\s+', ' ', output.getvalue()).strip()
+                if len(text_content) >= max_chars:
+                    break
+        return text_content[:max_chars]
+
+    @staticmethod
+    def count_pages(pdf_file: BinaryIO) -> int:
+        document = PDFDocument(PDFParser(pdf_file))
+        pages = resolve1(document.catalog.get('Pages'))
+        return int(resolve1(pages.get('Count'))) if pages else 0
+
+    @staticmethod
+    def _extract_full(pdf_file: BinaryIO) -> str:
+        page_count = PDFProcessor.count_pages(pdf_file)
+        pdf_file.seek(0)
+        if PDF_EXTRACT_WORKERS < 2 or page_count < PDF_PARALLEL_MIN_PAGES:
+            return extract_text(pdf_file)
+
+        path = getattr(pdf_file, 'temporary_file_path', lambda: None)()
+        temporary_path = None
+        if path is None:
+            # Workers open the document themselves, so in-memory handles are spooled to disk once.
+            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as handle:
+                shutil.copyfileobj(pdf_file, handle)
+                temporary_path = path = handle.name
+        try:
+            step = -(-page_count // PDF_EXTRACT_WORKERS)
+            ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+            # A pool that broke is replaced and the document retried once; a second break is raised.
+            for attempt in range(2):
+                executor = _get_extract_executor()
+                try:
+                    # map() yields in submission order, so the page ranges are stitched back in sequence.
+                    return "".join(executor.map(_extract_page_range, [path] * len(ranges), *zip(*ranges)))
+                except BrokenProcessPool:
+                    _discard_extract_executor(executor)
+                    if attempt:
+                        raise
+                    logger.warning("PDF extraction pool broke; retrying on a new pool")
+        finally:
+            if temporary_path:
+                os.unlink(temporary_path)
+
     @staticmethod
     def extract_text_from_pdf_preserve_formatting(pdf_data: str) -> str:
         try:
@@ -30,18 +161,33 @@ class PDFProcessor:
             text_content = text_content.strip()
             return text_content
         except PDFTextExtractionNotAllowed:
-            print("PDF does not allow text extraction")
+            logger.info("PDF does not allow text extraction")
             return ""
         except Exception as e:
-            print(f"Error extracting PDF text: {str(e)}")
+            logger.warning("Error extracting PDF text: %s", e)
             return ""
 
     @staticmethod
-    def html_to_text(html_content: str) -> str:
-        if not html_content:
-            return ""
-        html_content = re.sub(r'<script[^>]*>.*?</script>', '', html_content, flags=re.DOTALL)
-        html_content = re.sub(r'<style[^>]*>.*?</style>', '', html_content, flags=re.DOTALL)
+    def text_to_html(text_content: str) -> str:
+        """Wrap extracted plain text in paragraphs so it can be stored as a policy template."""
+        text_content = re.sub(r'[ \t]+', ' ', text_content.replace('\x0c', '\n'))
+        paragraphs = [p.strip() for p in re.split(r'\n\s*\n', text_content) if p.strip()]
+        body = "\n".join(
+            "<p>" + "<br/>".join(html.escape(line.strip()) for line in paragraph.split("\n")) + "</p>"
+            for paragraph in paragraphs
+        )
+        return f"<!DOCTYPE html>\n<html>\n<body>\n{body}\n</body>\n</html>"
+
+    @staticmethod
+    def _strip_blocks(html_content: str) -> str:
+        if '<script' in html_content:
+            html_content = _SCRIPT_PATTERN.sub('', html_content)
+        if '<style' in html_content:
+            html_content = _STYLE_PATTERN.sub('', html_content)
+        return html_content
+
+    @staticmethod
+    def _replace_tags_multipass(html_content: str) -> str:
         html_content = re.sub(r'<br\s*/?>', '\n', html_content, flags=re.IGNORECASE)
         html_content = re.sub(r'<p[^>]*>', '\n\n', html_content, flags=re.IGNORECASE)
         html_content = re.sub(r'</p>', '\n\n', html_content, flags=re.IGNORECASE)
@@ -50,17 +196,129 @@ class PDFProcessor:
         html_content = re.sub(r'<li[^>]*>', '\n• ', html_content, flags=re.IGNORECASE)
         html_content = re.sub(r'</li>', '', html_content, flags=re.IGNORECASE)
         html_content = re.sub(r'<[^>]+>', '', html_content)
-        html_content = re.sub(r'\n\s*\n', '\n\n', html_content)
-        html_content = re.sub(r'[ \t]+', ' ', html_content)
-        html_content = html_content.strip()
         return html_content
 
+    @staticmethod
+    def _replace_tags(html_content: str) -> str:
+        if _NESTED_TAG_PATTERN.search(html_content):
+            return PDFProcessor._replace_tags_multipass(html_content)
+        html_content = _BR_PATTERN.sub('\n', html_content)
+        html_content = _PARAGRAPH_PATTERN.sub('\n\n', html_content)
+        html_content = _LIST_ITEM_PATTERN.sub('\n• ', html_content)
+        return _TAG_PATTERN.sub('', html_content)
+
+    @staticmethod
+    def _normalize_whitespace(text: str) -> str:
+        text = _BLANK_LINES_PATTERN.sub('\n\n', text)
+        if '\t' in text:
+            text = text.replace('\t', ' ')
+        return _SPACE_RUN_PATTERN.sub(' ', text)
+
+    @staticmethod
+    def _safe_cut(buffer: str) -> int:
+        # Cut right after the last ">" that is not inside a script/style block still waiting for its end tag.
+        limit = len(buffer)
+        position = 0
+        while True:
+            start = _BLOCK_START_PATTERN.search(buffer, position)
+            if not start:
+                break
+            block = _BLOCK_PATTERN.match(buffer, start.start())
+            if not block or (block.group().startswith('<style') and '<script' in block.group()):
+                limit = start.start()
+                break
+            position = block.end()
+        return buffer.rfind('>', 0, limit) + 1
+
+    @staticmethod
+    def iter_html_to_text(chunks: Iterable[str]) -> Iterator[str]:
+        """
+        Stream html_to_text over an iterable of HTML chunks. The joined output is identical
+        to html_to_text("".join(chunks)), while only the unfinished tail of the input is buffered.
+        """
+        pending_html = ""
+        pending_space = ""
+        started = False
+        fallback_parts: List[str] = []
+
+        def emit(text: str) -> Iterator[str]:
+            nonlocal pending_space, started
+            text = pending_space + text
+            body = text.rstrip()
+            pending_space = text[len(body):]
+            if not started:
+                body = body.lstrip()
+                started = bool(body)
+            if body:
+                yield PDFProcessor._normalize_whitespace(body)
+
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if fallback_parts:
+                fallback_parts.append(chunk)
+                continue
+            pending_html += chunk
+            cut = PDFProcessor._safe_cut(pending_html)
+            if not cut:
+                continue
+            segment, pending_html = pending_html[:cut], pending_html[cut:]
+            stripped = PDFProcessor._strip_blocks(segment)
+            if _NESTED_TAG_PATTERN.search(stripped) or stripped.rfind('<') > stripped.rfind('>'):
+                # A tag may continue past this segment; finish the document with the original passes.
+                fallback_parts.extend([segment, pending_html])
+                pending_html = ""
+                continue
+            yield from emit(PDFProcessor._replace_tags(stripped))
+
+        if fallback_parts:
+            remainder = PDFProcessor._strip_blocks("".join(fallback_parts))
+            yield from emit(PDFProcessor._replace_tags_multipass(remainder))
+        elif pending_html:
+            yield from emit(PDFProcessor._replace_tags(PDFProcessor._strip_blocks(pending_html)))
+
+    @staticmethod
+    def html_to_text(html_content: str) -> str:
+        if not html_content:
+            return ""
+        text = PDFProcessor._replace_tags(PDFProcessor._strip_blocks(html_content))
+        return PDFProcessor._normalize_whitespace(text).strip()
+
+
+def extract_pdf_for_import(path, member=None):
+    """
+    Process-pool worker for the legacy import: read one PDF (optionally a zip member),
+    hash it and return normalised text for title detection plus simple HTML for storage.
+    """
+    try:
+        if member:
+            with zipfile.ZipFile(path) as archive:
+                pdf_bytes = archive.read(member)
+        else:
+            with open(path, 'rb') as handle:
+                pdf_bytes = handle.read()
+        raw_text = extract_text(BytesIO(pdf_bytes))
+        return {
+            "sha256": hashlib.sha256(pdf_bytes).hexdigest(),
+            "size": len(pdf_bytes),
+            "text": re.sub(r'\s+', ' ', raw_text).strip(),
+            "html": PDFProcessor.text_to_html(raw_text),
+        }
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {str(e)}"}
+
 
 def extract_text_from_pdf(pdf_data):
     return PDFProcessor.extract_text_from_pdf(pdf_data)
 
+def extract_text_from_file(pdf_file, mode="full", max_pages=None, max_chars=None):
+    return PDFProcessor.extract_text_from_file(pdf_file, mode, max_pages, max_chars)
+
 def extract_text_from_pdf_preserve_formatting(pdf_data):
     return PDFProcessor.extract_text_from_pdf_preserve_formatting(pdf_data)
 
 def html_to_text(html_content):
-    return PDFProcessor.html_to_text(html_content)
\ No newline at end of file
+    return PDFProcessor.html_to_text(html_content)
+
+def iter_html_to_text(chunks):
+    return PDFProcessor.iter_html_to_text(chunks)
\ No newline at end of file
@@ -0,0 +1,161 @@
+import html
+import re
+from typing import Dict, List, Optional, Tuple
+from decouple import config
+
+PROMPT_TEMPLATE_TOKEN_BUDGET = config('AI_PROMPT_TEMPLATE_TOKEN_BUDGET', default=1500, cast=int)
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARKER = " [...]"
+
+_DROP_BLOCK_PATTERN = re.compile(
+    r'<!--.*?-->|<(head|script|style|nav|footer|noscript|svg)\b[^>]*>.*?</\1\s*>',
+    re.DOTALL | re.IGNORECASE,
+)
+_HEADING_PATTERN = re.compile(r'<h([1-6])\b[^>]*>', re.IGNORECASE)
+_LIST_ITEM_PATTERN = re.compile(r'<li\b[^>]*>', re.IGNORECASE)
+_CELL_PATTERN = re.compile(r'</t[dh]\s*>', re.IGNORECASE)
+_BLOCK_END_PATTERN = re.compile(r'<br\s*/?>|</(p|div|h[1-6]|li|tr|table|ul|ol|section|article)\s*>', re.IGNORECASE)
+_TAG_PATTERN = re.compile(r'<[^>]+>')
+_INLINE_SPACE_PATTERN = re.compile(r'[ \t\r\f\v]+')
+_SENTENCE_END_PATTERN = re.compile(r'[.!?;:](\s|$)')
+
+
+class PromptBuilder:
+    """
+    Turns a stored policy template into a compact outline that fits a token budget.
+
+    Markup, scripts, navigation and repeated boilerplate lines are stripped first; if the
+    outline is still over budget every heading is kept and the section bodies share what
+    is left, small sections whole and large ones cut at a sentence boundary.
+    """
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    @staticmethod
+    def condense_template(template_html: str) -> str:
+        text = _DROP_BLOCK_PATTERN.sub('', template_html or '')
+        text = _HEADING_PATTERN.sub(lambda match: '\n' + '#' * int(match.group(1)) + ' ', text)
+        text = _LIST_ITEM_PATTERN.sub('\n- ', text)
+        text = _CELL_PATTERN.sub(' | ', text)
+        text = _BLOCK_END_PATTERN.sub('\n', text)
+        text = html.unescape(_TAG_PATTERN.sub(' ', text))
+
+        lines = [_INLINE_SPACE_PATTERN.sub(' ', line).strip(' |') for line in text.split('\n')]
+        lines = [line for line in lines if line and line != '-']
+        # Lines that repeat verbatim (running headers, "Confidential", page footers) carry no structure.
+        counts: Dict[str, int] = {}
+        for line in lines:
+            counts[line] = counts.get(line, 0) + 1
+        seen = set()
+        condensed = []
+        for line in lines:
+            if counts[line] > 2 and not line.startswith('#'):
+                if line in seen:
+                    continue
+                seen.add(line)
+            condensed.append(line)
+        return '\n'.join(condensed)
+
+    @staticmethod
+    def split_sections(text: str) -> List[Tuple[str, str]]:
+        sections: List[Tuple[str, List[str]]] = [('', [])]
+        for line in text.split('\n'):
+            if line.startswith('#'):
+                sections.append((line, []))
+            else:
+                sections[-1][1].append(line)
+        return [(heading, '\n'.join(body)) for heading, body in sections if heading or body]
+
+    @staticmethod
+    def _cut_body(body: str, max_chars: int) -> str:
+        if len(body) <= max_chars:
+            return body
+        if max_chars <= len(TRUNCATION_MARKER):
+            return ''
+        window = body[:max_chars - len(TRUNCATION_MARKER)]
+        boundary = None
+        for match in _SENTENCE_END_PATTERN.finditer(window):
+            boundary = match.end()
+        if boundary is None or boundary < len(window) // 2:
+            boundary = window.rfind(' ')
+            if boundary < len(window) // 2:
+                boundary = len(window)
+        return window[:boundary].rstrip() + TRUNCATION_MARKER
+
+    @staticmethod
+    def truncate_sections(text: str, budget_tokens: int) -> Tuple[str, int]:
+        """Fit text into budget_tokens; returns (text, number of sections cut or dropped)."""
+        limit_chars = budget_chars = budget_tokens * CHARS_PER_TOKEN
+        if len(text) <= budget_chars:
+            return text, 0
+        sections = PromptBuilder.split_sections(text)
+
+        # Headings are the skeleton the model copies, so they are reserved first. When not all of
+        # them fit, the omission marker and its newline are reserved before any section is chosen.
+        heading_chars = sum(len(heading) + 1 for heading, _ in sections)
+        if heading_chars > budget_chars:
+            budget_chars -= len(f"[{len(sections)} further sections omitted]") + 1
+        kept = []
+        used = 0
+        for heading, body in sections:
+            cost = len(heading) + 1
+            if used + cost > budget_chars:
+                break
+            kept.append((heading, body))
+            used += cost
+        dropped = len(sections) - len(kept)
+
+        # Water-fill the rest: the smallest bodies fit whole, the others split the remainder evenly.
+        remaining = budget_chars - used
+        allowance = {}
+        pending = sorted(range(len(kept)), key=lambda index: len(kept[index][1]))
+        while pending:
+            share = remaining // len(pending)
+            index = pending[0]
+            size = len(kept[index][1]) + 1
+            if size <= share:
+                allowance[index] = size
+                remaining -= size
+                pending.pop(0)
+            else:
+                for index in pending:
+                    allowance[index] = share
+                break
+
+        lines = []
+        truncated = dropped
+        for index, (heading, body) in enumerate(kept):
+            cut = PromptBuilder._cut_body(body, max(allowance[index] - 1, 0))
+            if cut != body:
+                truncated += 1
+            if heading:
+                lines.append(heading)
+            if cut:
+                lines.append(cut)
+        marker = f"[{dropped} further sections omitted]"
+        # Only a budget too small for the marker itself leaves it out; nothing else was kept then.
+        if dropped and len(marker) <= limit_chars:
+            lines.append(marker)
+        return '\n'.join(lines), truncated
+
+    @staticmethod
+    def build_template_context(template_html: str, budget_tokens: Optional[int] = None) -> Tuple[str, Dict[str, int]]:
+        budget_tokens = PROMPT_TEMPLATE_TOKEN_BUDGET if budget_tokens is None else budget_tokens
+        condensed = PromptBuilder.condense_template(template_html)
+        context, truncated_sections = PromptBuilder.truncate_sections(condensed, budget_tokens)
+        return context, {
+            "template_tokens": PromptBuilder.estimate_tokens(template_html or ''),
+            "condensed_tokens": PromptBuilder.estimate_tokens(condensed),
+            "context_tokens": PromptBuilder.estimate_tokens(context),
+            "truncated_sections": truncated_sections,
+        }
+
+
+def estimate_tokens(text: str) -> int:
+    return PromptBuilder.estimate_tokens(text)
+
+
+def build_template_context(template_html: str, budget_tokens: Optional[int] = None) -> Tuple[str, Dict[str, int]]:
+    return PromptBuilder.build_template_context(template_html, budget_tokens)
@@ -0,0 +1,105 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Optional, Tuple
+from django.conf import settings
+from django.db import connection
+from .metrics import COUNT_BUCKETS, Histogram, PhaseTimer, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SLOW_STATEMENT_PREVIEW_CHARS = 500
+
+REQUEST_QUERIES = REGISTRY.register(Histogram(
+    "policy_tracker_request_queries", "Database queries issued per request.", ("endpoint",), COUNT_BUCKETS))
+
+
+class QueryProfile:
+    """
+    execute_wrapper that counts queries, sums their time and keeps the slowest statement.
+
+    Install with connection.execute_wrapper(profile). Query time is also reported to the
+    "db" phase for /metrics and Server-Timing.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.slowest: Optional[Tuple[float, str]] = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.total_seconds += elapsed
+            if self.slowest is None or elapsed > self.slowest[0]:
+                self.slowest = (elapsed, sql)
+            PhaseTimer.record("db", elapsed)
+
+    def summary(self):
+        return {
+            "query_count": self.count,
+            "db_ms": round(self.total_seconds * 1000, 1),
+            "slowest_ms": round(self.slowest[0] * 1000, 1) if self.slowest else 0.0,
+            "slowest_sql": self.slowest[1][:SLOW_STATEMENT_PREVIEW_CHARS] if self.slowest else None,
+        }
+
+
+class QueryBudget:
+    """Per-endpoint query-count and DB-time budgets from settings.QUERY_BUDGETS."""
+
+    @staticmethod
+    def for_endpoint(endpoint: str) -> Tuple[Optional[int], Optional[float]]:
+        budgets = getattr(settings, "QUERY_BUDGETS", {})
+        budget = budgets.get(endpoint, budgets.get("default", {}))
+        return budget.get("queries"), budget.get("db_ms")
+
+    @staticmethod
+    def check(endpoint: str, profile: QueryProfile) -> bool:
+        """Record the request's query count; log and return False when a budget is exceeded."""
+        REQUEST_QUERIES.observe(profile.count, endpoint=endpoint)
+        max_queries, max_db_ms = QueryBudget.for_endpoint(endpoint)
+        summary = profile.summary()
+        over_count = max_queries is not None and profile.count > max_queries
+        over_time = max_db_ms is not None and summary["db_ms"] > max_db_ms
+        if over_count or over_time:
+            logger.warning(
+                "Query budget exceeded on %s: %d queries (budget %s), %.1f ms in DB (budget %s)",
+                endpoint, profile.count, max_queries, summary["db_ms"], max_db_ms,
+                extra={"endpoint": endpoint, "query_budget": max_queries, "db_ms_budget": max_db_ms, **summary},
+            )
+            return False
+        return True
+
+
+@contextmanager
+def profile_queries(using_connection=None):
+    """Profile every query issued on the connection inside the block; yields the QueryProfile."""
+    profile = QueryProfile()
+    with (using_connection or connection).execute_wrapper(profile):
+        yield profile
+
+
+@contextmanager
+def assert_query_budget(endpoint: str, max_queries: Optional[int] = None):
+    """
+    Test helper: fail when the block issues more queries than the endpoint's budget.
+
+        with assert_query_budget("policy/data"):
+            client.post("/policy/data", payload, content_type="application/json")
+
+    Pass max_queries to pin an exact ceiling in a test instead of the configured budget.
+    """
+    if max_queries is None:
+        max_queries, _ = QueryBudget.for_endpoint(endpoint)
+    with profile_queries() as profile:
+        yield profile
+    if max_queries is not None and profile.count > max_queries:
+        summary = profile.summary()
+        raise AssertionError(
+            f"{endpoint} issued {profile.count} queries, budget is {max_queries} "
+            f"(slowest {summary['slowest_ms']} ms: {summary['slowest_sql']})"
+        )
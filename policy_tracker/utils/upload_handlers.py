@@ -0,0 +1,42 @@
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload, TemporaryFileUploadHandler
+
+
+class SizeLimitedUploadHandler(FileUploadHandler):
+    """
+    Rejects uploads larger than max_bytes before they are spooled anywhere. It has to run
+    first in request.upload_handlers so the declared Content-Length is checked up front and
+    oversized bodies are cut off at the first chunk that crosses the limit.
+    """
+
+    def __init__(self, max_bytes, request=None):
+        super().__init__(request)
+        self.max_bytes = max_bytes
+        self.received = 0
+        self.exceeded = False
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # StopUpload is only caught once parsing starts, so an oversized declared length is
+        # recorded here and enforced when the first file part begins.
+        if content_length and content_length > self.max_bytes:
+            self.exceeded = True
+
+    def new_file(self, *args, **kwargs):
+        if self.exceeded:
+            raise StopUpload(connection_reset=True)
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self.exceeded = True
+            raise StopUpload(connection_reset=True)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def spooled_upload_handlers(request, max_bytes):
+    """Size guard first, then always spool file parts to a temporary file on disk."""
+    guard = SizeLimitedUploadHandler(max_bytes, request)
+    return guard, [guard, TemporaryFileUploadHandler(request)]
@@ -6,6 +6,15 @@ from .services.view_operations import (
     update_policy_op,
     get_policy_version_html_op,
     get_policy_pdf_op,
+    get_policy_version_delta_op,
+    list_policy_versions_op,
+    export_policy_history_op,
+    get_policy_versions_batch_op,
+    search_policies_op,
+    get_policy_blame_op,
+    compare_policy_versions_op,
+    upload_policy_pdf_op,
+    metrics_op,
 )
 
 
@@ -41,4 +50,64 @@ def get_policy_version_html(request):
 @require_http_methods(["POST"])
 def get_policy_pdf(request):
     body_bytes = request.body
-    return get_policy_pdf_op(body_bytes)
\ No newline at end of file
+    return get_policy_pdf_op(body_bytes)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def get_policy_version_delta(request):
+    body_bytes = request.body
+    return get_policy_version_delta_op(body_bytes)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def list_policy_versions(request):
+    body_bytes = request.body
+    return list_policy_versions_op(body_bytes)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def export_policy_history(request):
+    body_bytes = request.body
+    return export_policy_history_op(body_bytes)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def get_policy_versions_batch(request):
+    body_bytes = request.body
+    return get_policy_versions_batch_op(body_bytes)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def search_policies(request):
+    body_bytes = request.body
+    return search_policies_op(body_bytes)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def get_policy_blame(request):
+    body_bytes = request.body
+    return get_policy_blame_op(body_bytes)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def compare_policy_versions(request):
+    body_bytes = request.body
+    return compare_policy_versions_op(body_bytes)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def upload_policy_pdf(request):
+    return upload_policy_pdf_op(request)
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    return metrics_op()